@@ -1,50 +1,167 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
 import streamlit as st
 import pandas as pd
-from io import BytesIO
+import matplotlib.pyplot as plt
 
-from receipt_analyzer.ocr import ocr_image_bytes
+from receipt_analyzer import ocr
 from receipt_analyzer.parser import parse_items_from_text
 from receipt_analyzer.categorizer import categorize_items
 from receipt_analyzer.analyzer import analyze_items
-from receipt_analyzer.llm import generate_advice
+from receipt_analyzer.llm import stream_advice
 
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+MAX_CACHED_RESULTS = 256
 
-st.set_page_config(page_title="Receipt Analyzer", layout="wide")
-st.title("AI-Powered Receipt Analyzer")
-st.write("Upload a receipt image to extract items, categorize, and get budgeting advice.")
 
-uploaded = st.file_uploader("Upload receipt image", type=["png", "jpg", "jpeg", "tiff"]) 
-if uploaded:
-    img_bytes = uploaded.read()
-    raw_text, _ = ocr_image_bytes(img_bytes)
+def _process_upload(img_bytes: bytes) -> dict:
+    """OCR, parsing and analysis for one upload; runs on the background executor.
+
+    The result is shared by every session that uploads the same image and
+    is never modified; advice is streamed into the page when a session first
+    shows it (see :func:`_render_advice`) and kept in that session's state.
+    """
+    raw_text = ocr.ocr_image(img_bytes).text
+    items = categorize_items(parse_items_from_text(raw_text))
+    analysis = analyze_items(items)
+    return {"text": raw_text, "items": items, "analysis": analysis, "advice": None if items else ""}
+
+
+class _ResultStore:
+    """Process-wide results by upload hash, shared by all sessions.
+
+    Each upload maps to a Future, so reruns reuse finished results and a
+    second session uploading the same image waits on the job already running
+    instead of starting another one.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, max_entries: int):
+        self._executor = executor
+        self._max_entries = max_entries
+        self._futures: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, digest: str, img_bytes: bytes) -> Future:
+        with self._lock:
+            fut = self._futures.get(digest)
+            if fut is not None and not (fut.done() and fut.exception() is not None):
+                self._futures.move_to_end(digest)
+                return fut
+            fut = self._executor.submit(_process_upload, img_bytes)
+            self._futures[digest] = fut
+            # evict the oldest finished results beyond the cap
+            for key in list(self._futures):
+                if len(self._futures) <= self._max_entries:
+                    break
+                if self._futures[key].done():
+                    del self._futures[key]
+            return fut
+
+
+@st.cache_resource
+def _ocr_engines() -> bool:
+    """Locate Tesseract and load the EasyOCR model once per server process.
+
+    Every worker may run EasyOCR at once (one reader each, created on first
+    use), so one session's OCR does not queue behind another's. Set
+    ``RECEIPT_EASYOCR_READERS`` lower to save memory.
+    """
+    if os.environ.get("RECEIPT_OCR_SERVER"):
+        return True  # OCR runs in the shared OCR service
+    os.environ.setdefault("RECEIPT_EASYOCR_READERS", str(MAX_WORKERS))
+    ocr._configure_tesseract()
+    ocr._get_easyocr_reader()
+    return True
+
+
+@st.cache_resource
+def _result_store() -> _ResultStore:
+    return _ResultStore(ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="receipt"),
+                        MAX_CACHED_RESULTS)
+
+
+def _render_advice(digest: str, result: dict):
+    advice = st.session_state.setdefault("advice", {})
+    if result["advice"] is None and digest not in advice:
+        # chunks are shown as they arrive; the full text is kept for this session's reruns
+        advice[digest] = st.write_stream(stream_advice(result["items"], result["analysis"]))
+    else:
+        st.write(advice.get(digest, result["advice"]))
+
+
+def _render_result(digest: str, result: dict):
     with st.expander("OCR Raw Text"):
-        st.text_area("Text", raw_text, height=200)
+        st.text_area("Text", result["text"], height=200)
 
-    items = parse_items_from_text(raw_text)
-    items = categorize_items(items)
+    items = result["items"]
     df = pd.DataFrame(items)
     if df.empty:
         st.warning("No items parsed from the receipt. Try a clearer image or different crop.")
-    else:
-        df_display = df.copy()
-        df_display["line_total"] = df_display["price"] * df_display["quantity"]
-        st.subheader("Parsed Items")
-        st.dataframe(df_display)
-
-        analysis = analyze_items(items)
-        st.subheader("Spending Summary")
-        st.write("Overall total: $", analysis.get("overall_total"))
-        cat_totals = analysis.get("category_totals", {})
-        st.write(cat_totals)
-
-        st.subheader("Category Breakdown")
-        if cat_totals:
-            fig = pd.Series(cat_totals).plot.pie(y='x', autopct='%1.1f%%', ylabel='')
-            st.pyplot(fig.figure)
-
-        st.subheader("AI Financial Advice")
-        advice = generate_advice(items, analysis)
-        st.write(advice)
-
-        st.subheader("Anomalies")
-        st.json(analysis.get("anomalies", {}))
+        return
+    df_display = df.copy()
+    df_display["line_total"] = df_display["price"] * df_display["quantity"]
+    st.subheader("Parsed Items")
+    st.dataframe(df_display)
+
+    analysis = result["analysis"]
+    st.subheader("Spending Summary")
+    st.write("Overall total: $", analysis.get("overall_total"))
+    cat_totals = analysis.get("category_totals", {})
+    st.write(cat_totals)
+
+    st.subheader("Category Breakdown")
+    if cat_totals:
+        fig, ax = plt.subplots()
+        pd.Series(cat_totals).plot.pie(ax=ax, autopct='%1.1f%%', ylabel='')
+        st.pyplot(fig)
+        plt.close(fig)
+
+    st.subheader("AI Financial Advice")
+    _render_advice(digest, result)
+
+    st.subheader("Anomalies")
+    st.json(analysis.get("anomalies", {}))
+
+
+st.set_page_config(page_title="Receipt Analyzer", layout="wide")
+st.title("AI-Powered Receipt Analyzer")
+st.write("Upload receipt images to extract items, categorize, and get budgeting advice.")
+
+uploads = st.file_uploader("Upload receipt images", type=["png", "jpg", "jpeg", "tiff"],
+                           accept_multiple_files=True)
+if uploads:
+    _ocr_engines()
+    store = _result_store()
+    progress = st.progress(0.0, text="Processing receipts...")
+    totals_placeholder = st.empty()
+    # one slot per upload, in upload order, filled as its result completes
+    slots = {}
+    for up in uploads:
+        img_bytes = up.getvalue()
+        digest = hashlib.sha256(img_bytes).hexdigest()
+        slot = st.container()
+        slot.header(up.name)
+        slots.setdefault(store.submit(digest, img_bytes), []).append((up.name, digest, slot))
+
+    merged = {}
+    n_done = 0
+    for fut in as_completed(slots):
+        for name, digest, slot in slots[fut]:
+            n_done += 1
+            progress.progress(n_done / len(uploads), text=f"Processed {n_done}/{len(uploads)}: {name}")
+            with slot:
+                if fut.exception() is not None:
+                    st.error(f"Could not process {name}: {fut.exception()}")
+                    continue
+                _render_result(digest, dict(fut.result()))
+            for cat, total in fut.result()["analysis"].get("category_totals", {}).items():
+                merged[cat] = round(merged.get(cat, 0.0) + total, 2)
+        if merged:
+            with totals_placeholder.container():
+                st.subheader("Combined Category Totals")
+                st.bar_chart(pd.Series(merged, name="total"))
+    progress.empty()
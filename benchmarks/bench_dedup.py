@@ -0,0 +1,141 @@
+"""Near-duplicate index benchmark: lookup latency at scale and hashing cost.
+
+    python benchmarks/bench_dedup.py --size 1000000 --queries 2000 [--pairs 600] [--json out.json]
+
+Fills a :class:`dedup.HashIndex` with random 64-bit hashes, then times
+lookups of stored hashes with 0..max_distance random bit flips (hits) and
+of fresh random hashes (misses), checking a sample against brute force.
+Also times :func:`dedup.image_hash` on synthetic receipts.
+
+With ``--pairs N``, fingerprints N distinct synthetic receipts and
+reports the share of distinct pairs within ``max_distance`` bits before
+and after thumbnail verification (false positives), and how many
+re-encoded, resized or padded copies still verify (recall).
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth import SynthConfig, make_corpus  # noqa: E402
+from bench_pipeline import _percentile  # noqa: E402
+
+
+def _flip(rng: random.Random, h: int, n: int) -> int:
+    for b in rng.sample(range(64), n):
+        h ^= 1 << b
+    return h
+
+
+def _latency(fn, queries):
+    lat = []
+    for q in queries:
+        t = time.perf_counter()
+        fn(q)
+        lat.append(time.perf_counter() - t)
+    lat.sort()
+    return {"p50_us": round(_percentile(lat, 0.5) * 1e6, 1), "p99_us": round(_percentile(lat, 0.99) * 1e6, 1),
+            "mean_us": round(statistics.fmean(lat) * 1e6, 1)}
+
+
+def _copies(data: bytes):
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=40)
+    padded = Image.new("L", (img.width + 40, img.height + 60), 255)
+    padded.paste(img.convert("L"), (20, 30))
+    return [buf.getvalue(), img.resize((img.width * 3 // 5, img.height * 3 // 5)), padded]
+
+
+def false_positives(n: int, max_distance: int, seed: int) -> dict:
+    from receipt_analyzer.dedup import MIN_SIMILARITY, fingerprint, hamming, similarity
+
+    corpus = make_corpus(n, SynthConfig(min_items=3, max_items=12, scale=2.0), seed)
+    fps = [fingerprint(data) for data, _, _ in corpus]
+    close = [(a, b) for i, a in enumerate(fps) for b in fps[i + 1:] if hamming(a[0], b[0]) <= max_distance]
+    verified = sum(similarity(a[1], b[1]) >= MIN_SIMILARITY for a, b in close)
+    copies = [(fp, fingerprint(c)) for fp, (data, _, _) in zip(fps[:50], corpus) for c in _copies(data)]
+    pairs = n * (n - 1) // 2
+    return {"pairs": pairs, "hash_matches": len(close), "hash_fp_rate": len(close) / pairs,
+            "verified_matches": verified, "verified_fp_rate": verified / pairs,
+            "copies": len(copies),
+            "copies_found": sum(hamming(a[0], b[0]) <= max_distance and similarity(a[1], b[1]) >= MIN_SIMILARITY
+                                for a, b in copies)}
+
+
+def main(argv=None):
+    import numpy as np
+    from PIL import Image
+    from receipt_analyzer.dedup import HashIndex, _popcount, image_hash
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--size", type=int, default=1_000_000, help="stored hashes")
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--max-distance", type=int, default=6)
+    ap.add_argument("--chunks", type=int, default=5)
+    ap.add_argument("--images", type=int, default=20, help="synthetic receipts to hash")
+    ap.add_argument("--pairs", type=int, default=0, metavar="N",
+                    help="measure false positives among N distinct synthetic receipts")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    index = HashIndex(args.max_distance, args.chunks)
+    t = time.perf_counter()
+    index.extend(rng.getrandbits(64) for _ in range(args.size))
+    results = {"size": args.size, "build_s": round(time.perf_counter() - t, 2)}
+
+    hits = [_flip(rng, index.hashes[rng.randrange(args.size)], rng.randint(0, args.max_distance))
+            for _ in range(args.queries)]
+    misses = [rng.getrandbits(64) for _ in range(args.queries)]
+    results["hit"] = _latency(index.nearest, hits)
+    results["miss"] = _latency(index.nearest, misses)
+    assert all(index.nearest(q) is not None for q in hits[:200])
+
+    stored = np.frombuffer(index.hashes, dtype=np.uint64)
+    for q in hits[:20] + misses[:20]:
+        dist = _popcount(stored ^ np.uint64(q))
+        want = sorted(zip(np.flatnonzero(dist <= args.max_distance).tolist(),
+                          dist[dist <= args.max_distance].tolist()), key=lambda kv: (kv[1], kv[0]))
+        assert index.search(q) == want, "index disagrees with brute force"
+    t = time.perf_counter()
+    for q in misses[:20]:
+        _popcount(stored ^ np.uint64(q))
+    results["brute_force_us"] = round((time.perf_counter() - t) / 20 * 1e6, 1)
+
+    corpus = make_corpus(args.images, SynthConfig(scale=3.0), args.seed)
+    t = time.perf_counter()
+    for data, _, _ in corpus:
+        image_hash(data)
+    size = Image.open(io.BytesIO(corpus[0][0])).size
+    results["image_hash_ms"] = round((time.perf_counter() - t) / len(corpus) * 1000, 2)
+
+    print(f"index of {args.size} hashes built in {results['build_s']}s")
+    for kind in ("hit", "miss"):
+        r = results[kind]
+        print(f"lookup ({kind:4s})  p50 {r['p50_us']:8.1f} us  p99 {r['p99_us']:8.1f} us")
+    print(f"brute force scan      {results['brute_force_us']:8.1f} us")
+    print(f"image_hash {size[0]}x{size[1]} JPEG  {results['image_hash_ms']:6.2f} ms")
+    if args.pairs:
+        fp = results["false_positives"] = false_positives(args.pairs, args.max_distance, args.seed)
+        print(f"distinct pairs within {args.max_distance} bits: {fp['hash_matches']} of {fp['pairs']} "
+              f"({fp['hash_fp_rate']:.1e}), after verification {fp['verified_matches']} "
+              f"({fp['verified_fp_rate']:.1e}); copies found {fp['copies_found']}/{fp['copies']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Cold-start benchmark: wall time of fresh interpreters importing the package.
+
+Each scenario runs in a new ``python`` process (so nothing is cached in
+``sys.modules``) and reports min/median wall time over ``--repeat`` runs,
+minus the bare interpreter startup, plus which heavy backends got loaded.
+
+    python benchmarks/bench_import.py --repeat 10 [--json out.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("numpy", "cv2", "PIL", "pytesseract", "easyocr", "torch")
+
+SCENARIOS = {
+    "python": "pass",
+    "import package": "import receipt_analyzer",
+    "parser only": "from receipt_analyzer import parse_items_from_text; parse_items_from_text('Milk 3.50')",
+    "analyze only": "from receipt_analyzer import analyze_items; analyze_items([])",
+    "import ocr module": "import receipt_analyzer.ocr",
+    "ocr backends": "from receipt_analyzer import ocr; ocr._has_cv2(); ocr._has_easyocr(); ocr._configure_tesseract()",
+}
+
+
+def _run(code: str) -> float:
+    probe = f"{code}\nimport sys; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", probe], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout
+    return time.perf_counter() - start, out.strip().splitlines()[-1] if out.strip() else ""
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        runs = [_run(code) for _ in range(args.repeat)]
+        times = [t for t, _ in runs]
+        results[name] = {"min_ms": round(min(times) * 1000, 1),
+                         "median_ms": round(statistics.median(times) * 1000, 1),
+                         "loaded": runs[-1][1]}
+    base = results["python"]["median_ms"]
+    for name, r in results.items():
+        r["over_python_ms"] = round(r["median_ms"] - base, 1)
+        print(f"{name:20s} median {r['median_ms']:8.1f} ms  (+{r['over_python_ms']:7.1f})  loaded: {r['loaded'] or '-'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
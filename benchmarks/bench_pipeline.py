@@ -0,0 +1,176 @@
+"""Per-stage pipeline benchmark on a synthetic receipt corpus (offline, CPU only).
+
+Times each stage in isolation (preprocess, OCR, parse, categorize, analyze,
+heuristic advice) and reports latency percentiles, items/sec and peak
+traced memory. Results are written as JSON and can be compared against an
+earlier run:
+
+    python benchmarks/bench_pipeline.py --count 30 --json base.json
+    python benchmarks/bench_pipeline.py --count 30 --json new.json --compare base.json
+
+The OCR stage only runs when an engine (EasyOCR or the tesseract binary) is
+available, or is skipped with ``--no-ocr``.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth import SynthConfig, make_corpus  # noqa: E402
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def run_stage(fn: Callable, inputs: List, item_counts: List[int], repeat: int, memory: bool) -> Dict:
+    """Call ``fn`` on every input ``repeat`` times; then once more under tracemalloc for peak memory."""
+    latencies = []
+    for _ in range(repeat):
+        for x in inputs:
+            t = time.perf_counter()
+            fn(x)
+            latencies.append(time.perf_counter() - t)
+    lat = sorted(latencies)
+    total = sum(lat)
+    stats = {
+        "calls": len(lat),
+        "p50_ms": round(_percentile(lat, 0.50) * 1000, 3),
+        "p90_ms": round(_percentile(lat, 0.90) * 1000, 3),
+        "p99_ms": round(_percentile(lat, 0.99) * 1000, 3),
+        "mean_ms": round(total / len(lat) * 1000, 3) if lat else 0.0,
+        "items_per_sec": round(sum(item_counts) * repeat / total, 1) if total else 0.0,
+    }
+    if memory:
+        tracemalloc.start()
+        for x in inputs:
+            fn(x)
+        stats["peak_mem_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return stats
+
+
+def _ocr_available() -> bool:
+    from receipt_analyzer import ocr
+    if ocr._has_easyocr():
+        return True
+    try:
+        ocr._tesseract_engine().version()
+        return True
+    except Exception:
+        return False
+
+
+def benchmark(args) -> Dict:
+    from receipt_analyzer import ocr
+    from receipt_analyzer.parser import parse_items_from_text
+    from receipt_analyzer.categorizer import categorize_items
+    from receipt_analyzer.analyzer import analyze_items
+    from receipt_analyzer.llm import generate_advice
+
+    os.environ.pop("OPENAI_API_KEY", None)  # heuristic advice only: no network
+    cfg = SynthConfig(args.items[0], args.items[1], args.width, args.font_size, args.font,
+                      args.noise, args.skew, args.scale)
+    corpus = make_corpus(args.count, cfg, args.seed)
+    images = [c[0] for c in corpus]
+    texts = [c[2] for c in corpus]
+    counts = [len(c[1]) for c in corpus]
+
+    parsed = [parse_items_from_text(t) for t in texts]
+    categorized = [categorize_items(copy.deepcopy(p)) for p in parsed]
+    analyses = [analyze_items(c) for c in categorized]
+    recovered = sum(len(p) for p in parsed) / max(1, sum(counts))
+
+    stages = {}
+    stages["preprocess"] = run_stage(lambda b: ocr.preprocess_image_bytes(b, args.preset), images, counts,
+                                     args.repeat, args.memory)
+    if args.ocr and _ocr_available():
+        stages["ocr"] = run_stage(lambda b: ocr.ocr_image(b, preset=args.preset, cascade=args.cascade),
+                                  images, counts, 1, args.memory)
+    stages["parse"] = run_stage(parse_items_from_text, texts, counts, args.repeat, args.memory)
+    stages["categorize"] = run_stage(lambda p: categorize_items([dict(i) for i in p]), parsed, counts,
+                                     args.repeat, args.memory)
+    stages["analyze"] = run_stage(analyze_items, categorized, counts, args.repeat, args.memory)
+    stages["advice"] = run_stage(lambda i: generate_advice(categorized[i], analyses[i]), list(range(len(corpus))),
+                                 counts, args.repeat, args.memory)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "preset": args.preset,
+            "cascade": args.cascade,
+            "corpus": {"count": args.count, "items": list(args.items), "width": args.width,
+                       "scale": args.scale, "noise": args.noise, "skew": args.skew, "seed": args.seed},
+            "parse_recall": round(recovered, 3),
+        },
+        "stages": stages,
+    }
+
+
+def compare(new: Dict, old: Dict, threshold: float) -> List[str]:
+    """Print p50/items-per-sec deltas; return the stages whose p50 regressed beyond ``threshold``."""
+    regressions = []
+    for stage, s in new["stages"].items():
+        o = old.get("stages", {}).get(stage)
+        if not o or not o.get("p50_ms"):
+            continue
+        delta = (s["p50_ms"] - o["p50_ms"]) / o["p50_ms"]
+        flag = ""
+        if delta > threshold:
+            flag = "  REGRESSION"
+            regressions.append(stage)
+        print(f"{stage:12s} p50 {o['p50_ms']:9.3f} -> {s['p50_ms']:9.3f} ms ({delta:+.1%}){flag}")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-stage receipt pipeline benchmark")
+    ap.add_argument("--count", type=int, default=20, help="synthetic receipts")
+    ap.add_argument("--items", type=int, nargs=2, default=(5, 30), metavar=("MIN", "MAX"))
+    ap.add_argument("--width", type=int, default=640)
+    ap.add_argument("--font-size", type=int, default=22)
+    ap.add_argument("--font", help="TrueType font file")
+    ap.add_argument("--noise", type=float, default=6.0)
+    ap.add_argument("--skew", type=float, default=1.5)
+    ap.add_argument("--scale", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--preset", default="balanced", help="preprocessing preset")
+    ap.add_argument("--cascade", action="store_true", help="OCR with the confidence-driven engine cascade")
+    ap.add_argument("--repeat", type=int, default=3, help="repetitions of the cheap stages")
+    ap.add_argument("--no-ocr", dest="ocr", action="store_false", help="skip the OCR stage")
+    ap.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    ap.add_argument("--json", help="write results to this file")
+    ap.add_argument("--compare", help="earlier results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown counted as a regression")
+    args = ap.parse_args(argv)
+
+    results = benchmark(args)
+    for stage, s in results["stages"].items():
+        mem = f"  peak {s['peak_mem_kb']:9.1f} KiB" if "peak_mem_kb" in s else ""
+        print(f"{stage:12s} p50 {s['p50_ms']:9.3f}  p90 {s['p90_ms']:9.3f}  p99 {s['p99_ms']:9.3f} ms"
+              f"  {s['items_per_sec']:12.1f} items/s{mem}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(results, json.load(f), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Fuzzy product dictionary benchmark: build time, lookup latency and accuracy.
+
+    python benchmarks/bench_products.py --size 100000 --queries 5000 [--json out.json]
+
+Builds a :class:`products.ProductDictionary` of synthetic product names
+(brand + descriptor + product + size), then looks up names corrupted the
+way OCR corrupts them: look-alike characters (O/0, I/1, S/5, B/8, ...)
+plus random deletions, insertions and substitutions. Reports p50/p99
+latency of uncached lookups for clean names, look-alike-only noise (the
+exact-match fast path) and edit noise, the top-1 accuracy, and the
+throughput of ``best_many`` on receipt-like batches with repeated names.
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_pipeline import _percentile  # noqa: E402
+
+BRANDS = ["acme", "golden", "farmhouse", "nordic", "sunny", "royal", "green valley", "blue ridge", "urban",
+          "heritage", "prime", "happy", "wild", "coastal", "alpine", "harvest", "metro", "classic"]
+DESCRIPTORS = ["organic", "light", "extra", "smoked", "salted", "unsalted", "whole", "skimmed", "spicy",
+               "sweet", "fresh", "frozen", "roasted", "crunchy", "mild", "mature", "free range", "low fat"]
+PRODUCTS = ["milk", "bread", "eggs", "cheddar", "butter", "yogurt", "chips", "cookies", "crackers",
+            "chocolate", "water", "cola", "orange juice", "coffee", "green tea", "banana", "apple", "tomato",
+            "potato", "lettuce", "chicken breast", "beef mince", "pork sausage", "ribeye steak", "bagel",
+            "croissant", "cough syrup", "vitamin c", "dish soap", "paper towels", "rice", "olive oil", "pasta"]
+CATEGORIES = ["groceries", "snacks", "beverages", "produce", "meat", "bakery", "pharmacy", "household"]
+LOOKALIKES = {"o": "0", "i": "1", "l": "1", "s": "5", "b": "8", "t": "7", "e": "3", "g": "9", "m": "rn"}
+
+
+def _word(rng: random.Random) -> str:
+    syllables = ["ka", "lo", "mi", "ra", "ten", "vo", "sun", "bel", "dor", "fi", "gra", "nu", "pe", "qui",
+                 "sta", "tri", "ve", "zo", "mar", "lin", "ko", "bra", "den", "sal", "ro", "ti"]
+    return "".join(rng.choices(syllables, k=rng.randint(2, 3)))
+
+
+def make_names(n: int, rng: random.Random, brands: int = 2000):
+    """Unique names: brand + descriptor + product + size; ``brands=0`` uses the small fixed brand list."""
+    brand_list = sorted({_word(rng) for _ in range(brands)}) if brands else BRANDS
+    names = set()
+    while len(names) < n:
+        names.add(f"{rng.choice(brand_list)} {rng.choice(DESCRIPTORS)} {rng.choice(PRODUCTS)} "
+                  f"{rng.choice([100, 200, 250, 330, 500, 750, 1000, 1500])}{rng.choice(['g', 'ml', 'pk'])}")
+    return sorted(names)
+
+
+def lookalike(name: str, rng: random.Random, rate: float = 0.3) -> str:
+    return "".join(LOOKALIKES[c] if c in LOOKALIKES and rng.random() < rate else c for c in name).upper()
+
+
+def edits(name: str, rng: random.Random, n: int) -> str:
+    s = list(name)
+    for _ in range(n):
+        op, i = rng.randrange(3), rng.randrange(len(s))
+        if op == 0:
+            del s[i]
+        elif op == 1:
+            s.insert(i, rng.choice(string.ascii_lowercase))
+        else:
+            s[i] = rng.choice(string.ascii_lowercase)
+    return "".join(s)
+
+
+def _timed(fn, queries):
+    lat, out = [], []
+    for q in queries:
+        t = time.perf_counter()
+        out.append(fn(q))
+        lat.append(time.perf_counter() - t)
+    lat.sort()
+    return out, {"p50_us": round(_percentile(lat, 0.5) * 1e6, 1), "p99_us": round(_percentile(lat, 0.99) * 1e6, 1)}
+
+
+def main(argv=None):
+    from receipt_analyzer.products import ProductDictionary
+
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--size", type=int, default=100_000)
+    ap.add_argument("--queries", type=int, default=5000)
+    ap.add_argument("--brands", type=int, default=2000,
+                    help="distinct brand words (0: 18 fixed brands, a worst case for trigram filtering)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    names = make_names(args.size, rng, args.brands)
+    t = time.perf_counter()
+    pd = ProductDictionary(((n, rng.choice(CATEGORIES), ()) for n in names), cache_size=0)
+    results = {"size": args.size, "build_s": round(time.perf_counter() - t, 2)}
+
+    truth = [rng.randrange(len(names)) for _ in range(args.queries)]
+    sets = {
+        "clean": [names[i] for i in truth],
+        "lookalike": [lookalike(names[i], rng) for i in truth],
+        "edits": [lookalike(edits(names[i], rng, rng.randint(1, 3)), rng) for i in truth],
+    }
+    for kind, queries in sets.items():
+        out, stats = _timed(lambda q: pd.lookup(q), queries)
+        stats["top1_accuracy"] = round(sum(bool(m) and m[0].name == names[i] for m, i in zip(out, truth))
+                                       / len(truth), 4)
+        stats["no_match"] = sum(not m for m in out)
+        results[kind] = stats
+        print(f"{kind:10s} p50 {stats['p50_us']:8.1f} us  p99 {stats['p99_us']:8.1f} us  "
+              f"top-1 {stats['top1_accuracy']:.2%}  unmatched {stats['no_match']}")
+
+    # bulk: receipts of 20 items drawn from a small "store catalogue", noisy OCR spellings
+    pd.cache_size = 100_000
+    catalogue = rng.sample(range(len(names)), 500)
+    batch = [lookalike(edits(names[i], rng, rng.randint(0, 1)), rng, 0.1)
+             for i in (rng.choice(catalogue) for _ in range(20 * 1000))]
+    t = time.perf_counter()
+    pd.best_many(batch)
+    elapsed = time.perf_counter() - t
+    results["bulk_items_per_sec"] = round(len(batch) / elapsed)
+    print(f"best_many  {len(batch)} items in {elapsed:.2f}s ({results['bulk_items_per_sec']} items/s)")
+    print(f"build      {results['build_s']}s for {args.size} products")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
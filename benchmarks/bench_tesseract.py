@@ -0,0 +1,90 @@
+"""Per-call latency of the Tesseract backends on synthetic receipts.
+
+    python benchmarks/bench_tesseract.py --count 10 --repeat 3 --threads 1 4
+
+Compares the pytesseract path (subprocess + temp file per call) with the
+pooled in-process tesserocr backend, for plain text and for word boxes
+(``detail``), sequentially and from several threads at once. Backends that
+are not installed are reported and skipped.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synth import SynthConfig, make_corpus  # noqa: E402
+from bench_pipeline import _percentile  # noqa: E402
+
+
+def _time_calls(engine, images: List, detail: bool, repeat: int, threads: int) -> Dict:
+    def one(img):
+        t = time.perf_counter()
+        engine.read(img, detail)
+        return time.perf_counter() - t
+
+    engine.read(images[0], detail)  # warm up (first tesserocr handle, page cache)
+    work = images * repeat
+    start = time.perf_counter()
+    if threads == 1:
+        lat = [one(img) for img in work]
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            lat = list(pool.map(one, work))
+    wall = time.perf_counter() - start
+    lat.sort()
+    return {
+        "calls": len(lat),
+        "p50_ms": round(_percentile(lat, 0.5) * 1000, 2),
+        "p90_ms": round(_percentile(lat, 0.9) * 1000, 2),
+        "mean_ms": round(statistics.fmean(lat) * 1000, 2),
+        "calls_per_sec": round(len(lat) / wall, 2),
+    }
+
+
+def main(argv=None):
+    from receipt_analyzer import ocr
+
+    ap = argparse.ArgumentParser(description="Tesseract backend latency benchmark")
+    ap.add_argument("--count", type=int, default=10, help="synthetic receipts")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    ap.add_argument("--preset", default="balanced")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", help="write results to this file")
+    args = ap.parse_args(argv)
+
+    corpus = make_corpus(args.count, SynthConfig(), args.seed)
+    images = [ocr._as_pil(ocr.preprocess_image_bytes(c[0], args.preset)) for c in corpus]
+    results = {}
+    for backend in ("pytesseract", "tesserocr"):
+        try:
+            engine = ocr.make_tesseract_engine(backend, pool_size=max(args.threads))
+            engine.version()
+        except Exception as e:
+            print(f"{backend:12s} unavailable: {e}", file=sys.stderr)
+            continue
+        for threads in args.threads:
+            for detail in (False, True):
+                label = f"{backend}/{'data' if detail else 'text'}/t{threads}"
+                s = results[label] = _time_calls(engine, images, detail, args.repeat, threads)
+                print(f"{label:28s} p50 {s['p50_ms']:8.2f}  p90 {s['p90_ms']:8.2f} ms"
+                      f"  {s['calls_per_sec']:8.2f} calls/s")
+        engine.close()
+    for label, s in results.items():
+        base = results.get(label.replace("tesserocr/", "pytesseract/"))
+        if label.startswith("tesserocr/") and base:
+            print(f"{label:28s} {base['p50_ms'] / s['p50_ms']:.2f}x faster p50 than pytesseract")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
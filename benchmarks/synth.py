@@ -0,0 +1,127 @@
+"""Synthetic receipt generator: PIL-rendered images with ground-truth items.
+
+    python benchmarks/synth.py out_dir --count 50 --items 5 40 --noise 8 --skew 2
+
+writes ``receipt_NNNN.jpg`` plus ``ground_truth.jsonl`` (one record per
+image with its items and the exact text that was rendered).
+"""
+import argparse
+import io
+import json
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+PRODUCTS = [
+    "Whole Milk", "Brown Bread", "Free Range Eggs", "Cheddar Cheese", "Salted Butter", "Greek Yogurt",
+    "Potato Chips", "Choc Cookie", "Cream Cracker", "Dark Chocolate", "Mineral Water", "Orange Juice",
+    "Ground Coffee", "Green Tea", "Cola Soda", "Banana", "Red Apple", "Tomato", "Lettuce", "Potato",
+    "Chicken Breast", "Beef Mince", "Pork Sausage", "Ribeye Steak", "Bagel", "Croissant", "Pastry",
+    "Cough Syrup", "Vitamin Capsule", "Dish Soap", "Paper Towels", "Rice", "Olive Oil", "Pasta",
+]
+
+
+@dataclass
+class SynthConfig:
+    min_items: int = 5
+    max_items: int = 30
+    width: int = 640
+    font_size: int = 22
+    font_path: Optional[str] = None
+    noise: float = 6.0      # std-dev of additive Gaussian pixel noise
+    skew: float = 1.5       # max rotation in degrees
+    scale: float = 1.0      # final resize factor (e.g. 3.0 for phone-photo sized images)
+    fmt: str = "JPEG"
+
+
+def _font(cfg: SynthConfig):
+    if cfg.font_path:
+        return ImageFont.truetype(cfg.font_path, cfg.font_size)
+    try:
+        return ImageFont.load_default(size=cfg.font_size)
+    except TypeError:  # Pillow < 10.1 has a fixed-size bitmap default font
+        return ImageFont.load_default()
+
+
+def make_items(rng: random.Random, n: int) -> List[Dict]:
+    items = []
+    for name in rng.sample(PRODUCTS, min(n, len(PRODUCTS))) + \
+            [rng.choice(PRODUCTS) for _ in range(max(0, n - len(PRODUCTS)))]:
+        qty = rng.choice([1, 1, 1, 2, 3])
+        price = round(rng.uniform(0.5, 60.0), 2)
+        items.append({"name": name, "quantity": qty, "price": price, "line_total": round(price * qty, 2)})
+    return items
+
+
+def receipt_text(items: List[Dict]) -> str:
+    lines = ["SUPERMART", ""]
+    for it in items:
+        lines.append(f"{it['name']}  {it['quantity']}  {it['price']:.2f}  {it['line_total']:.2f}")
+    lines += ["", f"TOTAL {sum(i['line_total'] for i in items):.2f}", "THANK YOU"]
+    return "\n".join(lines)
+
+
+def render(text: str, cfg: SynthConfig, rng: random.Random) -> bytes:
+    font = _font(cfg)
+    line_h = int(cfg.font_size * 1.5)
+    lines = text.splitlines()
+    img = Image.new("L", (cfg.width, line_h * (len(lines) + 2)), 255)
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((20, line_h * (i + 1)), line, fill=0, font=font)
+    if cfg.skew:
+        img = img.rotate(rng.uniform(-cfg.skew, cfg.skew), expand=True, fillcolor=255, resample=Image.BILINEAR)
+    if cfg.scale != 1.0:
+        img = img.resize((int(img.width * cfg.scale), int(img.height * cfg.scale)), Image.BILINEAR)
+    if cfg.noise:
+        import numpy as np
+        arr = np.asarray(img, dtype=np.float32)
+        arr = arr + np.random.default_rng(rng.randrange(2 ** 32)).normal(0, cfg.noise, arr.shape)
+        img = Image.fromarray(arr.clip(0, 255).astype(np.uint8))
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, cfg.fmt, **({"quality": 85} if cfg.fmt == "JPEG" else {}))
+    return buf.getvalue()
+
+
+def make_receipt(rng: random.Random, cfg: SynthConfig) -> Tuple[bytes, List[Dict], str]:
+    """One synthetic receipt: ``(image_bytes, ground_truth_items, rendered_text)``."""
+    items = make_items(rng, rng.randint(cfg.min_items, cfg.max_items))
+    text = receipt_text(items)
+    return render(text, cfg, rng), items, text
+
+
+def make_corpus(count: int, cfg: SynthConfig, seed: int = 0) -> List[Tuple[bytes, List[Dict], str]]:
+    rng = random.Random(seed)
+    return [make_receipt(rng, cfg) for _ in range(count)]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate synthetic receipt images with ground truth")
+    ap.add_argument("out_dir")
+    ap.add_argument("--count", type=int, default=20)
+    ap.add_argument("--items", type=int, nargs=2, default=(5, 30), metavar=("MIN", "MAX"))
+    ap.add_argument("--width", type=int, default=640)
+    ap.add_argument("--font-size", type=int, default=22)
+    ap.add_argument("--font", help="TrueType font file (default: PIL's built-in font)")
+    ap.add_argument("--noise", type=float, default=6.0)
+    ap.add_argument("--skew", type=float, default=1.5)
+    ap.add_argument("--scale", type=float, default=1.0)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    cfg = SynthConfig(args.items[0], args.items[1], args.width, args.font_size, args.font,
+                      args.noise, args.skew, args.scale)
+    os.makedirs(args.out_dir, exist_ok=True)
+    with open(os.path.join(args.out_dir, "ground_truth.jsonl"), "w", encoding="utf-8") as gt:
+        for n, (img, items, text) in enumerate(make_corpus(args.count, cfg, args.seed)):
+            name = f"receipt_{n:04d}.jpg"
+            with open(os.path.join(args.out_dir, name), "wb") as f:
+                f.write(img)
+            gt.write(json.dumps({"file": name, "items": items, "text": text}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
+import argparse
+import json
+import os
+import sys
 from pathlib import Path
 from receipt_analyzer.ocr import ocr_image_bytes
 from receipt_analyzer.parser import parse_items_from_text
 from receipt_analyzer.categorizer import categorize_items
 from receipt_analyzer.analyzer import analyze_items
 from receipt_analyzer.llm import generate_advice
+from receipt_analyzer.batch import analyze_file, iter_input_files, run_batch
+from receipt_analyzer import metrics
+from receipt_analyzer.storage import ReceiptStore
 
 
 def process_file(p: Path):
     print("== Processing", p.name)
-    b = p.read_bytes()
-    text, data = ocr_image_bytes(b)
+    text, data = ocr_image_bytes(p)
     print("--- Raw OCR text ---")
     print(text)
     items = parse_items_from_text(text)
@@ -28,7 +34,7 @@ def process_file(p: Path):
     print("\n")
 
 
-def main():
+def process_samples():
     p = Path(__file__).parent / "receipt_analyzer" / "samples"
     if not p.exists():
         print("No samples folder found at", p)
@@ -42,5 +48,156 @@ def main():
             process_file(f)
 
 
+def _load_stats(path):
+    if not path:
+        return None
+    from receipt_analyzer.stats import SpendStats
+    return SpendStats.load(path) if os.path.exists(path) else SpendStats()
+
+
+def run_pipeline(args):
+    """Streaming mode: staged pipeline over a watched folder, a manifest or the inputs."""
+    from receipt_analyzer.pipeline import Checkpoint, Pipeline, PipelineConfig, read_manifest, watch_folder
+
+    history = _load_stats(args.stats)
+    config = PipelineConfig(advice_workers=args.advice_threads, queue_size=args.queue_size,
+                            advice=not args.no_advice, history=history, user=args.user)
+    if args.workers:
+        config.ocr_workers = args.workers
+    checkpoint = Checkpoint(args.checkpoint) if args.checkpoint else None
+    out = open(args.output, "a" if checkpoint else "w", encoding="utf-8") if args.output else sys.stdout
+    store = ReceiptStore(args.db) if args.db else None
+    pipeline = Pipeline(config, checkpoint, on_record=(lambda r: store.add_receipts([r])) if store else None)
+    manifest = None
+    if args.watch:
+        source = watch_folder(args.watch, pipeline.stopping)
+    elif args.manifest:
+        manifest = sys.stdin if args.manifest == "-" else open(args.manifest, encoding="utf-8")
+        source = read_manifest(manifest)
+    else:
+        source = iter_input_files(args.inputs)
+    try:
+        summary = pipeline.run(source, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if manifest not in (None, sys.stdin):
+            manifest.close()
+        if checkpoint is not None:
+            checkpoint.close()
+        if store is not None:
+            store.close()
+        if history is not None:
+            history.save(args.stats)
+        if args.metrics:
+            metrics.write(args.metrics)
+    print(f"Processed {summary['files']} files in {summary['seconds']}s "
+          f"({summary['files_per_sec']} files/s, {summary['errors']} errors, "
+          f"{summary['skipped']} already done{', interrupted' if summary['interrupted'] else ''})",
+          file=sys.stderr)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Analyze receipt images. With no inputs, "
+                                             "prints a verbose report for the bundled samples.")
+    ap.add_argument("inputs", nargs="*", help="image files, directories or glob patterns")
+    ap.add_argument("-o", "--output", help="JSON Lines output file (default: stdout)")
+    ap.add_argument("--workers", type=int, default=None, help="OCR worker processes (default: CPU count)")
+    ap.add_argument("--advice-threads", type=int, default=8, help="concurrent advice requests")
+    ap.add_argument("--no-advice", action="store_true", help="skip advice generation")
+    ap.add_argument("--db", help="also store results in this SQLite receipt history")
+    ap.add_argument("--metrics", metavar="FILE",
+                    help="record per-stage timings and counters; write them to FILE "
+                         "(Prometheus text for .prom/.txt, JSON otherwise)")
+    ap.add_argument("--dedup-index", metavar="FILE",
+                    help="skip OCR for near-duplicates of images in this perceptual-hash index "
+                         "(.npz, created if missing and updated with new images)")
+    ap.add_argument("--dedup-distance", type=int, default=6,
+                    help="max Hamming distance (of 64 bits) for a near-duplicate")
+    ap.add_argument("--watch", metavar="DIR",
+                    help="run as a daemon: process images as they appear in DIR until SIGINT/SIGTERM")
+    ap.add_argument("--manifest", metavar="FILE",
+                    help="stream image paths from FILE, one per line ('-' for stdin)")
+    ap.add_argument("--checkpoint", metavar="FILE",
+                    help="record finished receipts in FILE and skip them when restarted")
+    ap.add_argument("--queue-size", type=int, default=8,
+                    help="jobs buffered in front of each pipeline stage (--watch/--manifest/--checkpoint)")
+    ap.add_argument("--stats", metavar="FILE",
+                    help="flag anomalies against the spend history in this JSON file "
+                         "(created if missing and updated with each receipt)")
+    ap.add_argument("--user", default="default", help="whose spend history the receipts belong to (--stats)")
+    ap.add_argument("--profile", metavar="FILE",
+                    help="run the first input in-process under cProfile and dump the stats to FILE")
+    args = ap.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+        # inherited by the worker processes regardless of start method
+        os.environ["RECEIPT_METRICS"] = "1"
+
+    if args.watch or args.manifest or args.checkpoint:
+        if args.dedup_index or args.profile:
+            ap.error("--dedup-index and --profile are not supported with --watch/--manifest/--checkpoint")
+        return run_pipeline(args)
+
+    if not args.inputs:
+        process_samples()
+        return
+
+    files = iter_input_files(args.inputs)
+    if not files:
+        print("No input images found", file=sys.stderr)
+        return
+    if args.profile:
+        with metrics.profile(args.profile):
+            record = analyze_file(str(files[0]))
+            if "error" not in record and not args.no_advice:
+                record["advice"] = generate_advice(record["items"], record["analysis"])
+        record.pop("_metrics", None)
+        print(json.dumps(record, ensure_ascii=False))
+        print(f"Profile written to {args.profile}", file=sys.stderr)
+        if args.metrics:
+            metrics.write(args.metrics)
+        return
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    store = ReceiptStore(args.db) if args.db else None
+    index = None
+    if args.dedup_index:
+        from receipt_analyzer.dedup import HashIndex
+        index = (HashIndex.load(args.dedup_index, args.dedup_distance) if os.path.exists(args.dedup_index)
+                 else HashIndex(args.dedup_distance))
+    history = _load_stats(args.stats)
+    pending = []
+
+    def on_record(record):
+        if "duplicate_of" in record:
+            return  # already in the history
+        pending.append(record)
+        if len(pending) >= 200:
+            store.add_receipts(pending)
+            pending.clear()
+
+    try:
+        summary = run_batch(files, out, workers=args.workers,
+                            advice_threads=args.advice_threads, advice=not args.no_advice,
+                            on_record=on_record if store else None, dedup=index, history=history,
+                            user=args.user)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.add_receipts(pending)
+            store.close()
+        if index is not None:
+            index.save(args.dedup_index)
+        if history is not None:
+            history.save(args.stats)
+        if args.metrics:
+            metrics.write(args.metrics)
+    print(f"Processed {summary['files']} files in {summary['seconds']}s "
+          f"({summary['files_per_sec']} files/s, {summary['errors']} errors"
+          + (f", {summary['duplicates']} duplicates" if index is not None else "") + ")", file=sys.stderr)
+
+
 if __name__ == '__main__':
     main()
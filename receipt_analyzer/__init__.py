@@ -1,14 +1,50 @@
-from .ocr import ocr_image_bytes, preprocess_image_bytes
-from .parser import parse_items_from_text
-from .categorizer import categorize_item
-from .analyzer import analyze_items
-from .llm import generate_advice
-
-__all__ = [
-    "ocr_image_bytes",
-    "preprocess_image",
-    "parse_items_from_text",
-    "categorize_item",
-    "analyze_items",
-    "generate_advice",
-]
+"""Receipt OCR, parsing, categorization, analysis and advice.
+
+Submodules are imported lazily on first attribute access, so e.g.
+``from receipt_analyzer import parse_items_from_text`` never loads the OCR
+backends (OpenCV, EasyOCR/torch, pytesseract).
+"""
+import importlib
+from typing import TYPE_CHECKING
+
+_EXPORTS = {
+    "ocr_image": "ocr",
+    "ocr_image_bytes": "ocr",
+    "preprocess_image": "ocr",
+    "preprocess_image_bytes": "ocr",
+    "OCRResult": "ocr",
+    "parse_items_from_text": "parser",
+    "iter_items": "parser",
+    "parse_receipt": "parser",
+    "Item": "models",
+    "Receipt": "models",
+    "ReceiptBatch": "models",
+    "categorize_item": "categorizer",
+    "ProductDictionary": "products",
+    "analyze_items": "analyzer",
+    "generate_advice": "llm",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .ocr import ocr_image, ocr_image_bytes, preprocess_image, preprocess_image_bytes, OCRResult
+    from .parser import iter_items, parse_items_from_text, parse_receipt
+    from .models import Item, Receipt, ReceiptBatch
+    from .categorizer import categorize_item
+    from .products import ProductDictionary
+    from .analyzer import analyze_items
+    from .llm import generate_advice
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,33 +1,58 @@
 from collections import defaultdict
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence
 
+from . import metrics
 
-def analyze_items(items: List[Dict]) -> Dict:
-    """Compute totals, percentages per category, and simple anomaly flags."""
+if TYPE_CHECKING:
+    from .stats import SpendStats
+
+OVERSPENT_PCT = 40.0
+EXPENSIVE_FACTOR = 2.5
+
+
+def _line_total(it: Dict) -> float:
+    # prefer explicit line_total if parser provided it
+    if it.get("line_total") is not None:
+        return float(it.get("line_total", 0.0))
+    return float(it.get("price", 0.0)) * max(1, it.get("quantity", 1))
+
+
+def analyze_items(items: List[Dict], history: Optional["SpendStats"] = None, user: str = "default",
+                  when=None) -> Dict:
+    """Compute totals, percentages per category, and simple anomaly flags.
+
+    With a :class:`stats.SpendStats` ``history``, anomalies are judged
+    against ``user``'s past receipts instead, and the receipt (dated
+    ``when``, default now) is then added to the history.
+    """
+    with metrics.timed("analyze"):
+        analysis = _analyze_items(items)
+        if history is not None:
+            analysis["anomalies"] = history.observe(items, analysis, user, when)
+        return analysis
+
+
+def _analyze_items(items: List[Dict]) -> Dict:
     totals = defaultdict(float)
     overall = 0.0
-    prices = []
+    line_totals = []
     for it in items:
-        # prefer explicit line_total if parser provided it
-        if it.get("line_total") is not None:
-            line_total = float(it.get("line_total", 0.0))
-        else:
-            line_total = float(it.get("price", 0.0)) * max(1, it.get("quantity", 1))
+        line_total = _line_total(it)
         totals[it.get("category", "other")] += line_total
         overall += line_total
-        prices.append(line_total)
+        line_totals.append(line_total)
 
     category_percent = {k: (v / overall * 100) if overall else 0.0 for k, v in totals.items()}
 
-    mean_price = sum(prices) / len(prices) if prices else 0.0
+    mean_price = overall / len(line_totals) if line_totals else 0.0
     anomalies = {"overspent_categories": [], "expensive_items": []}
     for cat, pct in category_percent.items():
-        if pct > 40.0:
+        if pct > OVERSPENT_PCT:
             anomalies["overspent_categories"].append({"category": cat, "pct": round(pct, 1)})
 
-    for it in items:
-        line_total = it.get("price", 0.0) * max(1, it.get("quantity", 1))
-        if mean_price and line_total > mean_price * 2.5:
+    for it, line_total in zip(items, line_totals):
+        if mean_price and line_total > mean_price * EXPENSIVE_FACTOR:
             anomalies["expensive_items"].append({"name": it.get("name"), "total": line_total})
 
     return {
@@ -36,3 +61,151 @@ def analyze_items(items: List[Dict]) -> Dict:
         "category_percent": {k: round(v, 1) for k, v in category_percent.items()},
         "anomalies": anomalies,
     }
+
+
+def columns_from_receipts(receipts: Iterable[List[Dict]], categories: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Flatten per-receipt item dicts into the columnar input of :func:`analyze_batch`.
+
+    Receipts are numbered in iteration order; ``categories`` is extended
+    with any category not already listed.
+    """
+    import numpy as np
+
+    categories = list(categories or [])
+    codes = {c: i for i, c in enumerate(categories)}
+    amounts, receipt_ids, category_codes, names = [], [], [], []
+    for rid, items in enumerate(receipts):
+        for it in items:
+            cat = it.get("category", "other")
+            code = codes.get(cat)
+            if code is None:
+                code = codes[cat] = len(categories)
+                categories.append(cat)
+            amounts.append(_line_total(it))
+            receipt_ids.append(rid)
+            category_codes.append(code)
+            names.append(it.get("name"))
+    return {
+        "amounts": np.asarray(amounts, dtype=np.float64),
+        "receipt_ids": np.asarray(receipt_ids, dtype=np.int64),
+        "category_codes": np.asarray(category_codes, dtype=np.int64),
+        "categories": categories,
+        "names": names,
+    }
+
+
+@dataclass
+class BatchAnalysis:
+    """Columnar result of :func:`analyze_batch`.
+
+    Row ``r`` of the per-receipt arrays belongs to ``receipt_ids[r]``
+    (receipts in order of first appearance); columns of the 2-D arrays
+    follow ``categories``. Per-item arrays follow the input order.
+    """
+    receipt_ids: Any
+    categories: List[str]
+    overall_totals: Any       # (R,)
+    item_counts: Any          # (R,)
+    category_totals: Any      # (R, C)
+    category_percent: Any     # (R, C)
+    category_present: Any     # (R, C) category occurs on the receipt
+    overspent: Any            # (R, C)
+    item_receipt: Any         # (N,) row index of each item's receipt
+    expensive: Any            # (N,)
+    amounts: Any              # (N,)
+    names: Optional[Sequence[str]]
+    _first_seen: Any          # (R, C) index of first item per receipt/category
+
+    def totals_by_category(self) -> Dict[str, float]:
+        """Batch-wide spend per category."""
+        sums = self.category_totals.sum(axis=0)
+        return {c: float(sums[i]) for i, c in enumerate(self.categories)}
+
+    def to_dicts(self) -> List[Dict]:
+        """Per-receipt dicts shaped exactly like :func:`analyze_items` output."""
+        import numpy as np
+
+        expensive_idx = np.flatnonzero(self.expensive)
+        by_receipt = defaultdict(list)
+        for i in expensive_idx:
+            by_receipt[int(self.item_receipt[i])].append(int(i))
+        out = []
+        for r in range(len(self.receipt_ids)):
+            cols = np.flatnonzero(self.category_present[r])
+            cols = cols[np.argsort(self._first_seen[r, cols], kind="stable")]
+            overall = float(self.overall_totals[r])
+            totals = {self.categories[c]: float(self.category_totals[r, c]) for c in cols}
+            pcts = {self.categories[c]: float(self.category_percent[r, c]) for c in cols}
+            anomalies = {
+                "overspent_categories": [{"category": self.categories[c], "pct": round(pcts[self.categories[c]], 1)}
+                                         for c in cols if self.overspent[r, c]],
+                "expensive_items": [{"name": self.names[i] if self.names is not None else None,
+                                     "total": float(self.amounts[i])} for i in by_receipt.get(r, [])],
+            }
+            out.append({
+                "overall_total": round(overall, 2),
+                "category_totals": {k: round(v, 2) for k, v in totals.items()},
+                "category_percent": {k: round(v, 1) for k, v in pcts.items()},
+                "anomalies": anomalies,
+            })
+        return out
+
+
+def analyze_batch(amounts, receipt_ids, category_codes, categories: Optional[List[str]] = None,
+                  names: Optional[Sequence[str]] = None) -> BatchAnalysis:
+    """Vectorized :func:`analyze_items` over many receipts at once.
+
+    Takes one entry per item: its line total, the receipt it belongs to and
+    an integer category code (index into ``categories``). Grouped sums use
+    ``np.bincount``, which accumulates in input order, so totals are
+    bit-identical to the per-receipt Python loop.
+    """
+    import numpy as np
+
+    amounts = np.asarray(amounts, dtype=np.float64)
+    codes = np.asarray(category_codes, dtype=np.int64)
+    receipt_ids = np.asarray(receipt_ids)
+    if not (len(amounts) == len(codes) == len(receipt_ids)):
+        raise ValueError("amounts, receipt_ids and category_codes must have the same length")
+    n_cat = len(categories) if categories is not None else (int(codes.max()) + 1 if len(codes) else 0)
+    if categories is None:
+        categories = [str(i) for i in range(n_cat)]
+
+    # receipts in order of first appearance
+    uniq, first_idx, inverse = np.unique(receipt_ids, return_index=True, return_inverse=True)
+    order = np.argsort(first_idx, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    rix = rank[inverse.reshape(-1)]
+    n_rec = len(uniq)
+
+    overall = np.bincount(rix, weights=amounts, minlength=n_rec)
+    counts = np.bincount(rix, minlength=n_rec)
+    keys = rix * n_cat + codes
+    size = n_rec * n_cat
+    cat_totals = np.bincount(keys, weights=amounts, minlength=size).reshape(n_rec, n_cat)
+    present = (np.bincount(keys, minlength=size) > 0).reshape(n_rec, n_cat)
+    first_seen = np.full(size, len(amounts), dtype=np.int64)
+    np.minimum.at(first_seen, keys, np.arange(len(amounts)))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(overall[:, None] != 0, cat_totals / overall[:, None] * 100, 0.0)
+        mean = np.where(counts > 0, overall / np.maximum(counts, 1), 0.0)
+    item_mean = mean[rix]
+    expensive = (item_mean != 0) & (amounts > item_mean * EXPENSIVE_FACTOR)
+
+    return BatchAnalysis(
+        receipt_ids=uniq[order],
+        categories=list(categories),
+        overall_totals=overall,
+        item_counts=counts,
+        category_totals=cat_totals,
+        category_percent=pct,
+        category_present=present,
+        overspent=present & (pct > OVERSPENT_PCT),
+        item_receipt=rix,
+        expensive=expensive,
+        amounts=amounts,
+        names=names,
+        _first_seen=first_seen.reshape(n_rec, n_cat),
+    )
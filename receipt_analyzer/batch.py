@@ -0,0 +1,263 @@
+"""Parallel batch processing of receipt images into JSON Lines."""
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from . import metrics
+
+if TYPE_CHECKING:
+    from .dedup import HashIndex
+    from .llm_client import AsyncAdviceClient
+    from .stats import SpendStats
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
+
+
+def iter_input_files(inputs: Iterable[str]) -> List[Path]:
+    """Expand directories and glob patterns into an ordered, de-duplicated file list."""
+    files: List[Path] = []
+    seen = set()
+    for spec in inputs:
+        p = Path(spec)
+        if p.is_dir():
+            found = sorted(f for f in p.iterdir() if f.is_file() and f.suffix.lower() in IMAGE_SUFFIXES)
+        elif p.is_file():
+            found = [p]
+        else:
+            found = sorted(Path(m) for m in glob.glob(spec, recursive=True) if os.path.isfile(m))
+        for f in found:
+            key = f.resolve()
+            if key not in seen:
+                seen.add(key)
+                files.append(f)
+    return files
+
+
+def _init_worker():
+    """Process-pool initializer: load the OCR model once per worker."""
+    from .ocr import _get_easyocr_reader
+    if os.environ.get("RECEIPT_OCR_SERVER"):
+        return  # workers share the OCR service's warm engine
+    try:
+        _get_easyocr_reader()
+    except Exception as e:
+        print(f"EasyOCR warmup failed: {e}", file=sys.stderr)
+
+
+def analyze_file(path: str) -> Dict:
+    """CPU-bound part of the pipeline for one file: OCR, parse, categorize, analyze.
+
+    The record carries the receipt's ``date`` when one is printed on it
+    (see :func:`parser.parse_date`). Never raises; failures are reported in the ``error`` field so one bad
+    image cannot take down a batch. With metrics enabled, what was measured
+    while processing this file travels back in ``_metrics`` (see
+    :func:`run_batch`); :data:`metrics.REGISTRY` itself keeps its counts.
+    """
+    from .ocr import ocr_image_bytes
+    from .parser import parse_date, parse_items_from_text
+    from .categorizer import categorize_items
+    from .analyzer import analyze_items
+
+    before = metrics.REGISTRY.snapshot() if metrics.enabled() else None
+    try:
+        with metrics.timed("file"):
+            text, _ = ocr_image_bytes(path)  # memory-mapped, not read into the heap
+            items = categorize_items(parse_items_from_text(text))
+            record = {"file": path, "text": text, "items": items, "analysis": analyze_items(items)}
+            date = parse_date(text)
+            if date is not None:
+                record["date"] = date
+    except Exception as e:
+        record = {"file": path, "error": f"{type(e).__name__}: {e}"}
+    if before is not None:
+        record["_metrics"] = metrics.REGISTRY.since(before)
+    return record
+
+
+async def _advise_record(client: "AsyncAdviceClient", record: Dict) -> Dict:
+    """I/O-bound part of the pipeline: attach LLM (or heuristic) advice."""
+    if "error" not in record:
+        try:
+            record["advice"] = await client.advise(record["items"], record["analysis"])
+        except Exception as e:
+            record["advice_error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def _safe_fingerprint(path: str) -> Optional[Tuple[int, bytes]]:
+    from .dedup import fingerprint
+    try:
+        return fingerprint(path)
+    except Exception as e:
+        print(f"Hashing {path} failed: {e}", file=sys.stderr)
+        return None
+
+
+def run_batch(paths: List[Path], out: TextIO, workers: Optional[int] = None,
+              advice_threads: int = 8, advice: bool = True,
+              progress: Optional[TextIO] = sys.stderr, report_every: float = 5.0,
+              on_record: Optional[Callable[[Dict], None]] = None,
+              dedup: Optional["HashIndex"] = None, history: Optional["SpendStats"] = None,
+              user: str = "default") -> Dict:
+    """Process ``paths`` in parallel and write one JSON record per file to ``out``.
+
+    OCR and parsing run in a process pool (one warm EasyOCR reader per
+    worker); advice comes from an :class:`llm_client.AsyncAdviceClient`
+    with up to ``advice_threads`` requests in flight. Records are written
+    in input order and also passed to ``on_record`` if given. Returns a
+    summary with counts and throughput. Worker metrics are merged into
+    :data:`metrics.REGISTRY` of the calling process. At most four files per
+    worker are submitted ahead of the oldest unfinished one, and records are
+    dropped once written, so memory stays flat however many files there are.
+
+    With a :class:`dedup.HashIndex`, every file is fingerprinted first;
+    verified near-duplicates of a file seen earlier (in this run or stored
+    in the index) skip OCR and are written as a reference to it,
+    ``{"file", "duplicate_of", "distance"}``. New files are added to the
+    index with their file name once their record is written without an
+    error; duplicates of a file that failed in this run are OCRed themselves.
+
+    With a :class:`stats.SpendStats` ``history``, each new receipt's
+    anomalies are judged against ``user``'s history (in input order, before
+    advice) and the receipt is added to it, dated by its ``date`` (or now).
+    """
+    total = len(paths)
+    done = errors = duplicates = 0
+    start = last_report = time.perf_counter()
+
+    def write(record: Dict):
+        nonlocal done, errors, last_report
+        snap = record.pop("_metrics", None)
+        if snap is not None:
+            metrics.REGISTRY.merge(snap)
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if on_record is not None:
+            on_record(record)
+        done += 1
+        if "error" in record:
+            errors += 1
+        now = time.perf_counter()
+        if progress is not None and (now - last_report >= report_every or done == total):
+            last_report = now
+            rate = done / (now - start) if now > start else 0.0
+            print(f"[{done}/{total}] {rate:.2f} files/s, {errors} errors", file=progress)
+
+    # index ids added in this run -> file name, or None while that file has failed
+    run_files: Dict[int, Optional[str]] = {}
+    waiting: Dict[int, List[int]] = {}  # index id -> sequence numbers of its duplicates in ``jobs``
+    jobs: deque = deque()  # (path, index id, future or record) in input order, not yet collected
+    pending: deque = deque()  # (path, index id, future or record) waiting to be written, in input order
+    collected = 0  # sequence number of jobs[0]
+
+    def flush(item):
+        path, index_id, record = item
+        if isinstance(record, Future):
+            record = record.result()
+        write(record)
+        if index_id is not None and "error" not in record:
+            dedup.values[index_id] = path
+
+    def lookup(fp: Tuple[int, bytes]):
+        for index_id, dist in dedup.search(fp[0], thumb=fp[1]):
+            original = run_files[index_id] if index_id in run_files else dedup.values[index_id]
+            if original is not None:
+                return index_id, original, dist
+        return None
+
+    def submit(path: str, fp: Optional[Tuple[int, bytes]]):
+        nonlocal duplicates
+        hit = lookup(fp) if fp is not None else None
+        if hit is not None:
+            metrics.inc("dedup_total", result="hit")
+            duplicates += 1
+            index_id, original, dist = hit
+            if index_id in run_files:
+                waiting.setdefault(index_id, []).append(collected + len(jobs))
+            jobs.append((path, None, {"file": path, "duplicate_of": original, "distance": dist}))
+            return
+        index_id = None
+        if fp is not None:
+            metrics.inc("dedup_total", result="miss")
+            index_id = dedup.add(fp[0], None, fp[1])
+            run_files[index_id] = path
+        jobs.append((path, index_id, procs.submit(analyze_file, path)))
+
+    def collect():
+        """Take the oldest job's OCR result (waiting for it), judge it against history, start its advice."""
+        nonlocal collected, duplicates
+        path, key, fut = jobs.popleft()
+        collected += 1
+        if not isinstance(fut, Future):
+            pending.append((path, key, fut))  # a duplicate's reference record
+            return
+        try:
+            record = fut.result()
+        except Exception as e:  # e.g. a worker process died
+            record = {"file": path, "error": f"{type(e).__name__}: {e}"}
+        if key is not None:
+            run_files[key] = None if "error" in record else path
+            later = waiting.pop(key, ())
+            if "error" in record:
+                # duplicates cannot point at a failed record: OCR them after all
+                for seq in later:
+                    duplicates -= 1
+                    metrics.inc("dedup_total", result="retry")
+                    dup = jobs[seq - collected][0]
+                    jobs[seq - collected] = (dup, key, procs.submit(analyze_file, dup))
+        if history is not None and "error" not in record:
+            record["analysis"]["anomalies"] = history.observe(record["items"], record["analysis"], user,
+                                                               record.get("date"))
+        pending.append((path, key, adviser.submit(_advise_record(adviser.client, record)) if advice else record))
+
+    from .llm_client import AdviceService
+
+    # Executor.map and eager submission would hold every file's future until the end:
+    # keep at most ``window`` files in OCR and ``window`` records in advice/write
+    window = 4 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as procs, \
+            ThreadPoolExecutor(max_workers=advice_threads) as threads, \
+            (AdviceService(max_concurrency=advice_threads) if advice else nullcontext()) as adviser:
+        fps = (_bounded_map(threads, _safe_fingerprint, (str(p) for p in paths), window)
+               if dedup is not None else itertools.repeat(None))
+        for path, fp in zip((str(p) for p in paths), fps):
+            submit(path, fp)
+            while jobs and (len(jobs) > window or _ready(jobs[0])):
+                collect()
+            while pending and (len(pending) > window or _ready(pending[0])):
+                flush(pending.popleft())
+        while jobs:
+            collect()
+            while pending and _ready(pending[0]):
+                flush(pending.popleft())
+        while pending:
+            flush(pending.popleft())
+
+    elapsed = time.perf_counter() - start
+    summary = {"files": total, "errors": errors, "seconds": round(elapsed, 3),
+               "files_per_sec": round(total / elapsed, 3) if elapsed else 0.0}
+    if dedup is not None:
+        summary["duplicates"] = duplicates
+    return summary
+
+
+def _ready(item) -> bool:
+    return not isinstance(item[2], Future) or item[2].done()
+
+
+def _bounded_map(pool, fn, items: Iterable, limit: int) -> Iterator:
+    """``pool.map(fn, items)`` with at most ``limit`` calls submitted ahead of the consumer."""
+    ahead: deque = deque()
+    for item in items:
+        ahead.append(pool.submit(fn, item))
+        if len(ahead) >= limit:
+            yield ahead.popleft().result()
+    while ahead:
+        yield ahead.popleft().result()
@@ -1,4 +1,13 @@
-from typing import Dict
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Union
+
+from . import metrics
+
+if TYPE_CHECKING:
+    from .products import Match, ProductDictionary
 
 CATEGORY_KEYWORDS = {
     "groceries": ["milk", "bread", "eggs", "cheese", "butter", "yogurt"],
@@ -12,22 +21,197 @@ CATEGORY_KEYWORDS = {
 }
 
 
-def categorize_item(name: str) -> str:
-    n = name.lower()
-    # direct keyword match
-    for cat, keys in CATEGORY_KEYWORDS.items():
-        for k in keys:
-            if k in n:
+class KeywordMatcher:
+    """Aho-Corasick automaton over all taxonomy keywords.
+
+    Each keyword carries a priority (the index of its category in taxonomy
+    order); :meth:`best` scans a string once and returns the lowest priority
+    of any keyword occurring in it, or None. Cost is linear in the length of
+    the string regardless of how many keywords there are.
+    """
+
+    def __init__(self, keywords: Dict[str, int]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._best: List[Optional[int]] = [None]
+        for kw, prio in keywords.items():
+            if not kw:
+                continue
+            node = 0
+            for ch in kw:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._best.append(None)
+                node = nxt
+            if self._best[node] is None or prio < self._best[node]:
+                self._best[node] = prio
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                f = fail[node]
+                while f and ch not in self._goto[f]:
+                    f = fail[f]
+                fail[child] = self._goto[f].get(ch, 0)
+                # a node also matches everything its failure link matches
+                inherited = self._best[fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+                queue.append(child)
+        self._fail = fail
+
+    def best(self, text: str) -> Optional[int]:
+        goto, fail, best_at = self._goto, self._fail, self._best
+        node = 0
+        best = None
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            p = best_at[node]
+            if p is not None and (best is None or p < best):
+                if p == 0:
+                    return 0
+                best = p
+        return best
+
+
+class Categorizer:
+    """Keyword categorizer compiled from a taxonomy ``{category: [keywords]}``.
+
+    Match priority is deterministic: the first category in taxonomy order
+    with any keyword contained in the (lowercased) item name wins. Results
+    are memoized per normalized name in a bounded LRU cache.
+
+    With ``products`` (a :class:`products.ProductDictionary` or the path of
+    a product CSV, loaded on first use) a fuzzy dictionary match comes
+    first: it gives the category and a canonical name, and the keywords
+    only handle names not in the dictionary.
+    """
+
+    def __init__(self, taxonomy: Dict[str, List[str]], cache_size: int = 50000,
+                 products: Union["ProductDictionary", str, None] = None):
+        self.categories = list(taxonomy)
+        keywords: Dict[str, int] = {}
+        for prio, cat in enumerate(self.categories):
+            for kw in taxonomy[cat]:
+                keywords.setdefault(kw.lower(), prio)
+        self._matcher = KeywordMatcher(keywords)
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_size = cache_size
+        self._products = products
+
+    @property
+    def products(self) -> Optional["ProductDictionary"]:
+        if isinstance(self._products, str):
+            with self._lock:
+                if isinstance(self._products, str):
+                    from .products import ProductDictionary
+
+                    self._products = ProductDictionary.from_file(self._products)
+        return self._products
+
+    def match(self, name: str) -> Optional["Match"]:
+        """The dictionary product for ``name``, or None (also when there is no dictionary)."""
+        products = self.products
+        return products.best(name) if products is not None else None
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "Categorizer":
+        """Load a JSON taxonomy file; category order in the file is the match priority."""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f, object_pairs_hook=OrderedDict), **kwargs)
+
+    def _categorize(self, n: str) -> str:
+        prio = self._matcher.best(n)
+        if prio is not None:
+            return self.categories[prio]
+        # fallback heuristics
+        if any(ch.isdigit() for ch in n) and ("mg" in n or "ml" in n):
+            return "pharmacy"
+        if "delivery" in n or "home" in n and "charge" in n:
+            return "delivery"
+        return "other"
+
+    def categorize(self, name: str) -> str:
+        match = self.match(name)
+        if match is not None:
+            return match.category
+        return self._keyword_category(name)
+
+    def _keyword_category(self, name: str) -> str:
+        n = name.lower()
+        cache = self._cache
+        with self._lock:
+            cat = cache.get(n)
+            if cat is not None:
+                cache.move_to_end(n)
                 return cat
-    # fallback heuristics
-    if any(ch.isdigit() for ch in n) and ("mg" in n or "ml" in n):
-        return "pharmacy"
-    if "delivery" in n or "home" in n and "charge" in n:
-        return "delivery"
-    return "other"
+        cat = self._categorize(n)
+        with self._lock:
+            cache[n] = cat
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return cat
+
+
+_default = Categorizer(CATEGORY_KEYWORDS, products=os.environ.get("RECEIPT_PRODUCTS") or None)
+
+
+def set_taxonomy(taxonomy) -> Categorizer:
+    """Replace the module-level taxonomy with a dict or a JSON file path."""
+    global _default
+    products = _default._products
+    _default = (Categorizer.from_file(taxonomy, products=products) if isinstance(taxonomy, str)
+                else Categorizer(taxonomy, products=products))
+    return _default
+
 
+def set_products(products: Union["ProductDictionary", str, None]) -> Categorizer:
+    """Use a product dictionary (or a product CSV path; None to drop it) with the module-level taxonomy."""
+    _default._products = products
+    return _default
 
-def categorize_items(items: list) -> list:
-    for it in items:
-        it["category"] = categorize_item(it.get("name", ""))
+
+def categorize_item(name: str) -> str:
+    return _default.categorize(name)
+
+
+def _categorize_all(items: list, categorizer: Categorizer):
+    """Set ``category`` (and ``canonical_name`` on dictionary matches), one bulk dictionary lookup."""
+    products = categorizer.products
+    if products is None:
+        for it in items:
+            it["category"] = categorizer.categorize(it.get("name", ""))
+        return
+    matches = products.best_many(it.get("name", "") for it in items)
+    for it, match in zip(items, matches):
+        if match is None:
+            it["category"] = categorizer._keyword_category(it.get("name", ""))
+        else:
+            it["category"] = match.category
+            it["canonical_name"] = match.name
+
+
+def categorize_items(items: list, categorizer: Optional[Categorizer] = None) -> list:
+    with metrics.timed("categorize"):
+        _categorize_all(items, categorizer or _default)
+    metrics.inc("items_total", len(items), stage="categorize")
     return items
+
+
+def categorize_receipts(receipts: Iterable[list], categorizer: Optional[Categorizer] = None) -> List[list]:
+    """Categorize the items of many receipts in one call, sharing the name cache and dictionary lookups."""
+    receipts = list(receipts)
+    flat = [it for items in receipts for it in items]
+    with metrics.timed("categorize"):
+        _categorize_all(flat, categorizer or _default)
+    metrics.inc("items_total", len(flat), stage="categorize")
+    return receipts
@@ -0,0 +1,273 @@
+"""Near-duplicate receipt detection with perceptual hashes.
+
+:func:`image_hash` computes a 64-bit difference hash from a thumbnail decode
+(JPEGs are DCT-scaled to ~1/8 size while decoding, so it costs a few
+milliseconds even for phone photos). Re-encoded, resized or slightly
+cropped copies of a receipt land within a few bits of each other.
+
+Receipts share a layout (a column of left-aligned lines), so distinct
+receipts also land within a few bits now and then. :func:`fingerprint`
+therefore also returns a 16x48 grayscale thumbnail of the same trimmed
+image, and a hash match only counts once the thumbnails correlate at
+``min_similarity`` or better (see :func:`similarity`). On synthetic
+receipts, copies score 0.99 and above, and distinct receipts within 8 bits
+of each other score at most 0.95 (``benchmarks/bench_dedup.py --pairs``).
+
+:class:`HashIndex` finds stored hashes within a Hamming distance using
+multi-index hashing: the hash is split into ``chunks`` substrings and, by
+the pigeonhole principle, any hash within ``max_distance`` bits matches the
+query to within ``max_distance // chunks`` bits on at least one substring.
+Each substring is looked up by enumerating those few flips in a sorted
+NumPy table (plus a dict of recent inserts), and only the resulting
+candidates are verified with a popcount. With the default 13-bit substrings
+this stays under a millisecond per lookup at a million hashes (see
+benchmarks/bench_dedup.py).
+"""
+import itertools
+import json
+import os
+from array import array
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Tuple
+
+from PIL import Image
+
+HASH_BITS = 64
+THUMB_SIZE = (16, 48)   # width, height of the verification thumbnail
+MIN_SIMILARITY = 0.97   # thumbnail correlation a hash match needs to count as a duplicate
+
+
+def image_hash(source) -> int:
+    """64-bit perceptual hash of an image given as a path, encoded bytes/buffer or PIL image.
+
+    The thumbnail is trimmed to the bounding box of the ink, so scanner
+    margins and small crops do not move it. The top 32 bits say whether
+    each of 33 horizontal bands is brighter than the next (the line layout),
+    the low 32 bits compare neighbours in a 9x4 grid (where text sits
+    across the receipt).
+    """
+    return fingerprint(source)[0]
+
+
+def fingerprint(source) -> Tuple[int, bytes]:
+    """``(image_hash, thumbnail)`` of an image, from one decode; see :func:`similarity`."""
+    if isinstance(source, Image.Image):
+        return _fingerprint_image(source)
+    if isinstance(source, (str, os.PathLike)):
+        with Image.open(source) as img:
+            return _fingerprint_image(img)
+    from .ocr import _BufferReader
+    with _BufferReader(source) as reader:
+        return _fingerprint_image(Image.open(reader))
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """Pearson correlation of two thumbnails from :func:`fingerprint` (0.0 if either is blank)."""
+    import numpy as np
+
+    x = np.frombuffer(a, dtype=np.uint8).astype(np.float32)
+    y = np.frombuffer(b, dtype=np.uint8).astype(np.float32)
+    x -= x.mean()
+    y -= y.mean()
+    norm = float(np.sqrt((x * x).sum() * (y * y).sum()))
+    return float((x * y).sum()) / norm if norm else 0.0
+
+
+def _fingerprint_image(img: Image.Image) -> Tuple[int, bytes]:
+    import numpy as np
+
+    if img.format == "JPEG" and img.width > HASH_DECODE_WIDTH:
+        # libjpeg decodes at 1/2..1/8 scale; below ~640px wide the layout bits get unstable
+        scale = HASH_DECODE_WIDTH / img.width
+        img.draft("L", (HASH_DECODE_WIDTH, max(1, round(img.height * scale))))
+    gray = img.convert("L")
+    bbox = gray.point(_INK_LUT).getbbox()
+    if bbox:
+        gray = gray.crop(bbox)
+    bands = np.asarray(gray.resize((8, 33), Image.BOX), dtype=np.float32).mean(axis=1)
+    grid = np.asarray(gray.resize((9, 4), Image.BOX), dtype=np.int16)
+    bits = np.concatenate([bands[:-1] > bands[1:], (grid[:, :-1] > grid[:, 1:]).ravel()])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big"), gray.resize(THUMB_SIZE, Image.BOX).tobytes()
+
+
+HASH_DECODE_WIDTH = 640
+_INK_LUT = [255 if v < 195 else 0 for v in range(256)]
+_THUMB_BYTES = THUMB_SIZE[0] * THUMB_SIZE[1]
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def _popcount(x):
+    """Set bits of each uint64 in a NumPy array (``np.bitwise_count`` needs NumPy 2)."""
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return np.unpackbits(np.ascontiguousarray(x).view(np.uint8)).reshape(-1, 64).sum(1, dtype=np.uint8)
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(width: int, radius: int) -> Tuple[int, ...]:
+    """All ``width``-bit masks with at most ``radius`` bits set."""
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(width), r):
+            masks.append(sum(1 << b for b in bits))
+    return tuple(masks)
+
+
+class HashIndex:
+    """Multi-index hash table of 64-bit perceptual hashes, each with an optional value and thumbnail.
+
+    ``add`` returns the new entry's id; ``values[id]`` holds what was
+    stored with it (keep it small and JSON-serializable, e.g. the file name
+    of that image) and ``thumbs[id]`` its :func:`fingerprint` thumbnail.
+    Recent inserts live in per-substring dicts and are folded into the
+    sorted NumPy tables by :meth:`compact` (automatically once they outgrow
+    a quarter of the table).
+    """
+
+    def __init__(self, max_distance: int = 6, chunks: int = 5, min_similarity: float = MIN_SIMILARITY):
+        if not 1 <= chunks <= HASH_BITS:
+            raise ValueError("chunks must be between 1 and 64")
+        self.max_distance = max_distance
+        self.chunks = chunks
+        self.min_similarity = min_similarity
+        self._widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._shifts = [sum(self._widths[i + 1:]) for i in range(chunks)]
+        self.hashes = array("Q")
+        self.values: List[Any] = []
+        self.thumbs: List[Optional[bytes]] = []
+        self._delta: List[dict] = [{} for _ in range(chunks)]
+        self._delta_count = 0
+        self._frozen = None  # per chunk: (sorted substrings, ids); plus the frozen hashes
+        self._frozen_hashes = None
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def _substrings(self, h: int) -> List[int]:
+        return [(h >> s) & ((1 << w) - 1) for s, w in zip(self._shifts, self._widths)]
+
+    def add(self, h: int, value: Any = None, thumb: Optional[bytes] = None) -> int:
+        idx = len(self.hashes)
+        self.hashes.append(h)
+        self.values.append(value)
+        self.thumbs.append(thumb)
+        for table, sub in zip(self._delta, self._substrings(h)):
+            table.setdefault(sub, []).append(idx)
+        self._delta_count += 1
+        if self._delta_count > max(4096, (len(self.hashes) - self._delta_count) // 4):
+            self.compact()
+        return idx
+
+    def extend(self, hashes: Iterable[int], values: Optional[Iterable[Any]] = None,
+               thumbs: Optional[Iterable[Optional[bytes]]] = None) -> None:
+        """Bulk :meth:`add` (values and thumbs default to None), rebuilding the tables once at the end."""
+        start = len(self.hashes)
+        self.hashes.extend(hashes)
+        n = len(self.hashes) - start
+        self.values.extend(itertools.islice(values, n) if values is not None else itertools.repeat(None, n))
+        self.thumbs.extend(itertools.islice(thumbs, n) if thumbs is not None else itertools.repeat(None, n))
+        if not len(self.values) == len(self.thumbs) == len(self.hashes):
+            raise ValueError("values and thumbs must match hashes in length")
+        self.compact()
+
+    def compact(self) -> None:
+        """Rebuild the sorted substring tables from all hashes."""
+        import numpy as np
+
+        hashes = np.frombuffer(self.hashes, dtype=np.uint64).copy()  # a view would pin the array
+        tables = []
+        for s, w in zip(self._shifts, self._widths):
+            subs = (hashes >> np.uint64(s)) & np.uint64((1 << w) - 1)
+            order = np.argsort(subs, kind="stable")
+            tables.append((subs[order], order))
+        self._frozen, self._frozen_hashes = tables, hashes
+        self._delta = [{} for _ in range(self.chunks)]
+        self._delta_count = 0
+
+    def search(self, h: int, max_distance: Optional[int] = None,
+               thumb: Optional[bytes] = None) -> List[Tuple[int, int]]:
+        """``[(id, distance), ...]`` of all entries within ``max_distance``, nearest first.
+
+        With a ``thumb``, only entries whose stored thumbnail reaches
+        ``min_similarity`` with it are returned (entries without one never are).
+        """
+        d = self.max_distance if max_distance is None else max_distance
+        radius = d // self.chunks
+        found = {}
+        subs = self._substrings(h)
+        if self._frozen is not None:
+            import numpy as np
+
+            for (keys, ids), sub, w in zip(self._frozen, subs, self._widths):
+                probes = np.fromiter((sub ^ m for m in _flip_masks(w, radius)), dtype=np.uint64)
+                lo = np.searchsorted(keys, probes, "left")
+                counts = np.searchsorted(keys, probes, "right") - lo
+                total = int(counts.sum())
+                if not total:
+                    continue
+                # positions lo[k] .. lo[k] + counts[k] of every probe, without a Python loop
+                pos = np.arange(total) + np.repeat(lo - (np.cumsum(counts) - counts), counts)
+                cand = ids[pos]
+                dist = _popcount(self._frozen_hashes[cand] ^ np.uint64(h))
+                keep = dist <= d
+                found.update(zip(cand[keep].tolist(), dist[keep].tolist()))
+        for table, sub, w in zip(self._delta, subs, self._widths):
+            for m in _flip_masks(w, radius):
+                for idx in table.get(sub ^ m, ()):
+                    if idx not in found:
+                        dist = (self.hashes[idx] ^ h).bit_count()
+                        if dist <= d:
+                            found[idx] = dist
+        if thumb is not None:
+            found = {idx: dist for idx, dist in found.items() if self.thumbs[idx] is not None
+                     and similarity(thumb, self.thumbs[idx]) >= self.min_similarity}
+        return sorted(found.items(), key=lambda kv: (kv[1], kv[0]))
+
+    def nearest(self, h: int, max_distance: Optional[int] = None,
+                thumb: Optional[bytes] = None) -> Optional[Tuple[int, int]]:
+        """``(id, distance)`` of the closest entry within ``max_distance`` (oldest on ties), or None."""
+        hits = self.search(h, max_distance, thumb)
+        return hits[0] if hits else None
+
+    # -- persistence ---------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        """Write hashes, thumbnails and JSON-encoded values to an ``.npz`` file."""
+        import numpy as np
+        from .models import _pack_strings
+
+        blob, ends = _pack_strings([json.dumps(v, ensure_ascii=False) for v in self.values])
+        has_thumb = np.array([t is not None for t in self.thumbs], dtype=bool)
+        thumbs = np.frombuffer(b"".join(t for t in self.thumbs if t is not None), dtype=np.uint8)
+        with open(path, "wb") as f:  # np.savez would append ".npz" to other names
+            np.savez(f, hashes=np.frombuffer(self.hashes, dtype=np.uint64),
+                     values=np.frombuffer(blob, dtype=np.uint8), value_ends=np.frombuffer(ends, dtype=np.int64),
+                     thumbs=thumbs.reshape(-1, _THUMB_BYTES), has_thumb=has_thumb,
+                     params=np.array([self.max_distance, self.chunks], dtype=np.int64),
+                     min_similarity=np.array([self.min_similarity]))
+
+    @classmethod
+    def load(cls, path: str, max_distance: Optional[int] = None) -> "HashIndex":
+        """Read an index written by :meth:`save` (entries saved without thumbnails never verify)."""
+        import numpy as np
+        from .models import _unpack_strings
+
+        with np.load(path) as data:
+            saved_distance, chunks = (int(x) for x in data["params"])
+            index = cls(saved_distance if max_distance is None else max_distance, chunks)
+            index.hashes = array("Q", data["hashes"].astype(np.uint64).tobytes())
+            index.values = [json.loads(v) for v in _unpack_strings(data["values"].tobytes(),
+                                                                   data["value_ends"].tolist())]
+            index.thumbs = [None] * len(index.hashes)
+            if "thumbs" in data:
+                index.min_similarity = float(data["min_similarity"][0])
+                rows = iter(data["thumbs"])
+                index.thumbs = [next(rows).tobytes() if has else None for has in data["has_thumb"]]
+        if len(index.hashes):
+            index.compact()
+        return index
@@ -1,41 +1,161 @@
-import os
+"""Budgeting advice: prompt construction, streaming chat completions and the heuristic fallback.
+
+:func:`stream_advice` streams an OpenAI-compatible ``/chat/completions``
+response (read by :meth:`llm_client.AsyncAdviceClient.stream` on a
+background thread) and yields text chunks as they arrive. It records time to first token and
+total latency, and falls back to :func:`_heuristic_advice` when the call
+fails, when no token arrives within ``first_token_timeout``, or (appended
+to what was streamed so far) when the whole answer misses ``deadline``.
+:func:`generate_advice` is the blocking form.
+"""
 import json
-from typing import Dict, List
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional
+
+from . import metrics
+
+SYSTEM_PROMPT = "You are a helpful financial assistant."
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+PROMPT_TOKEN_BUDGET = 800     # item lines beyond this are aggregated per category
+FIRST_TOKEN_TIMEOUT = 10.0    # seconds; RECEIPT_ADVICE_FIRST_TOKEN_S
+ADVICE_DEADLINE = 30.0        # seconds; RECEIPT_ADVICE_DEADLINE_S
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and numbers)."""
+    return len(text) // 4 + 1
+
+
+def _item_total(it: Dict) -> float:
+    if it.get("line_total") is not None:
+        return float(it["line_total"])
+    return float(it.get("price") or 0.0) * max(1, it.get("quantity") or 1)
+
+
+def _build_prompt(items: List[Dict], analysis: Dict, max_tokens: Optional[int] = None) -> str:
+    """The advice prompt, at most about ``max_tokens`` (default :data:`PROMPT_TOKEN_BUDGET`).
 
+    Every item gets a line while they fit. Beyond the budget, flagged
+    expensive items and then the largest line totals keep their lines, and
+    the rest are summarized as one line per category.
+    """
+    budget = PROMPT_TOKEN_BUDGET if max_tokens is None else max_tokens
+    head = ["Items (name | qty | price):"]
+    tail = ["", f"Totals: {json.dumps(analysis.get('category_totals', {}))}",
+            f"Overall: {analysis.get('overall_total')}", "",
+            "Provide concise, actionable budgeting advice and highlight overspending or anomalies."]
+    lines = [f"- {it.get('name')} | {it.get('quantity', 1)} | {it.get('price')}" for it in items]
+    used = sum(estimate_tokens(s) for s in head + tail)
+    costs = [estimate_tokens(s) for s in lines]
+    if used + sum(costs) <= budget:
+        return "\n".join(head + lines + tail)
 
-def _build_prompt(items: List[Dict], analysis: Dict) -> str:
-    lines = [f"Items (name | qty | price):"]
-    for it in items:
-        lines.append(f"- {it.get('name')} | {it.get('quantity',1)} | {it.get('price')}")
-    lines.append("")
-    lines.append(f"Totals: {json.dumps(analysis.get('category_totals', {}))}")
-    lines.append(f"Overall: {analysis.get('overall_total')}")
-    lines.append("")
-    lines.append("Provide concise, actionable budgeting advice and highlight overspending or anomalies.")
-    return "\n".join(lines)
+    # keep the most telling items, summarize the rest per category
+    flagged = {e.get("name") for e in analysis.get("anomalies", {}).get("expensive_items", [])}
+    totals = [_item_total(it) for it in items]
+    order = sorted(range(len(items)), key=lambda i: (items[i].get("name") not in flagged, -totals[i]))
+    rest: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # category -> [count, total]
+    for it, total in zip(items, totals):
+        r = rest[it.get("category", "other")]
+        r[0] += 1
+        r[1] += total
+    summary_cost = 12  # one "- other <category>: N items | total X" line
+    kept = set()
+    for i in order:
+        cat = items[i].get("category", "other")
+        # keeping the item costs its line, and frees its category's summary line if it was the last one
+        delta = costs[i] - (summary_cost if rest[cat][0] == 1 else 0)
+        if used + delta + summary_cost * sum(1 for r in rest.values() if r[0]) > budget:
+            break
+        kept.add(i)
+        used += costs[i]
+        rest[cat][0] -= 1
+        rest[cat][1] -= totals[i]
+    body = [lines[i] for i in range(len(items)) if i in kept]
+    body += [f"- other {cat}: {n} items | total {total:.2f}" for cat, (n, total) in rest.items() if n]
+    return "\n".join(head + body + tail)
+
+
+def _pump(stream, out: "queue.Queue"):
+    """Worker thread: put ("chunk", text) for each streamed chunk, then ("done"|"error", ...)."""
+    from .llm_client import AdviceError
+
+    try:
+        for text in stream:
+            out.put(("chunk", text))
+        out.put(("done", None))
+    except AdviceError as e:
+        out.put(("error", e))
+
+
+def stream_advice(items: List[Dict], analysis: Dict, first_token_timeout: Optional[float] = None,
+                  deadline: Optional[float] = None, client=None) -> Iterator[str]:
+    """Yield advice text as it streams in; see the module docstring for the fallbacks.
+
+    ``client`` is an :class:`llm_client.AsyncAdviceClient` (by default one
+    configured from the ``OPENAI_*`` environment variables).
+    """
+    from .llm_client import AsyncAdviceClient
+
+    if deadline is None:
+        deadline = float(os.environ.get("RECEIPT_ADVICE_DEADLINE_S", ADVICE_DEADLINE))
+    if client is None:
+        client = AsyncAdviceClient(timeout=deadline)
+    if not client.api_key:
+        metrics.inc("llm_requests_total", outcome="heuristic")
+        yield _heuristic_advice(analysis)
+        return
+    if first_token_timeout is None:
+        first_token_timeout = float(os.environ.get("RECEIPT_ADVICE_FIRST_TOKEN_S", FIRST_TOKEN_TIMEOUT))
+
+    start = time.perf_counter()
+    chunks: "queue.Queue" = queue.Queue()
+    stream = client.stream(_build_prompt(items, analysis))
+    threading.Thread(target=_pump, args=(stream, chunks), name="advice-stream", daemon=True).start()
+    streamed = False
+    try:
+        while True:
+            now = time.perf_counter() - start
+            wait = (deadline if streamed else min(first_token_timeout, deadline)) - now
+            try:
+                kind, value = chunks.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                metrics.inc("llm_requests_total", outcome="deadline")
+                waited = "the rest of the advice" if streamed else "a first token"
+                print(f"LLM advice: no {waited} after {time.perf_counter() - start:.1f}s, "
+                      "using heuristic fallback", file=sys.stderr)
+                break
+            if kind == "chunk":
+                if not streamed:
+                    streamed = True
+                    metrics.observe("llm_first_token_seconds", time.perf_counter() - start)
+                yield value
+                continue
+            if kind == "done" and streamed:
+                metrics.observe("stage_seconds", time.perf_counter() - start, stage="llm")
+                metrics.inc("llm_requests_total", outcome="ok")
+                return
+            metrics.inc("llm_requests_total", outcome="error")
+            reason = value if kind == "error" else "empty response"
+            print(f"LLM advice failed, using heuristic fallback: {reason}", file=sys.stderr)
+            break
+    finally:
+        stream.close()  # also unblocks the worker thread if the server stalled
+    yield ("\n\n" if streamed else "") + _heuristic_advice(analysis)
 
 
 def generate_advice(items: List[Dict], analysis: Dict) -> str:
-    """Attempt to call OpenAI if key present, otherwise return a heuristic advice string."""
-    key = os.environ.get("OPENAI_API_KEY")
-    prompt = _build_prompt(items, analysis)
-    if key:
-        try:
-            import openai
-
-            openai.api_key = key
-            resp = openai.ChatCompletion.create(
-                model=os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo"),
-                messages=[{"role": "system", "content": "You are a helpful financial assistant."},
-                          {"role": "user", "content": prompt}],
-                max_tokens=400,
-            )
-            return resp.choices[0].message.content.strip()
-        except Exception as e:
-            # fall through to heuristic
-            pass
-
-    # Heuristic fallback
+    """LLM advice if ``OPENAI_API_KEY`` is set (within the deadlines), otherwise heuristic advice."""
+    return "".join(stream_advice(items, analysis)).strip()
+
+
+def _heuristic_advice(analysis: Dict) -> str:
+    """Template-based advice used when no LLM is configured or reachable."""
     adv = ["Budgeting advice:"]
     overall = analysis.get("overall_total", 0.0)
     if overall == 0:
@@ -0,0 +1,366 @@
+"""Asyncio chat-completions client for budgeting advice.
+
+Bounded concurrency, per-request timeouts, jittered exponential retries, a
+prompt-hash response cache and optional batching of several receipts into
+one request. Uses only the standard library (blocking ``http.client`` calls
+run in worker threads), so it works against any OpenAI-compatible endpoint,
+including a local stub server in tests. :meth:`AsyncAdviceClient.stream`
+is the streaming transport behind :func:`llm.stream_advice`, and
+:class:`AdviceService` runs the client for the batch and pipeline advice
+stages.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import urllib.parse
+import weakref
+from collections import OrderedDict
+from typing import Awaitable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from . import metrics
+from .llm import ADVICE_DEADLINE, DEFAULT_BASE_URL, SYSTEM_PROMPT, _build_prompt, _heuristic_advice
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_MARKER_RE = re.compile(r"^=== RECEIPT (\d+) ===[ \t]*$", re.MULTILINE)
+
+
+class AdviceError(Exception):
+    """Raised when the advice endpoint fails after all retries."""
+
+    def __init__(self, message: str, retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class AsyncAdviceClient:
+    """Concurrency-limited, caching client for an OpenAI-compatible chat endpoint.
+
+    One client may be used from several event loops: the response cache is
+    shared, while the concurrency limit and request sharing apply per loop.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None,
+                 base_url: Optional[str] = None, max_concurrency: int = 8, timeout: float = 30.0,
+                 max_retries: int = 3, backoff: float = 0.5, max_backoff: float = 8.0,
+                 cache_size: int = 1024, max_tokens: int = 400):
+        self.api_key = api_key if api_key is not None else os.environ.get("OPENAI_API_KEY")
+        self.model = model or os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo")
+        self.base_url = (base_url or os.environ.get("OPENAI_BASE_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache_size = cache_size
+        self.max_tokens = max_tokens
+        self.requests_sent = 0
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()  # the cache and the per-loop state are shared across loop threads
+        # event loop -> (semaphore, in-flight requests by cache key); asyncio primitives bind to one loop
+        self._loops: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    # -- low level -------------------------------------------------------
+
+    def _body(self, prompt: str, max_tokens: int, stream: bool = False) -> bytes:
+        payload = {"model": self.model,
+                   "messages": [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+                   "max_tokens": max_tokens}
+        if stream:
+            payload["stream"] = True
+        return json.dumps(payload).encode("utf-8")
+
+    def _open(self, body: bytes, stream: bool = False, on_connect=None):
+        """Blocking POST to ``/chat/completions``: ``(connection, response)``.
+
+        ``on_connect(sock)`` is called once the socket is connected.
+        Raises :class:`AdviceError` for network errors and HTTP error statuses.
+        """
+        url = urllib.parse.urlsplit(self.base_url + "/chat/completions")
+        conn_type = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        conn = conn_type(url.netloc, timeout=self.timeout)
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key or ''}"}
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        try:
+            conn.connect()
+            if on_connect is not None:
+                on_connect(conn.sock)
+            conn.request("POST", url.path + (f"?{url.query}" if url.query else ""), body, headers)
+            resp = conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise AdviceError(f"{type(e).__name__}: {e}", retryable=True)
+        if resp.status >= 400:
+            retry_after = resp.getheader("Retry-After")
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            conn.close()
+            raise AdviceError(f"HTTP {resp.status}: {resp.reason}", resp.status in RETRYABLE_STATUS, retry_after)
+        return conn, resp
+
+    def _post(self, body: bytes) -> dict:
+        """Blocking HTTP call; runs in a worker thread."""
+        conn, resp = self._open(body)
+        try:
+            return json.loads(resp.read().decode("utf-8"))
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            raise AdviceError(f"{type(e).__name__}: {e}", retryable=True)
+        finally:
+            conn.close()
+
+    def stream(self, prompt: str, max_tokens: Optional[int] = None) -> "ChatStream":
+        """A streaming completion for ``prompt``; see :class:`ChatStream` (not cached or retried)."""
+        return ChatStream(self, self._body(prompt, max_tokens or self.max_tokens, stream=True))
+
+    def _loop_state(self) -> Tuple[asyncio.Semaphore, Dict[str, asyncio.Task]]:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.get(loop)
+            if state is None:
+                state = self._loops[loop] = (asyncio.Semaphore(self.max_concurrency), {})
+            return state
+
+    async def _request(self, prompt: str, max_tokens: int) -> str:
+        body = self._body(prompt, max_tokens)
+        semaphore, _ = self._loop_state()
+        attempt = 0
+        while True:
+            try:
+                async with semaphore:
+                    self.requests_sent += 1
+                    with metrics.timed("llm"):
+                        resp = await asyncio.wait_for(asyncio.to_thread(self._post, body), self.timeout)
+                try:
+                    text = resp["choices"][0]["message"]["content"].strip()
+                except (KeyError, IndexError, TypeError, AttributeError):
+                    raise AdviceError("malformed chat-completions response")
+                metrics.inc("llm_requests_total", outcome="ok")
+                return text
+            except asyncio.TimeoutError:
+                err = AdviceError(f"timed out after {self.timeout}s", retryable=True)
+            except AdviceError as e:
+                err = e
+            if not err.retryable or attempt >= self.max_retries:
+                metrics.inc("llm_requests_total", outcome="error")
+                raise err
+            metrics.inc("llm_requests_total", outcome="retry")
+            # full jitter: uniform(0, min(cap, base * 2^attempt))
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if err.retry_after is not None:
+                delay = max(delay, min(err.retry_after, self.max_backoff))
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    # -- cached completion -----------------------------------------------
+
+    def _cache_key(self, prompt: str, max_tokens: int) -> str:
+        return hashlib.sha256(f"{self.model}\0{max_tokens}\0{prompt}".encode("utf-8")).hexdigest()
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None) -> str:
+        """Return the completion for ``prompt``, served from cache when possible.
+
+        Concurrent calls with the same prompt share a single request, which
+        runs as its own task: a caller that is cancelled stops waiting for
+        it without cancelling it for the others.
+        """
+        max_tokens = max_tokens or self.max_tokens
+        key = self._cache_key(prompt, max_tokens)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                metrics.inc("llm_requests_total", outcome="cached")
+                return self._cache[key]
+        _, inflight = self._loop_state()
+        task = inflight.get(key)
+        if task is None:
+            task = inflight[key] = asyncio.ensure_future(self._fetch(key, prompt, max_tokens))
+            task.add_done_callback(lambda t: _forget(inflight, key, t))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, prompt: str, max_tokens: int) -> str:
+        text = await self._request(prompt, max_tokens)
+        with self._lock:
+            self._cache[key] = text
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return text
+
+    # -- advice ----------------------------------------------------------
+
+    async def advise(self, items: List[Dict], analysis: Dict) -> str:
+        """LLM advice for one receipt, or the heuristic advice if the call fails."""
+        if not self.api_key:
+            return _heuristic_advice(analysis)
+        try:
+            return await self.complete(_build_prompt(items, analysis))
+        except AdviceError as e:
+            print(f"LLM advice failed, using heuristic fallback: {e}", file=sys.stderr)
+            return _heuristic_advice(analysis)
+
+    async def advise_many(self, receipts: Sequence[Tuple[List[Dict], Dict]], batch_size: int = 1) -> List[str]:
+        """Advice for many ``(items, analysis)`` pairs, in order.
+
+        With ``batch_size > 1`` up to that many receipts share one request;
+        the answer is split back per receipt and any receipt missing from
+        it gets the heuristic advice.
+        """
+        if batch_size <= 1 or not self.api_key:
+            return list(await asyncio.gather(*(self.advise(i, a) for i, a in receipts)))
+        chunks = [receipts[i:i + batch_size] for i in range(0, len(receipts), batch_size)]
+        results = await asyncio.gather(*(self._advise_chunk(c) for c in chunks))
+        return [advice for chunk in results for advice in chunk]
+
+    async def _advise_chunk(self, chunk: Sequence[Tuple[List[Dict], Dict]]) -> List[str]:
+        if len(chunk) == 1:
+            return [await self.advise(*chunk[0])]
+        try:
+            answer = await self.complete(build_batch_prompt([_build_prompt(i, a) for i, a in chunk]),
+                                         self.max_tokens * len(chunk))
+            parts = split_batch_answer(answer, len(chunk))
+        except AdviceError as e:
+            print(f"LLM advice failed, using heuristic fallback: {e}", file=sys.stderr)
+            parts = [None] * len(chunk)
+        return [p if p else _heuristic_advice(a) for p, (_, a) in zip(parts, chunk)]
+
+
+def _forget(inflight: Dict[str, asyncio.Task], key: str, task: asyncio.Task) -> None:
+    inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # mark retrieved when every caller has given up
+
+
+class AdviceService:
+    """Runs an :class:`AsyncAdviceClient` on its own event-loop thread for synchronous code.
+
+    :meth:`submit` schedules a coroutine (typically one calling
+    ``service.client``) and returns a :class:`concurrent.futures.Future`, so
+    worker threads and executor-based code can share one client, its
+    concurrency limit and its cache. Client keyword arguments default to a
+    ``timeout`` of ``RECEIPT_ADVICE_DEADLINE_S``.
+    """
+
+    def __init__(self, client: Optional[AsyncAdviceClient] = None, **kwargs):
+        if client is None:
+            kwargs.setdefault("timeout", float(os.environ.get("RECEIPT_ADVICE_DEADLINE_S", ADVICE_DEADLINE)))
+            client = AsyncAdviceClient(**kwargs)
+        self.client = client
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="advice-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro: Awaitable[T]) -> "concurrent.futures.Future[T]":
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def close(self) -> None:
+        """Stop the loop thread; call it once the submitted futures are done."""
+        if self._thread.is_alive():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChatStream:
+    """The text chunks of a streaming chat completion (server-sent events).
+
+    Iterating opens the connection and blocks on the server; errors raise
+    :class:`AdviceError`. :meth:`close` may be called from another thread:
+    it shuts the socket down, so a read stalled on the server returns at
+    once and the iteration simply ends.
+    """
+
+    def __init__(self, client: AsyncAdviceClient, body: bytes):
+        self._client, self._body = client, body
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self.closed = False
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            conn, resp = self._client._open(self._body, stream=True, on_connect=self._connected)
+        except AdviceError:
+            if self.closed:
+                return
+            raise
+        try:
+            for raw in resp:
+                line = raw.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                try:
+                    text = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+                    raise AdviceError(f"malformed stream event: {data[:80]}")
+                if text:
+                    yield text
+        except (OSError, http.client.HTTPException) as e:
+            if not self.closed:
+                raise AdviceError(f"{type(e).__name__}: {e}", retryable=True)
+        finally:
+            conn.close()
+
+    def _connected(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sock = sock
+            closed = self.closed
+        if closed:
+            self._shutdown(sock)
+
+    def close(self) -> None:
+        with self._lock:
+            self.closed = True
+            sock = self._sock
+        if sock is not None:
+            self._shutdown(sock)
+
+    @staticmethod
+    def _shutdown(sock: socket.socket) -> None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+
+def build_batch_prompt(prompts: Sequence[str]) -> str:
+    """Combine several per-receipt prompts into one request with numbered markers."""
+    lines = [f"You will receive {len(prompts)} receipts, each introduced by a line "
+             "'=== RECEIPT <n> ==='. Answer each one separately, starting each answer with the "
+             "same marker line, in the same order.", ""]
+    for n, p in enumerate(prompts, 1):
+        lines.append(f"=== RECEIPT {n} ===")
+        lines.append(p)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def split_batch_answer(answer: str, n: int) -> List[Optional[str]]:
+    """Split a batched answer on its markers; missing sections come back as None."""
+    parts: List[Optional[str]] = [None] * n
+    marks = list(_MARKER_RE.finditer(answer))
+    for m, nxt in zip(marks, marks[1:] + [None]):
+        idx = int(m.group(1)) - 1
+        if 0 <= idx < n:
+            text = answer[m.end():nxt.start() if nxt else len(answer)].strip()
+            parts[idx] = text or None
+    return parts
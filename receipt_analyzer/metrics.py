@@ -0,0 +1,256 @@
+"""Lightweight pipeline instrumentation: stage timers, counters and exporters.
+
+Disabled by default; turn it on with ``RECEIPT_METRICS=1`` or
+:func:`enable`. While disabled, :func:`timed` hands back a shared no-op
+context manager and :func:`inc`/:func:`observe` return after one flag
+check, so the instrumented code paths cost next to nothing.
+
+Recorded series (all prefixed ``receipt_`` when exported):
+
+- ``stage_seconds{stage}``: duration histogram per pipeline stage
+- ``ocr_engine_total{engine}``: which engine produced the text
+- ``ocr_fallback_total{from,to}``, ``ocr_errors_total{engine}``
+- ``items_total{stage}``: items produced by parse / categorize
+- ``llm_requests_total{outcome}``: ok / error / retry / cached / heuristic / deadline
+- ``llm_first_token_seconds``: time to the first streamed advice token
+- ``ocr_cache_total{result}``: OCR result cache hit / miss
+
+Export with :func:`to_prometheus` (text exposition format) or
+:func:`to_json`; :func:`profile` wraps a single request in cProfile.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "receipt_"
+
+_enabled = os.environ.get("RECEIPT_METRICS", "") not in ("", "0")
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    """Thread-safe store of counters and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[LabelKey, float] = {}
+        self.histograms: Dict[LabelKey, Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = Histogram()
+            h.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> Dict:
+        """JSON-serializable copy of all series (see :meth:`merge`)."""
+        with self._lock:
+            return {
+                "counters": [{"name": n, "labels": dict(l), "value": v} for (n, l), v in self.counters.items()],
+                "histograms": [{"name": n, "labels": dict(l), "buckets": list(h.buckets), "counts": list(h.counts),
+                                "sum": h.sum, "count": h.count} for (n, l), h in self.histograms.items()],
+            }
+
+    def since(self, before: Dict) -> Dict:
+        """Snapshot of only what was recorded after ``before`` (an earlier :meth:`snapshot`)."""
+        counters = {self._key(c["name"], c["labels"]): c["value"] for c in before.get("counters", [])}
+        histograms = {self._key(s["name"], s["labels"]): s for s in before.get("histograms", [])}
+        now = self.snapshot()
+        out = {"counters": [], "histograms": []}
+        for c in now["counters"]:
+            value = c["value"] - counters.get(self._key(c["name"], c["labels"]), 0)
+            if value:
+                out["counters"].append({**c, "value": value})
+        for s in now["histograms"]:
+            old = histograms.get(self._key(s["name"], s["labels"]))
+            if old is not None:
+                s = {**s, "counts": [a - b for a, b in zip(s["counts"], old["counts"])],
+                     "sum": s["sum"] - old["sum"], "count": s["count"] - old["count"]}
+            if s["count"]:
+                out["histograms"].append(s)
+        return out
+
+    def merge(self, snap: Dict):
+        """Add a snapshot taken elsewhere (e.g. in a worker process) into this registry."""
+        with self._lock:
+            for c in snap.get("counters", []):
+                key = self._key(c["name"], c["labels"])
+                self.counters[key] = self.counters.get(key, 0) + c["value"]
+            for s in snap.get("histograms", []):
+                key = self._key(s["name"], s["labels"])
+                h = self.histograms.get(key)
+                if h is None:
+                    h = self.histograms[key] = Histogram(s["buckets"])
+                if h.buckets != tuple(s["buckets"]):
+                    continue
+                h.counts = [a + b for a, b in zip(h.counts, s["counts"])]
+                h.sum += s["sum"]
+                h.count += s["count"]
+
+    def to_prometheus(self) -> str:
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                full = PREFIX + name
+                if full not in seen:
+                    seen.add(full)
+                    lines.append(f"# TYPE {full} counter")
+                lines.append(f"{full}{fmt_labels(labels)} {value:g}")
+            for (name, labels), h in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                full = PREFIX + name
+                if full not in seen:
+                    seen.add(full)
+                    lines.append(f"# TYPE {full} histogram")
+                cumulative = 0
+                for bound, n in zip(h.buckets, h.counts):
+                    cumulative += n
+                    lines.append(f"{full}_bucket{fmt_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+                lines.append(f"{full}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{full}_sum{fmt_labels(labels)} {h.sum:.6f}")
+                lines.append(f"{full}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def inc(name: str, value: float = 1, **labels):
+    if _enabled:
+        REGISTRY.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    if _enabled:
+        REGISTRY.observe(name, value, **labels)
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe("stage_seconds", time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+def timed(stage: str):
+    """Context manager recording the block's duration under ``stage_seconds{stage}``."""
+    return _Timer(stage) if _enabled else _NOOP
+
+
+def to_prometheus() -> str:
+    return REGISTRY.to_prometheus()
+
+
+def to_json() -> str:
+    return json.dumps(REGISTRY.snapshot(), indent=2)
+
+
+def write(path: str):
+    """Write the current metrics to ``path``: Prometheus text for ``.prom``/``.txt``, JSON otherwise."""
+    text = to_prometheus() if path.endswith((".prom", ".txt")) else to_json()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+@contextmanager
+def profile(path: Optional[str] = None, sort: str = "cumulative", limit: int = 30):
+    """Run the block under cProfile.
+
+    Stats are dumped to ``path`` (for snakeviz/pstats) if given, otherwise
+    the top ``limit`` entries are printed to stderr.
+    """
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield prof
+    finally:
+        prof.disable()
+        if path:
+            prof.dump_stats(path)
+        else:
+            out = io.StringIO()
+            pstats.Stats(prof, stream=out).sort_stats(sort).print_stats(limit)
+            print(out.getvalue(), file=sys.stderr)
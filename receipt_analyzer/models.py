@@ -0,0 +1,303 @@
+"""Typed receipt model and a columnar container for large batches.
+
+:class:`Item` and :class:`Receipt` use ``__slots__``, so an item costs a
+fraction of the legacy dict with its duplicate ``rate``/``amount`` keys.
+Items also support ``item["price"]``/``item.get(...)`` (old key names
+included), so dict-based code such as :func:`analyzer.analyze_items` keeps
+working on them.
+
+:class:`ReceiptBatch` stores many receipts as parallel ``array.array``
+columns (one contiguous buffer per field) with item names and categories
+interned into code tables. It exports to NumPy and pandas without copying
+the numeric columns, feeds :func:`analyzer.analyze_batch` directly and
+saves to a compact ``.npz`` file.
+"""
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+# legacy dict keys that alias item fields
+_ALIASES = {"rate": "price", "amount": "line_total"}
+
+
+class Item:
+    """One receipt line. ``line_total`` is price * quantity unless the receipt says otherwise.
+
+    ``canonical_name`` is set by a product dictionary match (see :mod:`products`).
+    """
+    __slots__ = ("name", "quantity", "price", "line_total", "category", "canonical_name")
+
+    def __init__(self, name: str, quantity: float = 1, price: float = 0.0,
+                 line_total: Optional[float] = None, category: Optional[str] = None,
+                 canonical_name: Optional[str] = None):
+        self.name = name
+        self.quantity = quantity
+        self.price = price
+        self.line_total = line_total
+        self.category = category
+        self.canonical_name = canonical_name
+
+    @property
+    def total(self) -> float:
+        if self.line_total is not None:
+            return float(self.line_total)
+        return float(self.price) * max(1, self.quantity)
+
+    # dict-style access for code written against the legacy item dicts
+
+    def __getitem__(self, key: str):
+        try:
+            value = getattr(self, _ALIASES.get(key, key))
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+        if value is None and key in ("category", "canonical_name"):
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        try:
+            setattr(self, _ALIASES.get(key, key), value)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, key: str, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    @classmethod
+    def from_dict(cls, d: Dict) -> "Item":
+        price = d.get("price", d.get("rate", 0.0))
+        line_total = d.get("line_total", d.get("amount"))
+        return cls(d.get("name", ""), d.get("quantity", 1), price, line_total, d.get("category"),
+                   d.get("canonical_name"))
+
+    def to_dict(self) -> Dict:
+        """The legacy parser dict (with its ``rate``/``amount`` duplicates)."""
+        d = {"name": self.name, "quantity": self.quantity, "rate": self.price, "price": self.price,
+             "line_total": self.line_total, "amount": self.line_total}
+        if self.category is not None:
+            d["category"] = self.category
+        if self.canonical_name is not None:
+            d["canonical_name"] = self.canonical_name
+        return d
+
+    def __eq__(self, other):
+        if not isinstance(other, Item):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return (f"Item({self.name!r}, quantity={self.quantity!r}, price={self.price!r}, "
+                f"line_total={self.line_total!r}, category={self.category!r}"
+                + (f", canonical_name={self.canonical_name!r})" if self.canonical_name is not None else ")"))
+
+
+class Receipt:
+    """Items of one receipt plus where it came from."""
+    __slots__ = ("items", "file", "date")
+
+    def __init__(self, items: Optional[List[Item]] = None, file: Optional[str] = None, date: Optional[str] = None):
+        self.items = items if items is not None else []
+        self.file = file
+        self.date = date
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Item]:
+        return iter(self.items)
+
+    @property
+    def total(self) -> float:
+        return sum(it.total for it in self.items)
+
+    @classmethod
+    def from_dicts(cls, items: Iterable[Dict], file: Optional[str] = None, date: Optional[str] = None) -> "Receipt":
+        return cls([Item.from_dict(d) for d in items], file, date)
+
+    def to_dicts(self) -> List[Dict]:
+        return [it.to_dict() for it in self.items]
+
+    def __repr__(self):
+        return f"Receipt({len(self.items)} items, file={self.file!r}, date={self.date!r})"
+
+
+def _pack_strings(strings: Sequence[str]) -> Tuple[bytes, array]:
+    """UTF-8 blob plus end offsets: far smaller on disk than a fixed-width unicode array."""
+    blob = bytearray()
+    ends = array("q")
+    for s in strings:
+        blob += s.encode("utf-8")
+        ends.append(len(blob))
+    return bytes(blob), ends
+
+
+def _unpack_strings(blob: bytes, ends: Sequence[int]) -> List[str]:
+    out, start = [], 0
+    for end in ends:
+        out.append(blob[start:end].decode("utf-8"))
+        start = end
+    return out
+
+
+class ReceiptBatch:
+    """Columnar store of many receipts.
+
+    Item columns (``prices``, ``quantities``, ``line_totals``,
+    ``name_codes``, ``category_codes``) are ``array.array`` buffers in item
+    order; receipt ``r`` owns items ``offsets[r]:offsets[r + 1]``. Names and
+    categories are interned: each distinct string is stored once in
+    ``names``/``categories`` and referenced by code (-1 = uncategorized).
+    """
+
+    def __init__(self):
+        self.prices = array("d")
+        self.quantities = array("d")
+        self.line_totals = array("d")
+        self.name_codes = array("i")
+        self.category_codes = array("i")
+        self.offsets = array("q", [0])
+        self.names: List[str] = []
+        self.categories: List[str] = []
+        self.files: List[str] = []
+        self._name_index: Dict[str, int] = {}
+        self._category_index: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_items(self) -> int:
+        return len(self.prices)
+
+    def _intern(self, value: str, index: Dict[str, int], table: List[str]) -> int:
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(table)
+            table.append(value)
+        return code
+
+    def append(self, items: Iterable[Union[Item, Dict]], file: Optional[str] = None) -> int:
+        """Add one receipt (Items or legacy dicts); returns its index."""
+        for it in items:
+            total = it.total if isinstance(it, Item) else Item.from_dict(it).total
+            self.prices.append(float(it.get("price", 0.0)))
+            self.quantities.append(float(it.get("quantity", 1)))
+            self.line_totals.append(total)
+            self.name_codes.append(self._intern(it.get("name") or "", self._name_index, self.names))
+            cat = it.get("category")
+            self.category_codes.append(-1 if cat is None else
+                                       self._intern(cat, self._category_index, self.categories))
+        self.offsets.append(len(self.prices))
+        self.files.append(file or "")
+        return len(self) - 1
+
+    @classmethod
+    def from_receipts(cls, receipts: Iterable[Union[Receipt, Iterable[Union[Item, Dict]]]]) -> "ReceiptBatch":
+        batch = cls()
+        for r in receipts:
+            batch.append(r, r.file if isinstance(r, Receipt) else None)
+        return batch
+
+    def receipt(self, r: int) -> Receipt:
+        start, end = self.offsets[r], self.offsets[r + 1]
+        items = []
+        for i in range(start, end):
+            code = self.category_codes[i]
+            items.append(Item(self.names[self.name_codes[i]], self.quantities[i], self.prices[i],
+                              self.line_totals[i], self.categories[code] if code >= 0 else None))
+        return Receipt(items, self.files[r] or None)
+
+    def __iter__(self) -> Iterator[Receipt]:
+        return (self.receipt(r) for r in range(len(self)))
+
+    # -- export ------------------------------------------------------------
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """Columns as NumPy arrays; the numeric ones are views of the batch buffers.
+
+        ``array.array`` cannot grow while views of it exist, so drop the
+        returned arrays (or copy them) before appending more receipts.
+        """
+        import numpy as np
+
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        return {
+            "prices": np.frombuffer(self.prices, dtype=np.float64),
+            "quantities": np.frombuffer(self.quantities, dtype=np.float64),
+            "line_totals": np.frombuffer(self.line_totals, dtype=np.float64),
+            "name_codes": np.frombuffer(self.name_codes, dtype=np.int32),
+            "category_codes": np.frombuffer(self.category_codes, dtype=np.int32),
+            "receipt_ids": np.repeat(np.arange(len(self), dtype=np.int64), np.diff(offsets)),
+            "offsets": offsets,
+        }
+
+    def to_pandas(self):
+        """One row per item; ``name``/``category`` are pandas Categoricals over the interned tables."""
+        import pandas as pd
+
+        cols = self.to_numpy()
+        return pd.DataFrame({
+            "receipt": cols["receipt_ids"],
+            "name": pd.Categorical.from_codes(cols["name_codes"], categories=pd.Index(self.names)),
+            "category": pd.Categorical.from_codes(cols["category_codes"], categories=pd.Index(self.categories)),
+            "quantity": cols["quantities"],
+            "price": cols["prices"],
+            "line_total": cols["line_totals"],
+        })
+
+    def analyze(self):
+        """:func:`analyzer.analyze_batch` over the batch (uncategorized items count as "other")."""
+        import numpy as np
+        from .analyzer import analyze_batch
+
+        cols = self.to_numpy()
+        categories = list(self.categories)
+        codes = cols["category_codes"].astype(np.int64)
+        if (codes < 0).any():
+            other = categories.index("other") if "other" in categories else len(categories)
+            if other == len(categories):
+                categories.append("other")
+            codes[codes < 0] = other
+        return analyze_batch(cols["line_totals"], cols["receipt_ids"], codes, categories,
+                             [self.names[c] for c in self.name_codes])
+
+    # -- on-disk format ----------------------------------------------------
+
+    def save(self, path: str, compress: bool = True) -> None:
+        """Write the batch as an ``.npz`` archive (strings as UTF-8 blobs with offsets)."""
+        import numpy as np
+
+        cols = self.to_numpy()
+        arrays = {k: cols[k] for k in ("prices", "quantities", "line_totals", "name_codes",
+                                       "category_codes", "offsets")}
+        for key, table in (("names", self.names), ("categories", self.categories), ("files", self.files)):
+            blob, ends = _pack_strings(table)
+            arrays[key] = np.frombuffer(blob, dtype=np.uint8)
+            arrays[key + "_ends"] = np.frombuffer(ends, dtype=np.int64)
+        (np.savez_compressed if compress else np.savez)(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "ReceiptBatch":
+        import numpy as np
+
+        batch = cls()
+        with np.load(path) as data:
+            for key, typecode, dtype in (("prices", "d", np.float64), ("quantities", "d", np.float64),
+                                         ("line_totals", "d", np.float64), ("name_codes", "i", np.int32),
+                                         ("category_codes", "i", np.int32), ("offsets", "q", np.int64)):
+                setattr(batch, key, array(typecode, data[key].astype(dtype, copy=False).tobytes()))
+            for key in ("names", "categories", "files"):
+                setattr(batch, key, _unpack_strings(data[key].tobytes(), data[key + "_ends"].tolist()))
+        batch._name_index = {s: i for i, s in enumerate(batch.names)}
+        batch._category_index = {s: i for i, s in enumerate(batch.categories)}
+        return batch
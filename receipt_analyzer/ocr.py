@@ -1,25 +1,104 @@
+"""Image preprocessing and OCR.
+
+Heavy backends (OpenCV/NumPy, EasyOCR/torch, pytesseract) are imported on
+first use, and Tesseract discovery runs once, the first time it is needed.
+``HAS_CV2``/``HAS_EASYOCR`` are resolved lazily on attribute access.
+"""
+import abc
 import io
-from typing import Tuple
+import hashlib
+import importlib.metadata
+import json
+import logging
+import mmap
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import List, NamedTuple, Optional, Tuple
 from PIL import Image, ImageFilter, ImageOps
-import pytesseract
 import os
 import shutil
 
-try:
-    import easyocr
-    HAS_EASYOCR = True
-except Exception:
-    HAS_EASYOCR = False
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# backends, populated by the loaders below
+np = cv2 = easyocr = pytesseract = None
+_HAS_CV2: Optional[bool] = None
+_HAS_EASYOCR: Optional[bool] = None
+_tesseract_configured = False
+
+
+def _has_cv2() -> bool:
+    """Import OpenCV and NumPy on first call; False if unavailable."""
+    global np, cv2, _HAS_CV2
+    if _HAS_CV2 is None:
+        try:
+            import numpy as _np
+            import cv2 as _cv2
+            np, cv2, _HAS_CV2 = _np, _cv2, True
+        except Exception:
+            _HAS_CV2 = False
+    return _HAS_CV2
+
+
+def _has_easyocr() -> bool:
+    """Import EasyOCR (and torch) on first call; False if unavailable."""
+    global easyocr, _HAS_EASYOCR
+    if _HAS_EASYOCR is None:
+        try:
+            import easyocr as _easyocr
+            easyocr, _HAS_EASYOCR = _easyocr, True
+        except Exception:
+            _HAS_EASYOCR = False
+    return _HAS_EASYOCR
+
+
+def _tesseract():
+    """Import and configure pytesseract on first call (raises ImportError if missing)."""
+    global pytesseract
+    if pytesseract is None:
+        import pytesseract as _pytesseract
+        pytesseract = _pytesseract
+    _configure_tesseract()
+    return pytesseract
+
+
+def __getattr__(name):
+    if name == "HAS_CV2":
+        return _has_cv2()
+    if name == "HAS_EASYOCR":
+        return _has_easyocr()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def _configure_tesseract():
-    """Try to locate tesseract executable and configure pytesseract and env vars."""
-    # if already configured, skip
+    """Try to locate tesseract executable and configure pytesseract and env vars.
+
+    Runs once per process; later calls return immediately.
+    """
+    global pytesseract, _tesseract_configured
+    if _tesseract_configured:
+        return
+    _tesseract_configured = True
+    if pytesseract is None:
+        try:
+            import pytesseract as _pytesseract
+        except ImportError:
+            return
+        pytesseract = _pytesseract
+    # if already configured, skip ("tesseract" is pytesseract's default: search PATH and the usual installs)
     try:
         cur = getattr(pytesseract, 'pytesseract').tesseract_cmd
     except Exception:
         cur = None
-    if cur:
+    if cur and cur != 'tesseract':
         return
 
     # possible candidates
@@ -61,99 +140,1127 @@ def _configure_tesseract():
                 continue
 
 
-# configure at import time
-_configure_tesseract()
 
-try:
-    import numpy as np
-    import cv2
-    HAS_CV2 = True
-except Exception:
-    HAS_CV2 = False
-
-
-def preprocess_image_bytes(image_bytes: bytes):
-    """Preprocess image bytes. Returns either a PIL.Image or a numpy array depending on available libs."""
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    if HAS_CV2:
-        arr = np.array(img)
-        gray = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
-        denoised = cv2.bilateralFilter(gray, d=9, sigmaColor=75, sigmaSpace=75)
+@dataclass(frozen=True)
+class PreprocessPreset:
+    """Latency/accuracy knobs for :func:`preprocess_image_bytes`.
+
+    ``max_side`` caps the longest side right after decoding (JPEGs are
+    draft-decoded at reduced size). ``target_text_height`` further downscales
+    so the median glyph height is about that many pixels. With
+    ``denoise="auto"`` the filter is picked from a noise estimate: none below
+    ``clean_sigma``, a 3x3 median below ``noisy_sigma``, bilateral above.
+    ``pil_median`` is the median filter size for the PIL-only fallback
+    (0 disables it).
+    """
+    name: str
+    max_side: Optional[int] = None
+    target_text_height: Optional[int] = None
+    denoise: str = "bilateral"  # "auto", "bilateral", "median" or "none"
+    bilateral_d: int = 9
+    clean_sigma: float = 0.0
+    noisy_sigma: float = 0.0
+    pil_median: int = 3
+
+
+PRESETS = {
+    "fast": PreprocessPreset("fast", max_side=1600, target_text_height=20, denoise="auto",
+                             bilateral_d=5, clean_sigma=3.0, noisy_sigma=8.0, pil_median=0),
+    "balanced": PreprocessPreset("balanced", max_side=2400, target_text_height=28, denoise="auto",
+                                 bilateral_d=7, clean_sigma=1.5, noisy_sigma=5.0),
+    # full resolution, always bilateral: the original pipeline
+    "quality": PreprocessPreset("quality"),
+}
+DEFAULT_PRESET = "quality"
+
+
+def _resolve_preset(preset=None) -> PreprocessPreset:
+    """Accept a preset name, a :class:`PreprocessPreset`, or None (``RECEIPT_PREPROCESS_PRESET``/default)."""
+    if isinstance(preset, PreprocessPreset):
+        return preset
+    name = preset or os.environ.get("RECEIPT_PREPROCESS_PRESET") or DEFAULT_PRESET
+    try:
+        return PRESETS[name]
+    except KeyError:
+        raise ValueError(f"unknown preprocessing preset {name!r}; choose from {sorted(PRESETS)}")
+
+
+@dataclass(frozen=True)
+class CascadeConfig:
+    """Confidence-driven engine cascade (see :func:`_cascade_refine`).
+
+    The ``primary`` engine reads the whole image; words it is less than
+    ``min_conf`` (0-100) sure about are cropped (plus ``pad`` pixels) and
+    re-read by ``secondary``, keeping whichever reading is more confident.
+    At most ``max_regions`` crops are re-read, least confident first.
+
+    Budgets are in seconds (None = unlimited). Tesseract runs are killed
+    once they exceed their budget; EasyOCR cannot be interrupted, so for it
+    the budget only stops further crops from being started.
+    """
+    primary: str = "easyocr"
+    secondary: str = "tesseract"
+    min_conf: float = 50.0
+    pad: int = 3
+    max_regions: int = 48
+    primary_budget: Optional[float] = None
+    secondary_budget: Optional[float] = 2.0
+
+
+ENGINES = ("easyocr", "tesseract")
+
+
+def _resolve_cascade(cascade=None) -> Optional[CascadeConfig]:
+    """Accept a :class:`CascadeConfig`, True/False, or None (``RECEIPT_OCR_CASCADE``)."""
+    if cascade is None:
+        cascade = os.environ.get("RECEIPT_OCR_CASCADE", "") not in ("", "0")
+    if cascade is True:
+        return CascadeConfig()
+    if cascade is False:
+        return None
+    if cascade.primary not in ENGINES or cascade.secondary not in ENGINES:
+        raise ValueError(f"unknown OCR engine in {cascade!r}; choose from {ENGINES}")
+    return cascade
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable read-only file over any buffer (bytes, mmap, memoryview) without copying it."""
+
+    def __init__(self, buf):
+        self._view = memoryview(buf).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._view.release()  # lets an underlying mmap be closed
+        super().close()
+
+
+def _is_array(source) -> bool:
+    return hasattr(source, "__array_interface__") and not isinstance(source, Image.Image)
+
+
+def _cap_pil(img: Image.Image, max_side: Optional[int]) -> Image.Image:
+    if max_side and max(img.size) > max_side:
+        scale = max_side / max(img.size)
+        img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                         Image.BILINEAR, reducing_gap=2.0)
+    return img
+
+
+def _cap_array(gray, max_side: Optional[int]):
+    h, w = gray.shape[:2]
+    if max_side and max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def _decode_pil(img: Image.Image, preset: PreprocessPreset) -> Image.Image:
+    """Decode an opened PIL image straight to 8-bit grayscale, letting JPEG decode at reduced size."""
+    if preset.max_side and img.format == "JPEG":
+        w, h = img.size
+        longest = max(w, h)
+        if longest > preset.max_side:
+            # draft() picks the largest DCT scale that keeps the image >= the requested size
+            img.draft("L", (w * preset.max_side // longest, h * preset.max_side // longest))
+    return _cap_pil(img.convert("L"), preset.max_side)
+
+
+_REDUCED_FLAGS = ((8, "IMREAD_REDUCED_GRAYSCALE_8"), (4, "IMREAD_REDUCED_GRAYSCALE_4"),
+                  (2, "IMREAD_REDUCED_GRAYSCALE_2"))
+
+
+def _decode_buffer(buf, preset: PreprocessPreset):
+    """Decode encoded image data held in any buffer.
+
+    With OpenCV the data is decoded in place (``np.frombuffer`` is a view)
+    straight to a grayscale array, at 1/2, 1/4 or 1/8 scale when that still
+    covers ``max_side``; only the header is parsed by PIL. Formats OpenCV
+    cannot read, and the PIL-only install, decode through PIL.
+    """
+    with _BufferReader(buf) as reader:
+        img = Image.open(reader)  # parses the header only
+        if _has_cv2():
+            flag = cv2.IMREAD_GRAYSCALE
+            if preset.max_side:
+                longest = max(img.size)
+                for factor, name in _REDUCED_FLAGS:
+                    if longest // factor >= preset.max_side:
+                        flag = getattr(cv2, name)
+                        break
+            data = np.frombuffer(buf, dtype=np.uint8)
+            gray = cv2.imdecode(data, flag | cv2.IMREAD_IGNORE_ORIENTATION)
+            del data
+            if gray is not None:
+                return _cap_array(gray, preset.max_side)
+            return np.asarray(_decode_pil(img, preset))
+        return _decode_pil(img, preset)
+
+
+def _load_gray(source, preset: PreprocessPreset):
+    """Any supported source as 8-bit grayscale: an ndarray when OpenCV is available, else a PIL image.
+
+    Paths are memory-mapped rather than read into the heap; arrays and PIL
+    images that already are grayscale are used as they are.
+    """
+    if isinstance(source, Image.Image):
+        img = source if source.mode == "L" else source.convert("L")
+        img = _cap_pil(img, preset.max_side)
+        return np.asarray(img) if _has_cv2() else img
+    if _is_array(source):
+        if not _has_cv2():
+            img = Image.fromarray(source)
+            return _cap_pil(img if img.mode == "L" else img.convert("L"), preset.max_side)
+        gray = np.asarray(source)
+        if gray.ndim == 3:  # channels in RGB(A) order, as from PIL/EasyOCR
+            gray = cv2.cvtColor(gray, cv2.COLOR_RGBA2GRAY if gray.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+        if gray.dtype != np.uint8:
+            gray = cv2.normalize(gray, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+        return _cap_array(gray, preset.max_side)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty files cannot be mapped
+                return _decode_buffer(f.read(), preset)
+        try:
+            return _decode_buffer(mm, preset)
+        finally:
+            try:
+                mm.close()
+            except BufferError:  # a traceback still holds a view; gc unmaps it
+                pass
+    return _decode_buffer(source, preset)
+
+
+def _source_bytes(source) -> bytes:
+    """Encoded bytes for sources that have to leave the process (OCR server)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if isinstance(source, Image.Image) or _is_array(source):
+        img = source if isinstance(source, Image.Image) else Image.fromarray(source)
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        return buf.getvalue()
+    return bytes(source)
+
+
+def _estimate_text_height(gray) -> Optional[float]:
+    """Median height of glyph-sized connected components, or None if too few are found."""
+    _, inv = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    n, _labels, stats, _ = cv2.connectedComponentsWithStats(inv, connectivity=8)
+    if n < 2:
+        return None
+    hs = stats[1:, cv2.CC_STAT_HEIGHT]
+    ws = stats[1:, cv2.CC_STAT_WIDTH]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = (hs >= 4) & (hs < gray.shape[0] / 4) & (ws < gray.shape[1] / 2) & (areas >= 8)
+    if keep.sum() < 20:
+        return None
+    return float(np.median(hs[keep]))
+
+
+def _estimate_noise_sigma(gray) -> float:
+    """Fast noise standard deviation estimate (Immerkaer, 1996)."""
+    h, w = gray.shape
+    if h < 3 or w < 3:
+        return 0.0
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    conv = cv2.filter2D(gray.astype(np.float32), -1, kernel)[1:-1, 1:-1]
+    return float(np.abs(conv).sum() * np.sqrt(np.pi / 2) / (6.0 * (w - 2) * (h - 2)))
+
+
+def _denoise(gray, preset: PreprocessPreset):
+    mode = preset.denoise
+    if mode == "auto":
+        sigma = _estimate_noise_sigma(gray)
+        mode = "none" if sigma < preset.clean_sigma else "median" if sigma < preset.noisy_sigma else "bilateral"
+    if mode == "bilateral":
+        return cv2.bilateralFilter(gray, d=preset.bilateral_d, sigmaColor=75, sigmaSpace=75)
+    if mode == "median":
+        return cv2.medianBlur(gray, 3)
+    return gray
+
+
+def preprocess_image(source, preset=None):
+    """Preprocess an image. Returns either a PIL.Image or a numpy array depending on available libs.
+
+    ``source`` may be encoded image data (bytes, bytearray, memoryview,
+    mmap), a file path, a PIL image or a NumPy array (grayscale, or RGB(A)
+    channel order). With OpenCV the image stays a NumPy array from decoding
+    to the binarized output.
+
+    ``preset`` is a name from ``PRESETS`` ("fast", "balanced", "quality") or
+    a :class:`PreprocessPreset`; see :func:`_resolve_preset` for the default.
+    """
+    preset = _resolve_preset(preset)
+    with metrics.timed("ocr.decode"):
+        img = _load_gray(source, preset)
+    if _has_cv2():
+        gray = img
+        if preset.target_text_height:
+            with metrics.timed("ocr.resize"):
+                text_h = _estimate_text_height(gray)
+                if text_h and text_h > preset.target_text_height:
+                    scale = preset.target_text_height / text_h
+                    gray = cv2.resize(gray, (max(1, round(gray.shape[1] * scale)),
+                                             max(1, round(gray.shape[0] * scale))),
+                                      interpolation=cv2.INTER_AREA)
+        with metrics.timed("ocr.denoise"):
+            denoised = _denoise(gray, preset)
         # adaptive threshold helps with varied lighting
-        th = cv2.adaptiveThreshold(
-            denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
-        # morphological opening to reduce small noise
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 1))
-        opened = cv2.morphologyEx(th, cv2.MORPH_OPEN, kernel)
-        return opened
+        with metrics.timed("ocr.threshold"):
+            return cv2.adaptiveThreshold(
+                denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+            )
     else:
         # PIL-only fallback: enhance contrast, reduce noise, then threshold
-        img = ImageOps.autocontrast(img)
-        img = img.filter(ImageFilter.MedianFilter(size=3))
-        # simple threshold
-        img_l = img.convert("L")
-        img_t = img_l.point(lambda p: 255 if p > 160 else 0)
-        return img_t
+        with metrics.timed("ocr.pil_filter"):
+            img = ImageOps.autocontrast(img)
+            if preset.pil_median:
+                img = img.filter(ImageFilter.MedianFilter(size=preset.pil_median))
+            # simple threshold
+            return img.point(lambda p: 255 if p > 160 else 0)
+
+
+# kept for existing callers; accepts every source type preprocess_image does
+preprocess_image_bytes = preprocess_image
 
 
 # global OCR reader for EasyOCR (lazy-loaded)
 _reader = None
+# guards creation of the shared reader and the pool of extra readers below
+_reader_lock = threading.RLock()
+# an EasyOCR reader runs one call at a time; RECEIPT_EASYOCR_READERS > 1 adds
+# readers (each holds its own copy of the model) so that many calls can run at once
+_reader_free = threading.Condition(_reader_lock)
+_shared_reader_busy = False
+_extra_readers: List = []  # idle extra readers
+_extra_reader_count = 0
 
 def _get_easyocr_reader():
     global _reader
-    if _reader is None and HAS_EASYOCR:
-        _reader = easyocr.Reader(['en'], gpu=False)
+    if _reader is None and _has_easyocr():
+        with _reader_lock:
+            if _reader is None:
+                _reader = easyocr.Reader(['en'], gpu=False)
     return _reader
 
 
-def ocr_image_bytes(image_bytes: bytes) -> Tuple[str, dict]:
-    """Run OCR on image bytes and return raw text and optional detailed data.
-    
-    Tries EasyOCR first (pure Python, no system binaries), then Tesseract.
-    Returns fallback message if both fail.
+def _max_easyocr_readers() -> int:
+    return max(1, int(os.environ.get("RECEIPT_EASYOCR_READERS", "1")))
+
+
+@contextmanager
+def _easyocr_reader():
+    """Check out an EasyOCR reader for one call, waiting while all are busy (None if unavailable).
+
+    The shared reader is used first; up to ``RECEIPT_EASYOCR_READERS`` readers
+    in total are created on demand when concurrent calls need them.
     """
-    processed = preprocess_image_bytes(image_bytes)
-    # Convert to PIL Image
-    if HAS_CV2 and isinstance(processed, (np.ndarray,)):
-        pil = Image.fromarray(processed)
-    else:
-        pil = processed
-    
-    text = None
-    data = {}
-    
-    # Try EasyOCR first
-    if HAS_EASYOCR:
+    global _shared_reader_busy, _extra_reader_count
+    shared = _get_easyocr_reader()
+    if shared is None:
+        yield None
+        return
+    reader = new = None
+    with _reader_free:
+        while reader is None and not new:
+            if not _shared_reader_busy:
+                _shared_reader_busy, reader = True, shared
+            elif _extra_readers:
+                reader = _extra_readers.pop()
+            elif 1 + _extra_reader_count < _max_easyocr_readers():
+                _extra_reader_count += 1
+                new = True  # created outside the lock, the model takes seconds to load
+            else:
+                _reader_free.wait()
+    if new:
         try:
-            reader = _get_easyocr_reader()
-            if reader:
-                # EasyOCR expects numpy array
-                img_array = np.array(pil)
-                results = reader.readtext(img_array)
-                # extract text from results (list of tuples: ([bbox], text, confidence))
-                text_lines = [result[1] for result in results]
-                text = '\n'.join(text_lines)
-        except Exception as e:
-            import sys
-            print(f"EasyOCR failed: {e}", file=sys.stderr)
-    
-    # Try Tesseract as fallback
-    if not text:
+            reader = easyocr.Reader(['en'], gpu=False)
+        except BaseException:
+            with _reader_free:
+                _extra_reader_count -= 1
+                _reader_free.notify()
+            raise
+    try:
+        yield reader
+    finally:
+        with _reader_free:
+            if reader is shared:
+                _shared_reader_busy = False
+            else:
+                _extra_readers.append(reader)
+            _reader_free.notify()
+
+
+class OCRWord(NamedTuple):
+    """A single recognized word/region with its bounding box."""
+    text: str
+    conf: float  # 0-100, same scale as Tesseract
+    left: int
+    top: int
+    width: int
+    height: int
+
+
+@dataclass
+class OCRResult:
+    """Single-pass OCR output: text plus per-word boxes from whichever engine ran."""
+    text: str
+    words: List[OCRWord] = field(default_factory=list)
+    engine: str = ""
+
+    @cached_property
+    def data(self) -> dict:
+        """Tesseract ``image_to_data``-style dict, built lazily from ``words``."""
+        if not self.words:
+            return {}
+        keys = ("text", "conf", "left", "top", "width", "height")
+        return {k: [getattr(w, k) for w in self.words] for k in keys}
+
+    def to_dict(self) -> dict:
+        return {"text": self.text, "engine": self.engine, "words": [list(w) for w in self.words]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "OCRResult":
+        return cls(d["text"], [OCRWord(*w) for w in d.get("words", [])], d.get("engine", ""))
+
+
+_engine_signature_cache = None
+
+
+def _engine_signature() -> str:
+    """Versions of the installed OCR engines, computed once per process.
+
+    Package versions come from their metadata and Tesseract's from one
+    ``tesseract --version`` run, so no engine is imported or created.
+    """
+    global _engine_signature_cache
+    if _engine_signature_cache is None:
+        parts = [f"{dist}={_dist_version(dist)}" for dist in ("easyocr", "tesserocr")]
+        parts.append(f"tesseract={_tesseract_cli_version()}")
+        _engine_signature_cache = ";".join(parts)
+    return _engine_signature_cache
+
+
+def _dist_version(dist: str) -> str:
+    try:
+        return importlib.metadata.version(dist)
+    except importlib.metadata.PackageNotFoundError:
+        return "none"
+
+
+def _tesseract_cli_version() -> str:
+    """First line of ``tesseract --version`` for the configured binary ("none" if it cannot run)."""
+    _configure_tesseract()
+    cmd = getattr(getattr(pytesseract, "pytesseract", None), "tesseract_cmd", None) or "tesseract"
+    try:
+        out = subprocess.run([cmd, "--version"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return "none"
+    # older releases print the version to stderr
+    lines = (out.stdout or out.stderr).strip().splitlines()
+    return lines[0].strip() if lines else "none"
+
+
+def _preprocess_signature(preset: PreprocessPreset) -> str:
+    """Identifies the preprocessing pipeline so cache keys change with it."""
+    if _has_cv2():
+        return f"cv2-imdecode:adaptive-gauss11-2:{preset!r}"
+    return f"pil:autocontrast/th160:{preset!r}"
+
+
+try:
+    import fcntl
+except ImportError:  # Windows: eviction runs unlocked, races are tolerated
+    fcntl = None
+
+
+class OCRCache:
+    """Content-addressed on-disk cache of OCR results with LRU eviction.
+
+    Entries are keyed by a hash of the image bytes plus the preprocessing
+    pipeline and engine versions, and stored as small JSON files. Writes go
+    through a temp file and ``os.replace`` so concurrent readers never see a
+    partial entry; hits refresh the file mtime, which drives LRU eviction
+    once the directory grows past ``max_bytes``. Several processes can share
+    one directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, rescan_every: int = 200):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.rescan_every = rescan_every
+        self._approx_bytes = None
+        self._puts = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, source, preset=None, cascade: Optional[CascadeConfig] = None, tile=None) -> str:
+        """Cache key for any :func:`preprocess_image` source; a path hashes like its file's bytes."""
+        h = _source_hash(source)
+        h.update(b"\0" + _preprocess_signature(_resolve_preset(preset)).encode() + b"\0" + _engine_signature().encode())
+        if cascade is not None:
+            h.update(b"\0" + repr(cascade).encode())
+        if tile is not None:
+            h.update(b"\0" + repr(tile).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str, detail: bool = False) -> Optional[OCRResult]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if detail and not entry.get("detail"):
+            return None
         try:
-            if not pytesseract.pytesseract.tesseract_cmd:
-                pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-            text = pytesseract.image_to_string(pil)
+            os.utime(path)
+        except OSError:
+            pass
+        return OCRResult.from_dict(entry)
+
+    def put(self, key: str, result: OCRResult, detail: bool = False) -> None:
+        entry = result.to_dict()
+        entry["detail"] = detail or bool(result.words)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        self._puts += 1
+        if self._approx_bytes is None or self._puts % self.rescan_every == 0:
+            self._approx_bytes = None
+            self.evict()
+        else:
+            self._approx_bytes += size
+            if self._approx_bytes > self.max_bytes:
+                self.evict()
+
+    def _entries(self):
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self) -> None:
+        """Delete least-recently-used entries until the cache is below 90% of ``max_bytes``."""
+        lock = None
+        if fcntl is not None:
+            lock = open(os.path.join(self.directory, ".lock"), "w")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:  # another process is already evicting
+                lock.close()
+                self._approx_bytes = 0
+                return
+        try:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                target = self.max_bytes * 0.9
+                for _, size, path in entries:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+            self._approx_bytes = total
+        finally:
+            if lock is not None:
+                lock.close()
+
+
+def _source_hash(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return hashlib.sha256(mm)
+            except ValueError:  # empty file
+                return hashlib.sha256(b"")
+    if isinstance(source, Image.Image):
+        h = hashlib.sha256(f"pil:{source.mode}:{source.size}".encode())
+        h.update(source.tobytes())
+        return h
+    if _is_array(source):
+        _has_cv2()
+        arr = np.ascontiguousarray(source)
+        h = hashlib.sha256(f"array:{arr.dtype}:{arr.shape}".encode())
+        h.update(arr.data)
+        return h
+    return hashlib.sha256(source)
+
+
+_default_cache = None
+
+
+def get_default_cache() -> Optional[OCRCache]:
+    """Cache configured via ``RECEIPT_OCR_CACHE_DIR`` (and ``RECEIPT_OCR_CACHE_MB``), if any."""
+    global _default_cache
+    directory = os.environ.get("RECEIPT_OCR_CACHE_DIR")
+    if not directory:
+        return None
+    if _default_cache is None or _default_cache.directory != os.path.abspath(directory):
+        mb = float(os.environ.get("RECEIPT_OCR_CACHE_MB", "256"))
+        _default_cache = OCRCache(directory, max_bytes=int(mb * 1024 * 1024))
+    return _default_cache
+
+
+def _words_from_easyocr(results) -> List[OCRWord]:
+    words = []
+    for bbox, txt, conf in results:
+        xs = [int(p[0]) for p in bbox]
+        ys = [int(p[1]) for p in bbox]
+        words.append(OCRWord(txt, round(float(conf) * 100, 2), min(xs), min(ys),
+                             max(xs) - min(xs), max(ys) - min(ys)))
+    return words
+
+
+def _words_from_tesseract_data(d: dict) -> Tuple[str, List[OCRWord]]:
+    """Convert an ``image_to_data`` dict into words and line-joined text."""
+    words = []
+    lines = {}
+    for i, txt in enumerate(d.get("text", [])):
+        txt = (txt or "").strip()
+        if not txt:
+            continue
+        w = OCRWord(txt, float(d["conf"][i]), int(d["left"][i]), int(d["top"][i]),
+                    int(d["width"][i]), int(d["height"][i]))
+        words.append(w)
+        key = (d["block_num"][i], d["par_num"][i], d["line_num"][i])
+        lines.setdefault(key, []).append(txt)
+    text = "\n".join(" ".join(parts) for parts in lines.values())
+    return text, words
+
+
+class TesseractEngine(abc.ABC):
+    """Tesseract backend interface used by :func:`_tesseract_ocr` and the cascade.
+
+    ``read`` returns ``(text, words)``; words are only filled in when
+    ``detail`` is true. ``psm`` is Tesseract's page segmentation mode
+    (None = automatic) and ``timeout`` a per-call budget in seconds.
+    """
+    name = ""
+
+    @abc.abstractmethod
+    def read(self, image, detail: bool, psm: Optional[int] = None,
+             timeout: Optional[float] = None) -> Tuple[str, List[OCRWord]]:
+        """``image`` is a PIL image or a NumPy array."""
+
+    @abc.abstractmethod
+    def version(self) -> str:
+        """The Tesseract version string."""
+
+    def close(self) -> None:
+        pass
+
+
+class PytesseractEngine(TesseractEngine):
+    """The ``tesseract`` command line tool via pytesseract: one subprocess and temp file per call."""
+    name = "pytesseract"
+
+    def read(self, image, detail, psm=None, timeout=None):
+        tess = _tesseract()
+        config = f"--psm {psm}" if psm is not None else ""
+        if detail:
+            d = tess.image_to_data(image, config=config, output_type=tess.Output.DICT, timeout=timeout or 0)
+            return _words_from_tesseract_data(d)
+        return tess.image_to_string(image, config=config, timeout=timeout or 0), []
+
+    def version(self):
+        return str(_tesseract().get_tesseract_version())
+
+
+class TesserocrEngine(TesseractEngine):
+    """In-process Tesseract through tesserocr, with a pool of initialized API handles.
+
+    Each handle loads the language data once; images are handed over as
+    in-memory buffers, so there is no process spawn or temp file per call.
+    Up to ``pool_size`` handles are created on demand and shared by threads.
+    """
+    name = "tesserocr"
+
+    def __init__(self, pool_size: int = 4, lang: str = "eng", path: Optional[str] = None):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.pool_size = pool_size
+        self.lang = lang
+        self.path = path or _tessdata_dir()
+        self._pool: "queue.LifoQueue" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._pool.put(self._new_api())  # fail fast if tessdata is missing
+
+    def _new_api(self):
+        kwargs = {"lang": self.lang}
+        if self.path:
+            kwargs["path"] = self.path
+        api = self._tesserocr.PyTessBaseAPI(**kwargs)
+        self._created += 1
+        return api
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                return self._new_api()
+        return self._pool.get()
+
+    @staticmethod
+    def _set_image(api, image):
+        # raw pixels via SetImageBytes: SetImage(PIL) would re-encode the image first
+        if isinstance(image, Image.Image):
+            if image.mode not in ("L", "RGB"):
+                image = image.convert("L")
+            (w, h), bpp, data = image.size, len(image.getbands()), image.tobytes()
+        else:
+            arr = np.ascontiguousarray(image)
+            h, w = arr.shape[:2]
+            bpp = 1 if arr.ndim == 2 else arr.shape[2]
+            data = arr.tobytes()
+        api.SetImageBytes(data, w, h, bpp, w * bpp)
+
+    def read(self, image, detail, psm=None, timeout=None):
+        tr = self._tesserocr
+        api = self._acquire()
+        try:
+            api.SetPageSegMode(tr.PSM.AUTO if psm is None else psm)
+            self._set_image(api, image)
+            if not api.Recognize(int(timeout * 1000) if timeout else 0):
+                raise RuntimeError("Tesseract recognition failed or timed out")
+            if not detail:
+                return api.GetUTF8Text(), []
+            words, lines = [], []
+            level = tr.RIL.WORD
+            for r in tr.iterate_level(api.GetIterator(), level):
+                txt = (r.GetUTF8Text(level) or "").strip()
+                if not txt:
+                    continue
+                if not lines or r.IsAtBeginningOf(tr.RIL.TEXTLINE):
+                    lines.append([])
+                x1, y1, x2, y2 = r.BoundingBox(level)
+                words.append(OCRWord(txt, float(r.Confidence(level)), x1, y1, x2 - x1, y2 - y1))
+                lines[-1].append(txt)
+            return "\n".join(" ".join(parts) for parts in lines), words
+        finally:
+            api.Clear()
+            self._pool.put(api)
+
+    def version(self):
+        return f"{self._tesserocr.tesseract_version().split()[1]}"
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().End()
+            except queue.Empty:
+                return
+
+
+def _tessdata_dir() -> Optional[str]:
+    prefix = os.environ.get("TESSDATA_PREFIX")
+    if prefix and os.path.basename(os.path.normpath(prefix)) != "tessdata" \
+            and os.path.isdir(os.path.join(prefix, "tessdata")):
+        prefix = os.path.join(prefix, "tessdata")
+    return prefix
+
+
+TESSERACT_BACKENDS = ("auto", "tesserocr", "pytesseract")
+_tess_engine: Optional[TesseractEngine] = None
+_tess_engine_lock = threading.Lock()
+
+
+def _tesseract_engine() -> TesseractEngine:
+    """Backend picked by ``RECEIPT_TESSERACT_BACKEND`` (default ``auto``), created once.
+
+    ``auto`` uses the pooled in-process tesserocr backend when tesserocr and
+    its language data are available and falls back to pytesseract otherwise.
+    ``RECEIPT_TESSERACT_POOL`` caps the number of tesserocr handles.
+    """
+    global _tess_engine
+    if _tess_engine is None:
+        with _tess_engine_lock:
+            if _tess_engine is None:
+                _tess_engine = make_tesseract_engine(os.environ.get("RECEIPT_TESSERACT_BACKEND", "auto"))
+    return _tess_engine
+
+
+def make_tesseract_engine(backend: str = "auto", pool_size: Optional[int] = None) -> TesseractEngine:
+    if backend not in TESSERACT_BACKENDS:
+        raise ValueError(f"unknown Tesseract backend {backend!r}; choose from {TESSERACT_BACKENDS}")
+    if backend in ("auto", "tesserocr"):
+        _configure_tesseract()  # may point TESSDATA_PREFIX at a discovered install
+        if pool_size is None:
+            pool_size = int(os.environ.get("RECEIPT_TESSERACT_POOL", min(4, os.cpu_count() or 1)))
+        try:
+            return TesserocrEngine(pool_size)
+        except ImportError:
+            if backend == "tesserocr":
+                raise
         except Exception as e:
-            import sys
-            print(f"Tesseract failed: {e}", file=sys.stderr)
-    
-    # Final fallback message
-    if not text:
-        text = "(OCR unavailable — install EasyOCR or Tesseract)"
-    
+            if backend == "tesserocr":
+                raise
+            metrics.inc("ocr_fallback_total", **{"from": "tesserocr", "to": "pytesseract"})
+            logger.warning("tesserocr unavailable, using pytesseract: %s", e)
+    return PytesseractEngine()
+
+
+def _resolve_tile(tile=None):
+    """Tiling config for :func:`ocr_image`; the tiling module is only imported when it is on."""
+    if tile is False or (tile is None and os.environ.get("RECEIPT_OCR_TILE", "") in ("", "0")):
+        return None
+    from .tiling import _resolve_tile as resolve
+    return resolve(tile)
+
+
+def ocr_image(image_bytes, detail: bool = False, cache: Optional[OCRCache] = None,
+              preset=None, cascade=None, tile=None) -> OCRResult:
+    """Run OCR once and return an :class:`OCRResult`.
+
+    ``image_bytes`` may be any source :func:`preprocess_image` accepts:
+    encoded bytes or another buffer (e.g. an mmap), a file path, a PIL image
+    or a NumPy array. Paths are memory-mapped, not read into memory.
+
+    Tries EasyOCR first (pure Python, no system binaries), then Tesseract.
+    EasyOCR always yields word boxes for free; for Tesseract the boxes are
+    opt-in via ``detail`` (``image_to_data`` instead of ``image_to_string``),
+    so plain-text callers never pay for a second recognition pass.
+
+    ``cache`` defaults to :func:`get_default_cache`; a hit returns before
+    the image is even decoded. ``preset`` selects the preprocessing preset.
+    ``cascade`` (a :class:`CascadeConfig`, or True for the defaults; see
+    ``RECEIPT_OCR_CASCADE``) re-reads only the low-confidence regions with
+    the second engine instead of using it as a whole-image fallback.
+    ``tile`` (a :class:`~receipt_analyzer.tiling.TileConfig`, or True; see
+    ``RECEIPT_OCR_TILE``) OCRs very tall scans as overlapping strips in
+    parallel; smaller images are unaffected.
+
+    If ``RECEIPT_OCR_SERVER`` is set, the request goes to that shared OCR
+    service (see :mod:`receipt_analyzer.ocr_server`) instead, falling back
+    to local OCR if it fails. The service uses its own cache and cascade
+    setting and does not tile, so ``cache``, ``cascade`` and ``tile`` only
+    apply to that fallback (a warning says so when they are given).
+    """
+    server = os.environ.get("RECEIPT_OCR_SERVER")
+    if server:
+        from .ocr_server import OCRClient
+        ignored = [n for n, v in (("cache", cache), ("cascade", cascade), ("tile", tile)) if v is not None]
+        if ignored:
+            logger.warning("OCR server %s ignores %s; they only apply to local OCR", server, ", ".join(ignored))
+        try:
+            return OCRClient(server).ocr(_source_bytes(image_bytes), detail, preset)
+        except (OSError, RuntimeError, ValueError) as e:
+            # unreachable or timed out (URLError is an OSError), a server error, or a request it
+            # rejected; local OCR raises its own error if the input itself is bad
+            metrics.inc("ocr_fallback_total", **{"from": "server", "to": "local"})
+            logger.warning("OCR server %s failed, running OCR locally: %s", server, e)
+    preset = _resolve_preset(preset)
+    cascade = _resolve_cascade(cascade)
+    tile = _resolve_tile(tile)
+    if cache is None:
+        cache = get_default_cache()
+    if cache is not None:
+        with metrics.timed("ocr.cache_lookup"):
+            key = cache.key(image_bytes, preset, cascade, tile)
+            hit = cache.get(key, detail)
+        metrics.inc("ocr_cache_total", result="hit" if hit is not None else "miss")
+        if hit is not None:
+            return hit
+        result = _run_ocr(image_bytes, detail, preset, cascade, tile)
+        if result.engine:  # don't cache the "OCR unavailable" placeholder
+            cache.put(key, result, detail)
+        return result
+    return _run_ocr(image_bytes, detail, preset, cascade, tile)
+
+
+def _run_ocr(image_bytes, detail: bool, preset: PreprocessPreset,
+             cascade: Optional[CascadeConfig] = None, tile=None) -> OCRResult:
+    if tile is not None:
+        from . import tiling
+        if tiling.should_tile(tiling.image_size(image_bytes), tile):
+            return tiling.ocr_tiled(image_bytes, tile, preset, cascade)
+    return _recognize_batch([preprocess_image(image_bytes, preset)], [detail], cascade)[0]
+
+
+def _as_pil(processed) -> Image.Image:
+    if _has_cv2() and isinstance(processed, (np.ndarray,)):
+        return Image.fromarray(processed)
+    return processed
+
+
+def _image_size(img) -> Tuple[int, int]:
+    """``(width, height)`` of a PIL image or an array."""
+    return img.size if isinstance(img, Image.Image) else (img.shape[1], img.shape[0])
+
+
+def _crop(img, box: Tuple[int, int, int, int]):
+    """Crop ``(left, top, right, bottom)``; arrays are cropped as views, without copying."""
+    if isinstance(img, Image.Image):
+        return img.crop(box)
+    return img[box[1]:box[3], box[0]:box[2]]
+
+
+def _tesseract_ocr(image, detail: bool, timeout: Optional[float] = None) -> Optional[OCRResult]:
     try:
-        data = pytesseract.image_to_data(pil, output_type=pytesseract.Output.DICT)
-    except Exception:
-        data = {}
-    return text, data
+        engine = _tesseract_engine()
+        with metrics.timed("ocr.tesseract_data" if detail else "ocr.tesseract"):
+            text, words = engine.read(image, detail, timeout=timeout)
+        if text:
+            return OCRResult(text, words, "tesseract")
+    except Exception as e:
+        metrics.inc("ocr_errors_total", engine="tesseract")
+        logger.warning("Tesseract failed: %s", e)
+    return None
+
+
+def _easyocr_result(results) -> Optional[OCRResult]:
+    # results are a list of tuples: ([bbox], text, confidence)
+    text = '\n'.join(result[1] for result in results)
+    if text:
+        return OCRResult(text, _words_from_easyocr(results), "easyocr")
+    return None
+
+
+# a batch is padded to its largest image; start a new batch past this much padded area
+_BATCH_PAD_LIMIT = 1.5
+
+
+def _batch_groups(arrays: List) -> List[List[int]]:
+    """Indices of ``arrays`` grouped for batched recognition, similar sizes together.
+
+    Images are sorted by size and a group grows while padding all of its
+    images to the group's largest height and width stays within
+    :data:`_BATCH_PAD_LIMIT` times their own area. Only images with the same
+    channel layout share a group.
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    h = w = area = 0
+    for i in sorted(range(len(arrays)), key=lambda i: (arrays[i].shape[2:], arrays[i].shape[:2])):
+        ih, iw = arrays[i].shape[:2]
+        nh, nw = max(h, ih), max(w, iw)
+        same_layout = not current or arrays[current[0]].shape[2:] == arrays[i].shape[2:]
+        if current and (not same_layout or nh * nw * (len(current) + 1) > _BATCH_PAD_LIMIT * (area + ih * iw)):
+            groups.append(current)
+            current, nh, nw, area = [], ih, iw, 0
+        current.append(i)
+        h, w, area = nh, nw, area + ih * iw
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _pad_to(arr, height: int, width: int):
+    """Pad an image array with white at the bottom and right (word boxes keep their coordinates)."""
+    if arr.shape[:2] == (height, width):
+        return arr
+    pad = [(0, height - arr.shape[0]), (0, width - arr.shape[1])] + [(0, 0)] * (arr.ndim - 2)
+    return np.pad(arr, pad, constant_values=255)
+
+
+def _easyocr_batch(images: List) -> List[Optional[OCRResult]]:
+    """EasyOCR over several images; similar-sized ones are padded to a common shape and batched."""
+    results: List[Optional[OCRResult]] = [None] * len(images)
+    if not images or not _has_easyocr():
+        return results
+    try:
+        with _easyocr_reader() as reader:
+            if not reader:
+                return results
+            # EasyOCR expects numpy arrays; preprocessed arrays pass through uncopied
+            arrays = [np.asarray(p) for p in images]
+            with metrics.timed("ocr.easyocr"):
+                for idxs in _batch_groups(arrays):
+                    if len(idxs) > 1 and hasattr(reader, "readtext_batched"):
+                        height = max(arrays[i].shape[0] for i in idxs)
+                        width = max(arrays[i].shape[1] for i in idxs)
+                        batch = reader.readtext_batched([_pad_to(arrays[i], height, width) for i in idxs])
+                    else:
+                        batch = [reader.readtext(arrays[i]) for i in idxs]
+                    for i, res in zip(idxs, batch):
+                        results[i] = _easyocr_result(res)
+    except Exception as e:
+        metrics.inc("ocr_errors_total", engine="easyocr")
+        logger.warning("EasyOCR failed: %s", e)
+    return results
+
+
+def _unavailable() -> OCRResult:
+    return OCRResult("(OCR unavailable — install EasyOCR or Tesseract)")
+
+
+def _recognize(processed, detail: bool) -> OCRResult:
+    """Recognize an already preprocessed image: EasyOCR first, then Tesseract."""
+    return _recognize_batch([processed], [detail])[0]
+
+
+def _recognize_batch(processed: List, details: List[bool],
+                     cascade: Optional[CascadeConfig] = None) -> List[OCRResult]:
+    """Recognize several preprocessed images in one go.
+
+    Similar-sized images are padded to a common shape and go through
+    EasyOCR's batched recognizer together; anything EasyOCR could not read
+    falls back to Tesseract one by one.
+    With a ``cascade``, its primary engine reads every image (with word
+    confidences) and :func:`_cascade_refine` re-reads the weak regions.
+    """
+    images = list(processed)  # arrays (OpenCV) or PIL images, used as they are by both engines
+
+    if cascade is not None and cascade.primary == "tesseract":
+        results = [_tesseract_ocr(p, True, cascade.primary_budget) for p in images]
+        missing = [i for i, r in enumerate(results) if r is None]
+        for i, r in zip(missing, _easyocr_batch([images[i] for i in missing])):
+            if r is not None:
+                metrics.inc("ocr_fallback_total", **{"from": "tesseract", "to": "easyocr"})
+            results[i] = r
+    else:
+        start = time.monotonic()
+        results = _easyocr_batch(images)
+        primary_seconds = time.monotonic() - start
+        # Try Tesseract as fallback
+        for i, r in enumerate(results):
+            if r is None:
+                if _has_easyocr():
+                    metrics.inc("ocr_fallback_total", **{"from": "easyocr", "to": "tesseract"})
+                results[i] = _tesseract_ocr(images[i], details[i])
+        if cascade is not None and cascade.primary_budget and primary_seconds > cascade.primary_budget:
+            metrics.inc("ocr_budget_exceeded_total", engine="easyocr")
+            cascade = None  # already over budget: keep the first reading as is
+
+    if cascade is not None:
+        results = [_cascade_refine(img, r, cascade) if r is not None and r.engine == cascade.primary else r
+                   for img, r in zip(images, results)]
+
+    # Final fallback message
+    results = [r if r is not None else _unavailable() for r in results]
+    if metrics.enabled():
+        for r in results:
+            metrics.inc("ocr_engine_total", engine=r.engine or "none")
+    return results
+
+
+def _words_to_text(words: List[OCRWord]) -> str:
+    """Join word boxes into text lines: boxes whose vertical centres are within
+    half a box height of a line's first box share that line, read left to right."""
+    lines = []  # [centre_y, height, words]
+    for w in sorted(words, key=lambda w: w.top + w.height / 2):
+        cy = w.top + w.height / 2
+        if lines and abs(cy - lines[-1][0]) <= max(lines[-1][1], w.height) / 2:
+            lines[-1][2].append(w)
+        else:
+            lines.append([cy, w.height, [w]])
+    return "\n".join(" ".join(w.text for w in sorted(ws, key=lambda w: w.left)) for _, _, ws in lines)
+
+
+def _recognize_region(crop, engine: str, timeout: Optional[float]) -> Optional[Tuple[str, float]]:
+    """Re-read one cropped region as a single text line: ``(text, conf)`` or None."""
+    if engine == "tesseract":
+        try:
+            with metrics.timed("ocr.tesseract_region"):
+                _, words = _tesseract_engine().read(crop, True, psm=7, timeout=timeout)
+        except Exception as e:  # includes the budget timeout
+            metrics.inc("ocr_errors_total", engine="tesseract")
+            logger.warning("Tesseract failed on region: %s", e)
+            return None
+        words = [w for w in words if w.conf >= 0]
+        if not words:
+            return None
+        return " ".join(w.text for w in words), sum(w.conf for w in words) / len(words)
+    res = _easyocr_batch([crop])[0]
+    if res is None or not res.words:
+        return None
+    return " ".join(w.text for w in res.words), sum(w.conf for w in res.words) / len(res.words)
+
+
+def _cascade_refine(image, result: OCRResult, cascade: CascadeConfig) -> OCRResult:
+    """Re-read the low-confidence words of ``result`` with the secondary engine.
+
+    Each weak word box is cropped from the same preprocessed image and
+    re-recognized as a single line; the more confident reading wins. The
+    merged words are re-joined into lines by their bounding boxes.
+    """
+    words = list(result.words)
+    weak = sorted((i for i, w in enumerate(words) if w.conf < cascade.min_conf),
+                  key=lambda i: words[i].conf)[:cascade.max_regions]
+    replaced = 0
+    width, height = _image_size(image)
+    deadline = time.monotonic() + cascade.secondary_budget if cascade.secondary_budget else None
+    with metrics.timed("ocr.cascade"):
+        for n, i in enumerate(weak):
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                metrics.inc("ocr_budget_exceeded_total", engine=cascade.secondary)
+                metrics.inc("ocr_cascade_regions_total", len(weak) - n, result="skipped")
+                break
+            w = words[i]
+            box = (max(0, w.left - cascade.pad), max(0, w.top - cascade.pad),
+                   min(width, w.left + w.width + cascade.pad), min(height, w.top + w.height + cascade.pad))
+            if box[2] <= box[0] or box[3] <= box[1]:
+                continue
+            reading = _recognize_region(_crop(image, box), cascade.secondary, remaining)
+            if reading is not None and reading[0] and reading[1] > w.conf:
+                words[i] = w._replace(text=reading[0], conf=reading[1])
+                replaced += 1
+                metrics.inc("ocr_cascade_regions_total", result="replaced")
+            else:
+                metrics.inc("ocr_cascade_regions_total", result="kept")
+    engine = f"{result.engine}+{cascade.secondary}" if replaced else result.engine
+    return OCRResult(_words_to_text(words) or result.text, words, engine)
+
+
+def ocr_image_bytes(image_bytes, detail: bool = False,
+                    cache: Optional[OCRCache] = None, preset=None, cascade=None,
+                    tile=None) -> Tuple[str, dict]:
+    """Run OCR on an image (bytes, path, PIL image or array) and return raw text and optional detailed data.
+
+    ``data`` is derived from the same OCR pass (see :func:`ocr_image`); with
+    the Tesseract engine it is only populated when ``detail`` is true.
+    """
+    result = ocr_image(image_bytes, detail=detail, cache=cache, preset=preset, cascade=cascade, tile=tile)
+    return result.text, result.data
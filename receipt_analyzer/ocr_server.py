@@ -0,0 +1,280 @@
+"""Long-lived local OCR service sharing one warm engine between processes.
+
+Start it once::
+
+    python -m receipt_analyzer.ocr_server --port 8765 --max-batch 8 --max-wait-ms 10
+
+and point clients at it with ``RECEIPT_OCR_SERVER=http://127.0.0.1:8765``
+(picked up by :func:`receipt_analyzer.ocr.ocr_image`) or :class:`OCRClient`.
+
+Requests are preprocessed in the HTTP handler threads (in parallel), then
+queued for a single recognizer thread that drains up to ``max_batch``
+images, waiting at most ``max_wait`` seconds for a batch to fill, and runs
+them through the engine together. Only the standard library is used.
+"""
+import argparse
+import dataclasses
+import functools
+import json
+import queue
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+from PIL import UnidentifiedImageError
+
+from . import metrics, ocr
+from .ocr import OCRResult
+
+
+class _Job:
+    __slots__ = ("processed", "detail", "result", "error", "done")
+
+    def __init__(self, processed, detail: bool):
+        self.processed = processed
+        self.detail = detail
+        self.result: Optional[OCRResult] = None
+        self.error: Optional[BaseException] = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """Queue of preprocessed images drained in batches by one worker thread."""
+
+    def __init__(self, recognize_batch: Callable[[List, List[bool]], List[OCRResult]] = None,
+                 max_batch: int = 8, max_wait: float = 0.01, max_queue: int = 256):
+        self.recognize_batch = recognize_batch or ocr._recognize_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue: "queue.Queue[Optional[_Job]]" = queue.Queue(max_queue)
+        self.batches = 0
+        self.images = 0
+        self._thread = threading.Thread(target=self._run, name="ocr-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, processed, detail: bool = False, timeout: Optional[float] = None) -> OCRResult:
+        job = _Job(processed, detail)
+        self.queue.put(job, timeout=timeout)
+        if not job.done.wait(timeout):
+            raise TimeoutError("OCR request timed out")
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def close(self):
+        self.queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    job = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    stop = True
+                    break
+                batch.append(job)
+            try:
+                results = self.recognize_batch([j.processed for j in batch], [j.detail for j in batch])
+                for job, res in zip(batch, results):
+                    job.result = res
+            except BaseException as e:
+                for job in batch:
+                    job.error = e
+            self.batches += 1
+            self.images += len(batch)
+            for job in batch:
+                job.done.set()
+            if stop:
+                return
+
+
+class OCRServer(ThreadingHTTPServer):
+    """HTTP front end: ``POST /ocr`` with the raw image as body, ``GET /health``
+    and ``GET /metrics`` (Prometheus text; empty unless metrics are enabled).
+
+    Query parameters for ``/ocr``: ``detail=1`` for word boxes and
+    ``preset=<name>`` for the preprocessing preset. The response is
+    :meth:`OCRResult.to_dict` as JSON.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, batcher: MicroBatcher, preset=None, request_timeout: float = 120.0,
+                 cascade: Optional[ocr.CascadeConfig] = None):
+        super().__init__(address, _Handler)
+        self.batcher = batcher
+        self.preset = preset
+        self.request_timeout = request_timeout
+        self.cascade = cascade  # only used for cache keys; the batcher applies it
+
+    def ocr(self, image_bytes: bytes, detail: bool = False, preset=None) -> OCRResult:
+        preset = ocr._resolve_preset(preset or self.preset)
+        cache = ocr.get_default_cache()
+        key = None
+        if cache is not None:
+            key = cache.key(image_bytes, preset, self.cascade)
+            hit = cache.get(key, detail)
+            if hit is not None:
+                return hit
+        processed = ocr.preprocess_image_bytes(image_bytes, preset)
+        result = self.batcher.submit(processed, detail, timeout=self.request_timeout)
+        if cache is not None and result.engine:
+            cache.put(key, result, detail)
+        return result
+
+
+def _custom_preset(fields: str) -> "ocr.PreprocessPreset":
+    """A preset sent field by field by :meth:`OCRClient.ocr`."""
+    try:
+        return ocr.PreprocessPreset(**json.loads(fields))
+    except TypeError as e:  # unknown or missing fields
+        raise ValueError(f"bad preprocessing preset: {e}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: OCRServer
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/metrics":
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        b = self.server.batcher
+        self._send_json(200, {"ok": True, "batches": b.batches, "images": b.images,
+                              "queued": b.queue.qsize()})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path != "/ocr":
+            self._send_json(404, {"error": "not found"})
+            return
+        params = urllib.parse.parse_qs(url.query)
+        detail = params.get("detail", ["0"])[0] in ("1", "true", "yes")
+        preset = params.get("preset", [None])[0]
+        try:
+            if preset is not None and preset.startswith("{"):
+                preset = _custom_preset(preset)
+            image_bytes = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            result = self.server.ocr(image_bytes, detail, preset)
+        except (ValueError, UnidentifiedImageError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._send_json(200, result.to_dict())
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class OCRClient:
+    """Thin client for :class:`OCRServer`."""
+
+    def __init__(self, url: str, timeout: float = 120.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def ocr(self, image_bytes: bytes, detail: bool = False, preset=None) -> OCRResult:
+        """OCR on the server; a :class:`~receipt_analyzer.ocr.PreprocessPreset` not in
+        ``ocr.PRESETS`` is sent field by field."""
+        query = {"detail": "1" if detail else "0"}
+        if isinstance(preset, str):
+            query["preset"] = preset
+        elif preset is not None:
+            known = ocr.PRESETS.get(preset.name) == preset
+            query["preset"] = preset.name if known else json.dumps(dataclasses.asdict(preset))
+        req = urllib.request.Request(f"{self.url}/ocr?{urllib.parse.urlencode(query)}", data=image_bytes,
+                                     method="POST", headers={"Content-Type": "application/octet-stream"})
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return OCRResult.from_dict(json.loads(resp.read().decode("utf-8")))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            if e.code == 400:
+                raise ValueError(message)
+            raise RuntimeError(f"OCR server error {e.code}: {message}")
+
+    def health(self) -> dict:
+        with urllib.request.urlopen(f"{self.url}/health", timeout=self.timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, max_batch: int = 8, max_wait: float = 0.01,
+          preset=None, warm: bool = True, cascade=None) -> OCRServer:
+    """Create a server (engines loaded up front when ``warm``); call ``serve_forever()`` on it.
+
+    ``cascade`` is applied to every request (see :class:`ocr.CascadeConfig`).
+    """
+    if warm:
+        ocr._configure_tesseract()
+        ocr._get_easyocr_reader()
+    cascade = ocr._resolve_cascade(cascade)
+    batcher = MicroBatcher(functools.partial(ocr._recognize_batch, cascade=cascade),
+                           max_batch=max_batch, max_wait=max_wait)
+    return OCRServer((host, port), batcher, preset=preset, cascade=cascade)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local OCR service with a warm engine and micro-batching")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--max-batch", type=int, default=8, help="max images per recognizer batch")
+    ap.add_argument("--max-wait-ms", type=float, default=10.0, help="max time to wait for a batch to fill")
+    ap.add_argument("--preset", choices=sorted(ocr.PRESETS), help="default preprocessing preset")
+    ap.add_argument("--metrics", action="store_true", help="record stage timings, served at /metrics")
+    ap.add_argument("--cascade", action="store_true",
+                    help="re-read low-confidence regions with the second engine (RECEIPT_OCR_CASCADE)")
+    args = ap.parse_args(argv)
+
+    if args.metrics:
+        metrics.enable()
+
+    server = serve(args.host, args.port, args.max_batch, args.max_wait_ms / 1000.0, args.preset,
+                   cascade=args.cascade or None)
+    print(f"OCR server listening on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import datetime as _dt
 import re
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from . import metrics
+from .models import Item, Receipt
 
 
 NUM_RE = re.compile(r"\d+[\d,\.]*")
@@ -24,117 +28,171 @@ HEADER_FOOTER_PATTERNS = [
 ]
 
 
+MONTH_ABBREVIATIONS = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+
+# All "not an item line" checks folded into one regex, run once per line on
+# the lowercased text: header/footer words, years 2000-2049, month names and
+# numeric runs of 7+ digits (phone numbers, invoice ids). Time stamps
+# ("11:37 am") are covered by the "am"/"pm" header patterns.
+_HEADER_FOOTER_RE = re.compile("|".join(re.escape(p) for p in HEADER_FOOTER_PATTERNS))
+_DATE_RE = re.compile(r"20[0-4][0-9]|" + "|".join(MONTH_ABBREVIATIONS))
+_LONG_NUMBER_RE = re.compile(r"(?:\d[,\.]*){7}")
+_SKIP_RE = re.compile("|".join(r.pattern for r in (_HEADER_FOOTER_RE, _DATE_RE, _LONG_NUMBER_RE)))
+_NUMERIC_LINE_RE = re.compile(r'^[\d\.,\s%]+$')
+
+# line kinds
+_TEXT, _TEXT_WITH_NUMBER, _NUMERIC = 0, 1, 2
+
+
 def _is_date_or_time(line: str) -> bool:
     """Check if line contains date/time patterns (like '11:37 AM', 'Feb 2026', etc)."""
     s = line.lower()
-    # check for time patterns (HH:MM AM/PM)
+    # time patterns (HH:MM AM/PM)
     if ':' in s and ('am' in s or 'pm' in s):
         return True
-    # check for year patterns (like 2026, 2025, etc)
-    if any(f"{year}" in s for year in range(2000, 2050)):
-        return True
-    # check for month abbreviations
-    months = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
-    if any(m in s for m in months):
-        return True
-    return False
+    return _DATE_RE.search(s) is not None
 
 
 def _is_header_footer(line: str) -> bool:
-    s = line.lower()
-    # skip lines that are clearly not item lines
-    for p in HEADER_FOOTER_PATTERNS:
-        if p in s:
-            return True
-    # skip lines that are long numeric sequences (phone numbers, invoice ids)
-    nums = NUM_RE.findall(line)
-    for n in nums:
-        if len(n.replace(',', '').replace('.', '')) >= 7:
-            return True
-    return False
+    return _HEADER_FOOTER_RE.search(line.lower()) is not None or _LONG_NUMBER_RE.search(line) is not None
 
 
-def parse_items_from_text(text: str) -> List[Dict]:
-    """Parse OCR text into items, handling multi-line formats.
-    
+def _classify_lines(lines: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    """Strip, filter and classify each line exactly once."""
+    for line in lines:
+        line = line.strip()
+        if not line or _SKIP_RE.search(line.lower()):
+            continue
+        if _NUMERIC_LINE_RE.match(line):
+            yield line, _NUMERIC
+        elif NUM_RE.search(line):
+            yield line, _TEXT_WITH_NUMBER
+        else:
+            yield line, _TEXT
+
+
+def iter_items(lines: Iterable[str]) -> Iterator[Dict]:
+    """Legacy-dict view of :func:`iter_item_models`."""
+    for item in iter_item_models(lines):
+        yield item.to_dict()
+
+
+def iter_item_models(lines: Iterable[str]) -> Iterator[Item]:
+    """Stream :class:`Item` objects from an iterable of OCR lines (a list, a file object, ...).
+
     Handles formats where item info is split across multiple lines:
     - Name
     - Category/Extra info
     - Numbers (Qty, Price, Total)
+
+    Text lines are collected as the item name until a line with numbers:
+    a mixed text+number line closes the item and also starts the next one,
+    while consecutive pure-number lines are attached to the current item.
     """
-    items: List[Dict] = []
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    
-    # Filter out header/footer lines
-    cleaned_lines = []
-    for line in lines:
-        if _is_header_footer(line):
-            continue
-        if _is_date_or_time(line):
+    name_parts: Optional[List[str]] = None
+    num_lines: List[str] = []
+    for line, kind in _classify_lines(lines):
+        if name_parts is None:
+            # skip pure number lines (subtotals, standalone amounts) between items
+            if kind != _NUMERIC:
+                name_parts = [line]
             continue
-        cleaned_lines.append(line)
-    
-    # Group lines: collect name lines until we hit numbers
-    i = 0
-    while i < len(cleaned_lines):
-        line = cleaned_lines[i]
-        
-        # Skip pure number lines (subtotals, standalone amounts)
-        if re.match(r'^[\d\.,\s%]+$', line):
-            i += 1
+        if kind == _NUMERIC:
+            num_lines.append(line)
             continue
-        
-        # Check if this is a subtotal/total line (has word + numbers)
-        line_lower = line.lower()
-        if any(kw in line_lower for kw in ['subtotal', 'total', 'gst', 'payment']):
-            i += 1
+        if not num_lines and kind == _TEXT:
+            name_parts.append(line)
             continue
-        
-        # Start collecting an item
-        name_parts = [line]
-        i += 1
-        
-        # Collect additional text lines (categories, units, etc)
-        while i < len(cleaned_lines) and re.match(r'^[\d\.,\s%]+$', cleaned_lines[i]) == None:
-            next_line = cleaned_lines[i]
-            next_lower = next_line.lower()
-            # Skip if next line is subtotal/total
-            if any(kw in next_lower for kw in ['subtotal', 'total', 'gst', 'payment']):
-                break
-            # Check if next line is text or numbers
-            nums = NUM_RE.findall(next_line)
-            if nums:
-                # Has numbers, could be part of this item
-                name_parts.append(next_line)
-                break
-            else:
-                # Just text, add to name
-                name_parts.append(next_line)
-                i += 1
-        
-        # Now collect all consecutive number lines
-        num_lines = []
-        while i < len(cleaned_lines) and re.match(r'^[\d\.,\s%]+$', cleaned_lines[i]):
-            num_lines.append(cleaned_lines[i])
-            i += 1
-        
-        # Parse this item if we have name and numbers
-        if name_parts and num_lines:
-            full_line = ' '.join(name_parts + num_lines)
-            parsed = _parse_single_item(full_line)
-            if parsed:
-                items.append(parsed)
-        elif name_parts:
-            # Try to parse name_parts as a single line
-            full_line = ' '.join(name_parts)
-            parsed = _parse_single_item(full_line)
-            if parsed:
-                items.append(parsed)
-    
+        if not num_lines:  # _TEXT_WITH_NUMBER closes the current name
+            name_parts.append(line)
+        parsed = _parse_line(' '.join(name_parts + num_lines))
+        if parsed:
+            yield parsed
+        name_parts, num_lines = [line], []
+    if name_parts is not None:
+        parsed = _parse_line(' '.join(name_parts + num_lines))
+        if parsed:
+            yield parsed
+
+
+def parse_items_from_text(text: str) -> List[Dict]:
+    """Parse OCR text into items, handling multi-line formats (see :func:`iter_items`)."""
+    with metrics.timed("parse"):
+        items = list(iter_items(text.splitlines()))
+    metrics.inc("items_total", len(items), stage="parse")
     return items
 
 
-def _parse_single_item(line: str) -> Dict:
+_ISO_DATE_RE = re.compile(r"\b(20\d\d)[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4}|\d{2})\b")
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})\s+(" + "|".join(MONTH_ABBREVIATIONS) + r")[a-z]*\.?,?\s+(20\d\d)\b")
+_MONTH_DAY_RE = re.compile(r"\b(" + "|".join(MONTH_ABBREVIATIONS) + r")[a-z]*\.?\s+(\d{1,2}),?\s+(20\d\d)\b")
+
+
+def _date_in_line(line: str) -> Optional[_dt.date]:
+    m = _ISO_DATE_RE.search(line)
+    if m:
+        return _dt.date(int(m[1]), int(m[2]), int(m[3]))
+    m = _NUMERIC_DATE_RE.search(line)
+    if m:
+        a, b, year = int(m[1]), int(m[2]), int(m[3])
+        year += 2000 if year < 100 else 0
+        # month first (US receipts) unless the first number cannot be a month
+        return _dt.date(year, b, a) if a > 12 else _dt.date(year, a, b)
+    m = _DAY_MONTH_RE.search(line)
+    if m:
+        return _dt.date(int(m[3]), MONTH_ABBREVIATIONS.index(m[2]) + 1, int(m[1]))
+    m = _MONTH_DAY_RE.search(line)
+    if m:
+        return _dt.date(int(m[3]), MONTH_ABBREVIATIONS.index(m[1]) + 1, int(m[2]))
+    return None
+
+
+def parse_date(text: str) -> Optional[str]:
+    """The first purchase date in OCR text as an ISO ``YYYY-MM-DD`` string, or None.
+
+    Understands ``2026-02-11``, ``02/11/2026`` (month first unless the first
+    number is over 12), ``11 Feb 2026`` and ``Feb 11, 2026``.
+    """
+    for line in text.lower().splitlines():
+        try:
+            date = _date_in_line(line)
+        except ValueError:  # e.g. a price or an id that only looks like a date
+            continue
+        if date is not None:
+            return date.isoformat()
+    return None
+
+
+def parse_receipt(text: str, file: Optional[str] = None) -> Receipt:
+    """Parse OCR text into a :class:`Receipt` of :class:`Item` objects (dated by :func:`parse_date`)."""
+    with metrics.timed("parse"):
+        receipt = Receipt(list(iter_item_models(text.splitlines())), file, parse_date(text))
+    metrics.inc("items_total", len(receipt.items), stage="parse")
+    return receipt
+
+
+_UNIT_WORDS_RE = re.compile(
+    r"\b(kg|g|dozen|x|pcs|pc|tab|tabnet|dairy|meat|snacks|bakery|fruits|produce|pharmacy|beverage|%)\b",
+    re.IGNORECASE,
+)
+
+
+def _parse_single_item(line: str) -> Optional[Dict]:
+    """Parse a single item line into the legacy item dict (see :func:`_parse_line`)."""
+    item = _parse_line(line)
+    return item.to_dict() if item else None
+
+
+def _drop_number(m: "re.Match") -> str:
+    """Name extraction: digits inside a word are OCR look-alike letters ("CH1CKEN"), kept for products.fold()."""
+    s, a, b = m.string, m.start(), m.end()
+    if m.group().isdigit() and a > 0 and b < len(s) and s[a - 1].isalpha() and s[b].isalpha():
+        return m.group()
+    return ''
+
+
+def _parse_line(line: str) -> Optional[Item]:
     """Parse a single item line into name, quantity, price, amount."""
     nums = NUM_RE.findall(line)
     if not nums:
@@ -177,16 +235,9 @@ def _parse_single_item(line: str) -> Dict:
     unit_price = round(unit_price, 2)
 
     # extract name: remove all numbers and category/unit words
-    name_part = re.sub(NUM_RE, '', line).strip(' -:,.')
-    name = re.sub(r"\b(kg|g|dozen|x|pcs|pc|tab|tabnet|dairy|meat|snacks|bakery|fruits|produce|pharmacy|beverage|%)\b", '', name_part, flags=re.IGNORECASE).strip()
+    name_part = NUM_RE.sub(_drop_number, line).strip(' -:,.')
+    name = _UNIT_WORDS_RE.sub('', name_part).strip()
     if not name or len(name) < 2:
         return None
 
-    return {
-        'name': name,
-        'quantity': qty,
-        'rate': unit_price,
-        'price': unit_price,
-        'line_total': line_total,
-        'amount': line_total,
-    }
+    return Item(name, qty, unit_price, line_total)
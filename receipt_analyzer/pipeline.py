@@ -0,0 +1,406 @@
+"""Staged streaming ingestion: read -> preprocess -> OCR -> analyze -> advice -> sink.
+
+Each stage is a group of workers pulling jobs from a bounded queue and
+pushing them to the next one, so a burst of input blocks the source
+(backpressure) instead of piling images up in memory: at most
+``queue_size`` jobs wait in front of each stage. Reading, preprocessing
+(OpenCV releases the GIL), analysis and advice run on threads (the advice
+workers share one :class:`llm_client.AdviceService`); OCR runs in a process
+pool, fed by one thread per worker process so that the pool never holds
+more than one job per process.
+
+A :class:`Checkpoint` file records each receipt once its record has been
+written, keyed by path, size and mtime. A restarted run skips those
+receipts, so a crash costs at most the jobs that were in flight; files that
+failed are not checkpointed and are retried. :meth:`Pipeline.stop` (the
+first SIGINT/SIGTERM) stops taking new input and lets everything already
+read drain through to the sink; a second signal aborts.
+
+Sources are any iterable of paths: :func:`watch_folder` polls a directory
+forever, :func:`read_manifest` reads one path per line (e.g. from stdin).
+Unlike :func:`ocr.ocr_image`, the pipeline always OCRs locally and does
+not tile tall scans; the OCR result cache is honoured.
+"""
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Union
+
+from . import metrics
+
+_STOP = object()
+
+
+@dataclass
+class PipelineConfig:
+    """Workers per stage and the size of the queue in front of each stage.
+
+    ``ocr_processes=False`` runs OCR on ``ocr_workers`` threads instead of
+    a process pool (useful with a GIL-free engine, and in tests). With a
+    :class:`stats.SpendStats` ``history``, the analyze stage flags
+    anomalies against ``user``'s history and adds each receipt to it,
+    dated by the date printed on it (or now).
+    """
+    read_workers: int = 2
+    preprocess_workers: int = min(4, os.cpu_count() or 1)
+    ocr_workers: int = os.cpu_count() or 1
+    ocr_processes: bool = True
+    analyze_workers: int = 1
+    advice_workers: int = 8
+    queue_size: int = 8
+    advice: bool = True
+    preset: Optional[str] = None
+    cascade: object = None
+    history: object = None
+    user: str = "default"
+
+
+class Job:
+    """One receipt on its way through the stages."""
+    __slots__ = ("path", "key", "data", "processed", "text", "record", "error")
+
+    def __init__(self, path: str, key: str):
+        self.path, self.key = path, key
+        self.data = self.processed = self.text = self.record = self.error = None
+
+
+def file_key(path: Union[str, Path]) -> str:
+    """Checkpoint key: resolved path plus size and mtime, so edited files are redone."""
+    st = os.stat(path)
+    return f"{os.path.realpath(path)}\t{st.st_size}\t{st.st_mtime_ns}"
+
+
+class Checkpoint:
+    """Append-only file of completed :func:`file_key` keys, one per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                # a crash can leave a torn last line; it never matches a real key
+                self._done.update(line.rstrip("\n") for line in f if line.strip())
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._done
+
+    def __len__(self):
+        return len(self._done)
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            self._done.add(key)
+            self._file.write(key + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_manifest(stream: TextIO) -> Iterator[Path]:
+    """Paths listed one per line; blank lines and ``#`` comments are skipped."""
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield Path(line)
+
+
+def watch_folder(directory: Union[str, Path], stop: threading.Event, interval: float = 2.0,
+                 settle: float = 2.0) -> Iterator[Path]:
+    """Yield image files appearing in ``directory`` until ``stop`` is set.
+
+    A file is picked up once it has not been modified for ``settle``
+    seconds, so half-copied uploads are not read.
+    """
+    from .batch import IMAGE_SUFFIXES
+
+    seen = set()
+    directory = Path(directory)
+    while not stop.is_set():
+        now = time.time()
+        for p in sorted(directory.iterdir()):
+            if p.name in seen or p.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            try:
+                if now - p.stat().st_mtime < settle:
+                    continue
+            except OSError:
+                continue
+            seen.add(p.name)
+            yield p
+        stop.wait(interval)
+
+
+# -- stage functions -----------------------------------------------------------
+
+def _read(job: Job, cfg: PipelineConfig) -> None:
+    from . import ocr
+
+    job.data = Path(job.path).read_bytes()
+    cache = ocr.get_default_cache()
+    if cache is not None:
+        hit = cache.get(cache.key(job.data, ocr._resolve_preset(cfg.preset), ocr._resolve_cascade(cfg.cascade)))
+        metrics.inc("ocr_cache_total", result="hit" if hit is not None else "miss")
+        if hit is not None:
+            job.text, job.data = hit.text, None
+
+
+def _preprocess(job: Job, cfg: PipelineConfig) -> None:
+    from . import ocr
+
+    if job.text is None:
+        job.processed = ocr.preprocess_image(job.data, cfg.preset)
+        if ocr.get_default_cache() is None:
+            job.data = None  # otherwise kept to store the OCR result under its cache key
+
+
+def _init_ocr_worker():
+    # Ctrl-C reaches the whole process group; the parent decides when OCR workers stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from .batch import _init_worker
+    _init_worker()
+
+
+def _recognize(processed, cascade):
+    """OCR worker entry point (runs in the OCR process)."""
+    from . import ocr
+
+    return ocr._recognize_batch([processed], [False], ocr._resolve_cascade(cascade))[0]
+
+
+def _analyze(job: Job, cfg: PipelineConfig) -> None:
+    from .parser import parse_date, parse_items_from_text
+    from .categorizer import categorize_items
+    from .analyzer import analyze_items
+
+    items = categorize_items(parse_items_from_text(job.text))
+    date = parse_date(job.text)
+    job.record = {"file": job.path, "text": job.text, "items": items,
+                  "analysis": analyze_items(items, history=cfg.history, user=cfg.user, when=date)}
+    if date is not None:
+        job.record["date"] = date
+
+
+def _advise(job: Job, adviser) -> None:
+    from .batch import _advise_record
+
+    if adviser is not None:
+        adviser.submit(_advise_record(adviser.client, job.record)).result()
+
+
+class _Stage:
+    def __init__(self, name: str, fn: Callable[[Job], None], workers: int, inbox: queue.Queue,
+                 outbox: Optional[queue.Queue]):
+        self.name, self.fn, self.inbox, self.outbox = name, fn, inbox, outbox
+        self._alive = workers
+        self._lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, name=f"pipeline-{name}-{i}", daemon=True)
+                        for i in range(workers)]
+
+    def _work(self):
+        while True:
+            job = self.inbox.get()
+            if job is _STOP:
+                with self._lock:
+                    self._alive -= 1
+                    last = self._alive == 0
+                if not last:
+                    self.inbox.put(_STOP)  # pass it on to the next sibling
+                elif self.outbox is not None:
+                    self.outbox.put(_STOP)
+                return
+            if job.error is None:
+                try:
+                    with metrics.timed(f"pipeline.{self.name}"):
+                        self.fn(job)
+                except Exception as e:
+                    job.error = f"{type(e).__name__}: {e}"
+                    job.data = job.processed = None
+                    if self.outbox is None:
+                        print(f"Writing {job.path} failed: {job.error}", file=sys.stderr)
+            if self.outbox is not None:
+                self.outbox.put(job)
+
+
+class Pipeline:
+    """Streaming ingestion over bounded queues; see the module docstring.
+
+    ``run(source, out)`` blocks until the source is exhausted (or
+    :meth:`stop` is called) and every job read has been written. Records
+    are JSON lines in completion order, in the same format as
+    :func:`batch.run_batch`, and are also passed to ``on_record``.
+    """
+
+    def __init__(self, config: Optional[PipelineConfig] = None, checkpoint: Optional[Checkpoint] = None,
+                 on_record: Optional[Callable[[Dict], None]] = None,
+                 progress: Optional[TextIO] = sys.stderr, report_every: float = 5.0):
+        self.config = config or PipelineConfig()
+        self.checkpoint = checkpoint
+        self.on_record = on_record
+        self.progress, self.report_every = progress, report_every
+        self.stopping = threading.Event()
+        self._source_lock = threading.Lock()
+        self._source_closed = False
+        self._inbox: Optional[queue.Queue] = None
+        self.counts = {"read": 0, "written": 0, "errors": 0, "skipped": 0}
+
+    # -- source side -------------------------------------------------------
+
+    def _offer(self, job: Job) -> bool:
+        with self._source_lock:  # blocks while the first queue is full: backpressure
+            if self._source_closed:
+                return False
+            self._inbox.put(job)
+            self.counts["read"] += 1
+            return True
+
+    def _close_source(self) -> None:
+        with self._source_lock:
+            if not self._source_closed:
+                self._source_closed = True
+                self._inbox.put(_STOP)
+
+    def _feed(self, source: Iterable[Union[str, Path]]) -> None:
+        try:
+            for path in source:
+                if self.stopping.is_set():
+                    break
+                try:
+                    key = file_key(path)
+                except OSError as e:
+                    print(f"Skipping {path}: {e}", file=sys.stderr)
+                    continue
+                if self.checkpoint is not None and key in self.checkpoint:
+                    self.counts["skipped"] += 1
+                    continue
+                if not self._offer(Job(str(path), key)):
+                    break
+        except Exception as e:
+            print(f"Input source failed: {type(e).__name__}: {e}", file=sys.stderr)
+        finally:
+            self._close_source()
+
+    def stop(self) -> None:
+        """Stop taking input; jobs already read still run to completion."""
+        self.stopping.set()
+        if self._inbox is not None:
+            self._close_source()
+
+    # -- stages ------------------------------------------------------------
+
+    def _sink(self, out: TextIO, job: Job) -> None:
+        record = job.record if job.error is None else {"file": job.path, "error": job.error}
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()  # the record must be on disk before its checkpoint entry
+        if self.on_record is not None:
+            self.on_record(record)
+        self.counts["written"] += 1
+        if "error" in record:
+            self.counts["errors"] += 1
+        elif self.checkpoint is not None:
+            self.checkpoint.add(job.key)
+
+    def _build(self, out: TextIO, pool, adviser) -> List[_Stage]:
+        cfg = self.config
+        from . import ocr
+
+        def run_ocr(job: Job):
+            if job.text is not None:
+                return
+            if pool is not None:
+                result = pool.submit(_recognize, job.processed, cfg.cascade).result()
+            else:
+                result = _recognize(job.processed, cfg.cascade)
+            job.text, job.processed = result.text, None
+            cache = ocr.get_default_cache()
+            if cache is not None and result.engine:
+                cache.put(cache.key(job.data, ocr._resolve_preset(cfg.preset),
+                                    ocr._resolve_cascade(cfg.cascade)), result)
+            job.data = None
+
+        specs = [("read", lambda j: _read(j, cfg), cfg.read_workers),
+                 ("preprocess", lambda j: _preprocess(j, cfg), cfg.preprocess_workers),
+                 ("ocr", run_ocr, cfg.ocr_workers),
+                 ("analyze", lambda j: _analyze(j, cfg), cfg.analyze_workers),
+                 ("advice", lambda j: _advise(j, adviser), cfg.advice_workers if cfg.advice else 1),
+                 ("sink", lambda j: self._sink(out, j), 1)]
+        queues = [queue.Queue(cfg.queue_size) for _ in specs]
+        self._inbox = queues[0]
+        return [_Stage(name, fn, max(1, n), q, queues[i + 1] if i + 1 < len(queues) else None)
+                for i, ((name, fn, n), q) in enumerate(zip(specs, queues))]
+
+    def run(self, source: Iterable[Union[str, Path]], out: TextIO, handle_signals: bool = True) -> Dict:
+        """Process ``source`` and return a summary (counts, seconds, whether it was interrupted)."""
+        cfg = self.config
+        start = time.perf_counter()
+        pool = (ProcessPoolExecutor(max_workers=cfg.ocr_workers, initializer=_init_ocr_worker)
+                if cfg.ocr_processes else None)
+        adviser = None
+        if cfg.advice:
+            from .llm_client import AdviceService
+            adviser = AdviceService(max_concurrency=cfg.advice_workers)
+        restore = self._install_signals() if handle_signals else None
+        try:
+            stages = self._build(out, pool, adviser)
+            threads = [t for s in stages for t in s.threads]
+            for t in threads:
+                t.start()
+            feeder = threading.Thread(target=self._feed, args=(source,), name="pipeline-source", daemon=True)
+            feeder.start()
+            sink = stages[-1].threads[0]
+            last_report = start
+            while sink.is_alive():
+                sink.join(0.5)
+                now = time.perf_counter()
+                if self.progress is not None and now - last_report >= self.report_every:
+                    last_report = now
+                    self._report(now - start)
+        except KeyboardInterrupt:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = None
+            raise
+        finally:
+            if restore is not None:
+                restore()
+            if pool is not None:
+                pool.shutdown()
+            if adviser is not None:
+                adviser.close()
+        elapsed = time.perf_counter() - start
+        if self.progress is not None:
+            self._report(elapsed)
+        return {"files": self.counts["written"], "errors": self.counts["errors"],
+                "skipped": self.counts["skipped"], "seconds": round(elapsed, 3),
+                "files_per_sec": round(self.counts["written"] / elapsed, 3) if elapsed else 0.0,
+                "interrupted": self.stopping.is_set()}
+
+    def _report(self, elapsed: float) -> None:
+        c = self.counts
+        rate = c["written"] / elapsed if elapsed else 0.0
+        print(f"[{c['written']}/{c['read']} read] {rate:.2f} files/s, {c['errors']} errors, "
+              f"{c['skipped']} already done", file=self.progress)
+
+    def _install_signals(self):
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        previous = {}
+
+        def handler(signum, frame):
+            if self.stopping.is_set():
+                raise KeyboardInterrupt  # second signal: give up on draining
+            print("Stopping: finishing receipts in flight (signal again to abort)", file=sys.stderr)
+            self.stop()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous[sig] = signal.signal(sig, handler)
+        return lambda: [signal.signal(s, h) for s, h in previous.items()]
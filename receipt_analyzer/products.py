@@ -0,0 +1,387 @@
+"""Fuzzy product dictionary: canonical names and categories for OCR'd item names.
+
+Names are *folded* before indexing and lookup: lowercased, OCR look-alikes
+mapped to one letter (``0``/``o``, ``1``/``l``/``i``, ``5``/``s``, ``7``/``t``,
+``rn``/``m``, ...) and punctuation dropped, so "CH1CKEN BREAS7" and
+"Chicken Breast" fold to the same string and hit the exact-match table.
+
+Everything else goes through a partition index (pigeonhole filtering, as
+in PassJoin). For each distance ``d`` up to ``max_edits``, every indexed
+name is cut into ``d + 1`` segments, stored under the name's length, the
+segment's position and its text. A name within ``d`` edits of the query
+keeps one of them intact, and that segment appears in the query within
+``d`` characters of its own position, so candidates come from a few dozen
+dict probes on query substrings. Their letter counts give a lower bound
+on the edit distance, computed for all candidates at once with NumPy;
+only the few that pass have their distance computed, lowest bound first,
+with a bit-parallel Levenshtein (``rapidfuzz`` is used when installed).
+Distances are tried from 1 upwards, and the search stops at the first one
+that yields enough matches. Names no longer than ``d`` are all candidates.
+
+Dictionary files are CSV: ``name,category[,alias|alias...]`` with an
+optional header row.
+"""
+import csv
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    from rapidfuzz.distance.Levenshtein import distance as _rf_distance
+except ImportError:  # optional; the pure-Python version below is exact too
+    _rf_distance = None
+
+_FOLD_CHARS = str.maketrans("01l|!5$7862943@", "oiiiisstbgzgaea")
+_FOLD_PAIRS = (("rn", "m"), ("vv", "w"))
+_NON_ALPHA = re.compile(r"[^a-z]+")
+
+
+def fold(name: str) -> str:
+    """Normalize a name for matching (see module docstring); the result is letters and single spaces."""
+    s = name.lower()
+    for a, b in _FOLD_PAIRS:
+        s = s.replace(a, b)
+    return _NON_ALPHA.sub(" ", s.translate(_FOLD_CHARS)).strip()
+
+
+def _letter_columns(folded: str):
+    """Column of each character of a folded string in a letter-count row: a-z, then space."""
+    import numpy as np
+
+    codes = np.frombuffer(folded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 97
+    codes[codes < 0] = 26
+    return codes
+
+
+def _partition(length: int, parts: int) -> List[Tuple[int, int]]:
+    """``(start, size)`` of ``parts`` consecutive segments of a string, the longer ones last."""
+    base, extra = divmod(length, parts)
+    out, start = [], 0
+    for i in range(parts):
+        size = base + (i >= parts - extra)
+        out.append((start, size))
+        start += size
+    return out
+
+
+def levenshtein(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """Edit distance; with ``max_distance``, any result above it is reported as ``max_distance + 1``.
+
+    Bit-parallel (Myers/Hyyrö): one column of the DP matrix is a pair of
+    Python ints, so the cost is linear in ``len(b)`` for any length of ``a``.
+    """
+    if _rf_distance is not None:
+        return _rf_distance(a, b, score_cutoff=max_distance)
+    limit = max(len(a), len(b)) if max_distance is None else max_distance
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # a common prefix and suffix never change the distance
+    i, end = 0, min(len(a), len(b))
+    while i < end and a[i] == b[i]:
+        i += 1
+    j, end = 0, end - i
+    while j < end and a[-1 - j] == b[-1 - j]:
+        j += 1
+    if i or j:
+        a, b = a[i:len(a) - j], b[i:len(b) - j]
+    m = len(a)
+    if not m:
+        return min(len(b), limit + 1)
+    peq: Dict[str, int] = {}
+    for i, ch in enumerate(a):
+        peq[ch] = peq.get(ch, 0) | (1 << i)
+    full = (1 << m) - 1
+    top = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    remaining = len(b)
+    for ch in b:
+        eq = peq.get(ch, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & top:
+            score += 1
+        elif mh & top:
+            score -= 1
+        remaining -= 1
+        if score - remaining > limit:  # can drop by at most one per remaining character
+            return limit + 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return min(score, limit + 1)
+
+
+class Match(NamedTuple):
+    name: str        # canonical product name
+    category: str
+    distance: int    # edit distance between the folded query and the matched (folded) name or alias
+    score: float     # 1 - distance / length, in [0, 1]
+
+
+class ProductDictionary:
+    """Product names (and aliases) with categories, searchable with OCR-tolerant fuzzy matching.
+
+    ``max_error`` is the default allowed edit distance as a fraction of the
+    folded query length, between 1 and ``max_edits``. Results of
+    :meth:`best` are memoized per query in an LRU cache of ``cache_size``.
+    """
+
+    def __init__(self, products: Iterable[Tuple[str, str, Sequence[str]]] = (), max_error: float = 0.25,
+                 max_edits: int = 4, cache_size: int = 100000):
+        self.max_error = max_error
+        self.max_edits = max_edits
+        self.names: List[str] = []
+        self.categories: List[str] = []
+        # index terms: the folded product names and aliases
+        self._term_product = array("i")
+        self._term_folded: List[str] = []
+        self._exact: Dict[str, int] = {}
+        # per distance d: length -> one {segment text: term ids} table for each of the d + 1 segments
+        self._segments: List[Dict[int, List[Dict[str, array]]]] = [{} for _ in range(max_edits + 1)]
+        self._short: Dict[int, array] = {}  # length -> terms of at most max_edits characters
+        self._layouts: Dict[Tuple[int, int], List[Tuple[int, int]]] = {}
+        self._letter_counts = None  # NumPy letter counts and lengths of the terms, rebuilt after add()
+        self._cache: "OrderedDict[str, Optional[Match]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_size = cache_size
+        for entry in products:
+            self.add(*entry)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name: str, category: str, aliases: Sequence[str] = ()) -> int:
+        """Add a product; returns its id."""
+        pid = len(self.names)
+        self.names.append(name)
+        self.categories.append(category)
+        seen = set()
+        for term in (name, *aliases):
+            folded = fold(term)
+            if not folded or folded in seen:
+                continue
+            seen.add(folded)
+            tid = len(self._term_folded)
+            self._exact.setdefault(folded, tid)
+            self._term_product.append(pid)
+            self._term_folded.append(folded)
+            n = len(folded)
+            if n <= self.max_edits:
+                self._short.setdefault(n, array("i")).append(tid)
+            for d in range(1, min(n - 1, self.max_edits) + 1):
+                tables = self._segments[d].get(n)
+                if tables is None:
+                    tables = self._segments[d][n] = [{} for _ in range(d + 1)]
+                for table, (start, size) in zip(tables, self._layout(n, d + 1)):
+                    ids = table.get(folded[start:start + size])
+                    if ids is None:
+                        ids = table[folded[start:start + size]] = array("i")
+                    ids.append(tid)
+        self._cache.clear()
+        self._letter_counts = None
+        return pid
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "ProductDictionary":
+        """Load a ``name,category[,aliases]`` CSV (aliases separated by ``|``)."""
+        def rows():
+            with open(path, newline="", encoding="utf-8") as f:
+                for i, row in enumerate(csv.reader(f)):
+                    if not row or not row[0].strip() or row[0].startswith("#"):
+                        continue
+                    if i == 0 and [c.strip().lower() for c in row[:2]] == ["name", "category"]:
+                        continue
+                    aliases = [a.strip() for a in row[2].split("|") if a.strip()] if len(row) > 2 else ()
+                    yield row[0].strip(), (row[1].strip() if len(row) > 1 else "") or "other", aliases
+        return cls(rows(), **kwargs)
+
+    def _max_distance(self, folded: str, max_error: Optional[float]) -> int:
+        frac = self.max_error if max_error is None else max_error
+        return max(1, min(self.max_edits, int(len(folded) * frac)))
+
+    def _layout(self, length: int, parts: int) -> List[Tuple[int, int]]:
+        layout = self._layouts.get((length, parts))
+        if layout is None:
+            layout = self._layouts[length, parts] = _partition(length, parts)
+        return layout
+
+    def _letter_matrix(self):
+        """Letter (and space) counts of every term, 32 bytes per term seen as four uint64, and the term lengths."""
+        import numpy as np
+
+        if self._letter_counts is None:
+            folded = self._term_folded
+            lengths = np.array([len(f) for f in folded], dtype=np.int32)
+            counts = np.zeros((len(folded), 32), dtype=np.int32)
+            np.add.at(counts, (np.repeat(np.arange(len(folded)), lengths), _letter_columns("".join(folded))), 1)
+            # a count above 255 is only ever compared with a query's, which is capped below
+            self._letter_counts = np.minimum(counts, 255).astype(np.uint8).view(np.uint64), lengths
+        return self._letter_counts
+
+    def lookup(self, name: str, k: int = 1, max_error: Optional[float] = None) -> List[Match]:
+        """Up to ``k`` products within the allowed edit distance, closest first."""
+        q = fold(name)
+        if not q:
+            return []
+        return self._matches(q, self._search(q, k, max_error), k)
+
+    def _search(self, q: str, k: int, max_error: Optional[float] = None) -> Dict[int, int]:
+        """Product id -> edit distance for the ``k`` (or more) closest terms to the folded ``q``."""
+        tid = self._exact.get(q)
+        if tid is not None and k == 1:
+            return {self._term_product[tid]: 0}
+        best: Dict[int, int] = {}
+        for d in range(1, self._max_distance(q, max_error) + 1):
+            # nothing within d - 1 edits: every candidate is at least d away
+            best = self._verify(q, self._candidates(q, d), d, k, d if not best else 0)
+            if len(best) >= k:
+                break
+        return best
+
+    def _candidates(self, q: str, d: int) -> List[array]:
+        """Posting lists of the terms that can be within ``d`` edits of ``q``.
+
+        A term of more than ``d`` characters qualifies when one of its
+        ``d + 1`` segments is intact (each edit breaks at most one); shorter
+        terms all qualify. Terms may be listed more than once.
+        """
+        n = len(q)
+        chunks: List[array] = []
+        for length in range(max(1, n - d), n + d + 1):
+            if length <= d:
+                if length in self._short:
+                    chunks.append(self._short[length])
+            else:
+                tables = self._segments[d].get(length)
+                if tables is None:
+                    continue
+                # some intact segment i has at most i edits before it and d - i after it, so
+                # it is shifted by at most i, and by the length difference give or take d - i
+                gap = n - length
+                for i, (table, (start, size)) in enumerate(zip(tables, self._layout(length, d + 1))):
+                    lo, hi = max(-i, gap - d + i), min(i, gap + d - i)
+                    for s in range(max(0, start + lo), min(n - size, start + hi) + 1):
+                        ids = table.get(q[s:s + size])
+                        if ids is not None:
+                            chunks.append(ids)
+        return chunks
+
+    def _verify(self, q: str, chunks: List[array], d: int, k: int,
+                floor: int = 0) -> Dict[int, int]:
+        """Product id -> edit distance for the candidates within ``d`` of ``q``.
+
+        Candidates are ranked by a lower bound on their distance, computed for
+        all of them at once: the larger of ``floor`` and the letter-count
+        distance (the letters one string has in excess of the other). Edit
+        distances are then computed lowest bound first.
+        """
+        import numpy as np
+
+        terms = np.frombuffer(b"".join(chunks), dtype=np.int32)
+        if not len(terms):
+            return {}
+        counts, lengths = self._letter_matrix()
+        lengths = lengths.take(terms)
+        if len(q) < 256:  # the byte sums below cannot wrap
+            # the letters in excess on either side, the larger of the two: the longer
+            # length minus the letters both strings have
+            shared = counts.take(terms, axis=0)
+            np.minimum(shared.view(np.uint8), np.bincount(_letter_columns(q), minlength=32).astype(np.uint8),
+                       out=shared.view(np.uint8))
+            total = shared[:, 0] + shared[:, 1]
+            total += shared[:, 2]
+            total += shared[:, 3]
+            total *= np.uint64(0x0101010101010101)  # adds up the eight byte lanes in the top byte
+            letters = np.maximum(lengths, len(q)) - (total >> np.uint64(56)).astype(np.int32)
+        else:
+            letters = np.abs(lengths - len(q))
+        bounds = np.maximum(letters, floor)
+        keep = np.flatnonzero(bounds <= d)
+        order = keep[np.lexsort((letters[keep], bounds[keep]))]  # ties: closest letter counts first
+        return self._closest(q, bounds[order].tolist(), terms[order].tolist(), d, k)
+
+    def _closest(self, q: str, bounds: List[int], terms: List[int], d: int, k: int) -> Dict[int, int]:
+        """Edit distances of ``terms`` (sorted by the lower ``bounds`` of their distance), up to ``d``."""
+        folded, term_product = self._term_folded, self._term_product
+        best: Dict[int, int] = {}
+        seen = set()
+        limit = d
+        for bound, t in zip(bounds, terms):
+            if len(best) >= k and bound >= limit:
+                break  # once k matches are in, only a strictly closer one can change the result
+            if t in seen:
+                continue
+            seen.add(t)
+            dist = levenshtein(q, folded[t], limit)
+            if dist > limit:
+                continue
+            pid = term_product[t]
+            if dist < best.get(pid, d + 1):
+                best[pid] = dist
+                if len(best) >= k:
+                    limit = sorted(best.values())[k - 1]
+        return best
+
+    def _matches(self, q: str, best: Dict[int, int], k: int) -> List[Match]:
+        ranked = sorted(best.items(), key=lambda kv: (kv[1], kv[0]))[:k]
+        return [Match(self.names[pid], self.categories[pid], dist, round(1 - dist / max(len(q), 1), 3))
+                for pid, dist in ranked]
+
+    def best(self, name: str, max_error: Optional[float] = None) -> Optional[Match]:
+        """The closest product, or None; memoized."""
+        if max_error is not None:
+            hits = self.lookup(name, 1, max_error)
+            return hits[0] if hits else None
+        cache = self._cache
+        with self._lock:
+            if name in cache:
+                cache.move_to_end(name)
+                return cache[name]
+        hits = self.lookup(name, 1)
+        match = hits[0] if hits else None
+        with self._lock:
+            cache[name] = match
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return match
+
+    def best_many(self, names: Iterable[str]) -> List[Optional[Match]]:
+        """Bulk :meth:`best` in one pass over the names.
+
+        Cached names are taken under a single lock; every other distinct
+        folded form is searched once (exact matches straight from the
+        table) and the results are cached together.
+        """
+        names = list(names)
+        cache = self._cache
+        out: List[Optional[Match]] = [None] * len(names)
+        misses: Dict[str, List[int]] = {}
+        with self._lock:
+            for i, name in enumerate(names):
+                if name in cache:
+                    cache.move_to_end(name)
+                    out[i] = cache[name]
+                else:
+                    misses.setdefault(name, []).append(i)
+        by_folded: Dict[str, Optional[Match]] = {}
+        found = []
+        for name, idxs in misses.items():
+            q = fold(name)
+            if q not in by_folded:
+                hits = self._matches(q, self._search(q, 1), 1) if q else []
+                by_folded[q] = hits[0] if hits else None
+            match = by_folded[q]
+            for i in idxs:
+                out[i] = match
+            found.append((name, match))
+        with self._lock:
+            for name, match in found:
+                cache[name] = match
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return out
@@ -0,0 +1,429 @@
+"""Streaming per-user, per-category spend statistics for history-aware anomaly flags.
+
+For every ``(user, category)`` a :class:`CategoryStats` keeps, in constant
+memory and updated one receipt at a time:
+
+- Welford mean/variance of the category's spend per receipt and of its
+  item line totals;
+- exponentially decayed spend and visit rates (per day, ``half_life_days``);
+- a :class:`QuantileSketch` of each: log-spaced buckets with a relative
+  accuracy guarantee (as in DDSketch), so any quantile is within ``alpha``
+  of the true value and two sketches merge by adding bucket counts.
+
+Every part merges exactly (Welford via Chan's pairwise update, rates by
+decaying both to the later timestamp), so statistics can be built over
+chunks of history in separate processes and combined (:func:`build`), and
+the whole state round-trips through JSON (:meth:`SpendStats.save`).
+
+:meth:`SpendStats.observe` flags a receipt against the history *before*
+adding it: a category is overspent when its spend exceeds both
+``mean + z·std`` and the ``quantile`` of past receipts, an item is
+expensive when its line total exceeds ``mean + z·std`` and the
+``item_quantile`` of past items in its category. With fewer than
+``min_history`` past receipts for a category, the fixed single-receipt
+rules of :func:`analyzer.analyze_items` apply.
+"""
+import datetime as _dt
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_right
+from itertools import accumulate
+from operator import add
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .analyzer import EXPENSIVE_FACTOR, OVERSPENT_PCT, _line_total
+
+_LN2 = math.log(2)
+
+
+def _days(when) -> float:
+    """Days since the epoch of a date, datetime, ISO string or epoch seconds (None: now)."""
+    if when is None:
+        return time.time() / 86400
+    if isinstance(when, (int, float)):
+        return when / 86400
+    if isinstance(when, str):
+        when = _dt.datetime.fromisoformat(when)
+    if not isinstance(when, _dt.datetime):
+        when = _dt.datetime(when.year, when.month, when.day)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=_dt.timezone.utc)
+    return when.timestamp() / 86400
+
+
+class Welford:
+    """Running count, mean and variance (Welford; merged with Chan et al.'s pairwise formula)."""
+
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.n, self.mean, self.m2 = n, mean, m2
+
+    def add(self, x: float) -> None:
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other: "Welford") -> None:
+        n = self.n + other.n
+        if not other.n:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+    def to_list(self) -> list:
+        return [self.n, self.mean, self.m2]
+
+
+class DecayedRate:
+    """Exponentially decayed sum of amounts; :meth:`rate` is the recent amount per day."""
+
+    __slots__ = ("half_life", "value", "t")
+
+    def __init__(self, half_life: float, value: float = 0.0, t: Optional[float] = None):
+        self.half_life, self.value, self.t = half_life, value, t
+
+    def _decay(self, dt: float) -> float:
+        return 2.0 ** (-dt / self.half_life)
+
+    def add(self, amount: float, t: float) -> None:
+        if self.t is None or t >= self.t:
+            self.value = (self.value * self._decay(t - self.t) if self.t is not None else 0.0) + amount
+            self.t = t
+        else:  # out of order: decay the amount to the current timestamp instead
+            self.value += amount * self._decay(self.t - t)
+
+    def merge(self, other: "DecayedRate") -> None:
+        if other.t is not None:
+            self.add(other.value, other.t)
+
+    def rate(self, t: Optional[float] = None) -> float:
+        """Amount per day, decayed to ``t`` (days since the epoch; default: the last update)."""
+        if self.t is None:
+            return 0.0
+        value = self.value * self._decay(max(0.0, t - self.t)) if t is not None else self.value
+        return value * _LN2 / self.half_life
+
+    def to_list(self) -> list:
+        return [self.value, self.t]
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative error ``alpha`` over positive values.
+
+    Value ``x`` is counted in bucket ``ceil(log_gamma(x))`` with
+    ``gamma = (1 + alpha) / (1 - alpha)``; the buckets are a dense list of
+    counts from the lowest bucket in use. Values at or below zero share one
+    bucket reported as 0. Past ``max_buckets`` buckets the lowest ones are
+    folded together, which only costs accuracy at the low end.
+    """
+
+    __slots__ = ("alpha", "max_buckets", "_log_gamma", "offset", "counts", "zero", "count")
+
+    def __init__(self, alpha: float = 0.01, max_buckets: int = 1024):
+        self.alpha, self.max_buckets = alpha, max_buckets
+        self._log_gamma = math.log((1 + alpha) / (1 - alpha))
+        self.offset = 0  # bucket key of counts[0]
+        self.counts: List[int] = []
+        self.zero = 0
+        self.count = 0
+
+    def _add_bucket(self, key: int, n: int) -> None:
+        counts = self.counts
+        if not counts:
+            self.offset = key
+            counts.append(0)
+        elif key < self.offset:
+            counts[:0] = [0] * (self.offset - key)
+            self.offset = key
+        elif key >= self.offset + len(counts):
+            counts.extend([0] * (key - self.offset - len(counts) + 1))
+        counts[key - self.offset] += n
+
+    def _collapse(self) -> None:
+        excess = len(self.counts) - self.max_buckets
+        if excess > 0:
+            folded = sum(self.counts[:excess + 1])
+            del self.counts[:excess]
+            self.counts[0] = folded
+            self.offset += excess
+
+    def add(self, x: float, n: int = 1) -> None:
+        self.count += n
+        if x <= 0:
+            self.zero += n
+            return
+        self._add_bucket(math.ceil(math.log(x) / self._log_gamma), n)
+        if len(self.counts) > self.max_buckets:
+            self._collapse()
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.alpha != self.alpha:
+            raise ValueError("cannot merge sketches with different accuracy")
+        if other.counts:
+            self._add_bucket(other.offset, 0)
+            self._add_bucket(other.offset + len(other.counts) - 1, 0)
+            start = other.offset - self.offset
+            self.counts[start:start + len(other.counts)] = map(
+                add, self.counts[start:start + len(other.counts)], other.counts)
+            self._collapse()
+        self.zero += other.zero
+        self.count += other.count
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The ``q``-quantile (0..1), or None when empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1) - self.zero
+        if rank < 0:
+            return 0.0
+        i = min(bisect_right(list(accumulate(self.counts)), rank), len(self.counts) - 1)
+        return 2 * math.exp((self.offset + i) * self._log_gamma) / (1 + math.exp(self._log_gamma))
+
+    def to_dict(self) -> dict:
+        return {"alpha": self.alpha, "zero": self.zero, "offset": self.offset, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, d: dict, max_buckets: int = 1024) -> "QuantileSketch":
+        sketch = cls(d["alpha"], max_buckets)
+        sketch.offset, sketch.counts, sketch.zero = d["offset"], list(d["counts"]), d["zero"]
+        sketch.count = d["zero"] + sum(d["counts"])
+        return sketch
+
+
+class CategoryStats:
+    """Statistics of one user's spend in one category."""
+
+    __slots__ = ("receipts", "items", "receipt_sketch", "item_sketch", "spend_rate", "visit_rate")
+
+    def __init__(self, half_life_days: float = 30.0, alpha: float = 0.01, max_buckets: int = 1024):
+        self.receipts = Welford()  # category spend per receipt
+        self.items = Welford()     # line totals of the category's items
+        self.receipt_sketch = QuantileSketch(alpha, max_buckets)
+        self.item_sketch = QuantileSketch(alpha, max_buckets)
+        self.spend_rate = DecayedRate(half_life_days)
+        self.visit_rate = DecayedRate(half_life_days)
+
+    def add_receipt(self, total: float, line_totals: Sequence[float], t: float) -> None:
+        self.receipts.add(total)
+        self.receipt_sketch.add(total)
+        for x in line_totals:
+            self.items.add(x)
+            self.item_sketch.add(x)
+        self.spend_rate.add(total, t)
+        self.visit_rate.add(1.0, t)
+
+    def merge(self, other: "CategoryStats") -> None:
+        for name in self.__slots__:
+            getattr(self, name).merge(getattr(other, name))
+
+    def to_dict(self) -> dict:
+        return {"receipts": self.receipts.to_list(), "items": self.items.to_list(),
+                "receipt_sketch": self.receipt_sketch.to_dict(), "item_sketch": self.item_sketch.to_dict(),
+                "spend_rate": self.spend_rate.to_list(), "visit_rate": self.visit_rate.to_list()}
+
+    @classmethod
+    def from_dict(cls, d: dict, half_life_days: float, max_buckets: int = 1024) -> "CategoryStats":
+        s = cls(half_life_days, d["receipt_sketch"]["alpha"], max_buckets)
+        s.receipts, s.items = Welford(*d["receipts"]), Welford(*d["items"])
+        s.receipt_sketch = QuantileSketch.from_dict(d["receipt_sketch"], max_buckets)
+        s.item_sketch = QuantileSketch.from_dict(d["item_sketch"], max_buckets)
+        s.spend_rate = DecayedRate(half_life_days, *d["spend_rate"])
+        s.visit_rate = DecayedRate(half_life_days, *d["visit_rate"])
+        return s
+
+
+class SpendStats:
+    """Per-user, per-category :class:`CategoryStats`; thread-safe, mergeable and JSON-serializable."""
+
+    def __init__(self, min_history: int = 5, z: float = 3.0, quantile: float = 0.95,
+                 item_quantile: float = 0.99, half_life_days: float = 30.0, alpha: float = 0.01,
+                 max_buckets: int = 1024):
+        self.min_history, self.z = min_history, z
+        self.quantile, self.item_quantile = quantile, item_quantile
+        self.half_life_days, self.alpha, self.max_buckets = half_life_days, alpha, max_buckets
+        self.stats: Dict[Tuple[str, str], CategoryStats] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.stats)
+
+    def get(self, user: str, category: str) -> Optional[CategoryStats]:
+        return self.stats.get((user, category))
+
+    def _config(self) -> dict:
+        return {"min_history": self.min_history, "z": self.z, "quantile": self.quantile,
+                "item_quantile": self.item_quantile, "half_life_days": self.half_life_days,
+                "alpha": self.alpha, "max_buckets": self.max_buckets}
+
+    # -- updates -----------------------------------------------------------
+
+    @staticmethod
+    def _by_category(items: List[Dict], line_totals: List[float]) -> Dict[str, Tuple[float, List[float]]]:
+        lines: Dict[str, List[float]] = {}
+        for it, total in zip(items, line_totals):
+            lines.setdefault(it.get("category", "other"), []).append(total)
+        return {cat: (sum(totals), totals) for cat, totals in lines.items()}
+
+    def _add(self, user: str, by_category, t: float) -> None:
+        for cat, (total, lines) in by_category.items():
+            s = self.stats.get((user, cat))
+            if s is None:
+                s = self.stats[(user, cat)] = CategoryStats(self.half_life_days, self.alpha, self.max_buckets)
+            s.add_receipt(total, lines, t)
+
+    def _exceeded(self, moments: Welford, sketch: QuantileSketch, q: float, x: float) -> Optional[float]:
+        """The history threshold if ``x`` is above it, else None (the sketch is only read past ``mean + z·std``)."""
+        bound = moments.mean + self.z * moments.std
+        if x <= bound:
+            return None
+        threshold = max(bound, sketch.quantile(q))
+        return threshold if x > threshold else None
+
+    def update(self, items: List[Dict], user: str = "default", when=None) -> None:
+        """Add one receipt's items (with ``category``) to the history."""
+        by_category = self._by_category(items, [_line_total(it) for it in items])
+        with self._lock:
+            self._add(user, by_category, _days(when))
+
+    def observe(self, items: List[Dict], analysis: Dict, user: str = "default", when=None) -> Dict:
+        """Anomalies of a receipt against the history, then add it; returns an ``anomalies`` dict.
+
+        Entries based on history carry ``typical`` (the median) and
+        ``threshold``; ``basis`` says which rule flagged them. Category shares
+        come from the items, unrounded, as in :func:`analyzer.analyze_items`.
+        """
+        line_totals = [_line_total(it) for it in items]
+        by_category = self._by_category(items, line_totals)
+        overall = sum(line_totals)
+        mean_price = overall / len(line_totals) if line_totals else 0.0
+        anomalies = {"overspent_categories": [], "expensive_items": []}
+        with self._lock:
+            for cat, (total, _) in by_category.items():
+                pct = total / overall * 100 if overall else 0.0
+                s = self.stats.get((user, cat))
+                if s is not None and s.receipts.n >= self.min_history:
+                    threshold = self._exceeded(s.receipts, s.receipt_sketch, self.quantile, total)
+                    if threshold is not None:
+                        anomalies["overspent_categories"].append({
+                            "category": cat, "pct": round(pct, 1), "total": round(total, 2),
+                            "typical": round(s.receipt_sketch.quantile(0.5), 2),
+                            "threshold": round(threshold, 2), "basis": "history"})
+                elif pct > OVERSPENT_PCT:
+                    anomalies["overspent_categories"].append({"category": cat, "pct": round(pct, 1),
+                                                              "basis": "receipt"})
+            for it, total in zip(items, line_totals):
+                s = self.stats.get((user, it.get("category", "other")))
+                if s is not None and s.items.n >= self.min_history:
+                    threshold = self._exceeded(s.items, s.item_sketch, self.item_quantile, total)
+                    if threshold is not None:
+                        anomalies["expensive_items"].append({
+                            "name": it.get("name"), "total": total, "typical": round(s.item_sketch.quantile(0.5), 2),
+                            "threshold": round(threshold, 2), "basis": "history"})
+                elif mean_price and total > mean_price * EXPENSIVE_FACTOR:
+                    anomalies["expensive_items"].append({"name": it.get("name"), "total": total, "basis": "receipt"})
+            self._add(user, by_category, _days(when))
+        return anomalies
+
+    def merge(self, other: "SpendStats") -> "SpendStats":
+        """Add another history (e.g. built by another process) into this one."""
+        with self._lock:
+            for key, s in other.stats.items():
+                mine = self.stats.get(key)
+                if mine is None:
+                    self.stats[key] = mine = CategoryStats(self.half_life_days, self.alpha, self.max_buckets)
+                mine.merge(s)
+        return self
+
+    # -- reporting and persistence -----------------------------------------
+
+    def summary(self, user: str = "default", when=None) -> Dict[str, Dict]:
+        """Per category: receipts seen, mean/std/median spend per receipt, spend and visits per day."""
+        t = _days(when) if when is not None else None
+        out = {}
+        with self._lock:
+            for (u, cat), s in sorted(self.stats.items()):
+                if u != user:
+                    continue
+                out[cat] = {"receipts": s.receipts.n, "mean": round(s.receipts.mean, 2),
+                            "std": round(s.receipts.std, 2), "median": round(s.receipt_sketch.quantile(0.5), 2),
+                            "spend_per_day": round(s.spend_rate.rate(t), 4),
+                            "visits_per_day": round(s.visit_rate.rate(t), 4)}
+        return out
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"config": self._config(),
+                    "stats": [[u, c, s.to_dict()] for (u, c), s in self.stats.items()]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "SpendStats":
+        out = cls(**d["config"])
+        for user, cat, s in d["stats"]:
+            out.stats[(user, cat)] = CategoryStats.from_dict(s, out.half_life_days, out.max_buckets)
+        return out
+
+    def save(self, path: str) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SpendStats":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def _build_chunk(args) -> dict:
+    receipts, config = args
+    stats = SpendStats(**config)
+    for user, when, items in receipts:
+        stats.update(items, user, when)
+    return stats.to_dict()
+
+
+def build(receipts: Iterable[Tuple[str, object, List[Dict]]], workers: Optional[int] = None,
+          chunk_size: int = 20000, **config) -> SpendStats:
+    """Statistics over ``(user, when, items)`` receipts, built in chunks on a process pool and merged.
+
+    ``workers=0`` builds in-process. At most two chunks per worker are read
+    ahead of the merge. ``config`` is passed to :class:`SpendStats`.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from itertools import islice
+
+    from .batch import _bounded_map
+
+    stats = SpendStats(**config)
+
+    def chunks():
+        it = iter(receipts)
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if not chunk:
+                return
+            yield chunk, stats._config()
+
+    if workers == 0:
+        for chunk in chunks():
+            stats.merge(SpendStats.from_dict(_build_chunk(chunk)))
+        return stats
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for d in _bounded_map(pool, _build_chunk, chunks(), 2 * (workers or os.cpu_count() or 1)):
+            stats.merge(SpendStats.from_dict(d))
+    return stats
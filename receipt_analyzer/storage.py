@@ -0,0 +1,187 @@
+"""SQLite-backed receipt history with incrementally maintained aggregates."""
+import datetime as _dt
+import json
+import sqlite3
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .analyzer import _line_total
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    receipt_date TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    overall_total REAL NOT NULL,
+    raw_text TEXT,
+    analysis TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    receipt_id INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+    receipt_date TEXT NOT NULL,
+    name TEXT,
+    name_norm TEXT,
+    category TEXT NOT NULL,
+    quantity REAL,
+    price REAL,
+    line_total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_receipts_date ON receipts(receipt_date);
+CREATE INDEX IF NOT EXISTS idx_items_receipt ON items(receipt_id);
+CREATE INDEX IF NOT EXISTS idx_items_category_date ON items(category, receipt_date);
+CREATE INDEX IF NOT EXISTS idx_items_name_norm ON items(name_norm);
+CREATE TABLE IF NOT EXISTS category_period_totals (
+    period TEXT NOT NULL,
+    category TEXT NOT NULL,
+    total REAL NOT NULL,
+    item_count INTEGER NOT NULL,
+    receipt_count INTEGER NOT NULL,
+    PRIMARY KEY (period, category)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_AGGREGATE = """
+INSERT INTO category_period_totals (period, category, total, item_count, receipt_count)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (period, category) DO UPDATE SET
+    total = total + excluded.total,
+    item_count = item_count + excluded.item_count,
+    receipt_count = receipt_count + excluded.receipt_count
+"""
+
+
+def normalize_name(name: Optional[str]) -> str:
+    return " ".join((name or "").lower().split())
+
+
+def _as_date(value) -> str:
+    if value is None:
+        return _dt.date.today().isoformat()
+    if isinstance(value, _dt.datetime):
+        return value.date().isoformat()
+    if isinstance(value, _dt.date):
+        return value.isoformat()
+    return _dt.date.fromisoformat(str(value)[:10]).isoformat()
+
+
+def _period(date_iso: str) -> str:
+    """Aggregation period of a date: its calendar month, ``YYYY-MM``."""
+    return date_iso[:7]
+
+
+class ReceiptStore:
+    """Receipt history in SQLite.
+
+    Receipts and items are written in bulk transactions; the
+    ``category_period_totals`` table is updated in the same transaction, so
+    period/category spend queries never have to scan item rows.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        # used by one thread at a time, but not necessarily the opening one (e.g. the pipeline sink)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_receipt(self, items: List[Dict], analysis: Dict, receipt_date=None,
+                    source: Optional[str] = None, raw_text: Optional[str] = None) -> int:
+        return self.add_receipts([{"items": items, "analysis": analysis, "date": receipt_date,
+                                   "source": source, "text": raw_text}])[0]
+
+    def add_receipts(self, records: Iterable[Dict]) -> List[int]:
+        """Insert many receipts in one transaction and return their ids.
+
+        Each record has ``items`` and ``analysis`` and optionally ``date``
+        (date/datetime/ISO string, default today), ``source`` (or ``file``)
+        and ``text``; records shaped like :mod:`receipt_analyzer.batch`
+        output can be passed as-is. Records with an ``error`` are skipped.
+        """
+        now = _dt.datetime.now().isoformat(timespec="seconds")
+        ids: List[int] = []
+        agg: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0.0, 0, 0])
+        with self.conn:
+            cur = self.conn.cursor()
+            for rec in records:
+                if "error" in rec:
+                    continue
+                items = rec.get("items") or []
+                analysis = rec.get("analysis") or {}
+                date = _as_date(rec.get("date", rec.get("receipt_date")))
+                cur.execute(
+                    "INSERT INTO receipts (source, receipt_date, created_at, overall_total, raw_text, analysis) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (rec.get("source", rec.get("file")), date, now, float(analysis.get("overall_total", 0.0)),
+                     rec.get("text"), json.dumps(analysis)),
+                )
+                rid = cur.lastrowid
+                ids.append(rid)
+                rows = []
+                seen_cats = set()
+                for it in items:
+                    cat = it.get("category", "other")
+                    total = _line_total(it)
+                    # dictionary matches share one canonical name, so OCR spellings aggregate together
+                    norm = normalize_name(it.get("canonical_name") or it.get("name"))
+                    rows.append((rid, date, it.get("name"), norm, cat,
+                                 it.get("quantity"), it.get("price"), total))
+                    a = agg[(_period(date), cat)]
+                    a[0] += total
+                    a[1] += 1
+                    if cat not in seen_cats:
+                        seen_cats.add(cat)
+                        a[2] += 1
+                cur.executemany(
+                    "INSERT INTO items (receipt_id, receipt_date, name, name_norm, category, quantity, price, line_total) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            cur.executemany(_UPSERT_AGGREGATE, [(p, c, t, n, r) for (p, c), (t, n, r) in agg.items()])
+        return ids
+
+    def spend_by_category(self, start_period: Optional[str] = None,
+                          end_period: Optional[str] = None) -> Dict[str, float]:
+        """Total spend per category over ``[start_period, end_period]`` (``YYYY-MM``, inclusive)."""
+        sql = "SELECT category, SUM(total) FROM category_period_totals WHERE 1=1"
+        args: List[str] = []
+        if start_period:
+            sql += " AND period >= ?"
+            args.append(start_period)
+        if end_period:
+            sql += " AND period <= ?"
+            args.append(end_period)
+        sql += " GROUP BY category ORDER BY SUM(total) DESC"
+        return {c: round(t, 2) for c, t in self.conn.execute(sql, args)}
+
+    def spend_by_category_last_months(self, months: int = 12, today=None) -> Dict[str, float]:
+        """Spend per category over the last ``months`` calendar months, including the current one."""
+        d = _dt.date.fromisoformat(_as_date(today))
+        idx = d.year * 12 + d.month - 1 - (months - 1)
+        return self.spend_by_category(f"{idx // 12:04d}-{idx % 12 + 1:02d}", _period(d.isoformat()))
+
+    def monthly_totals(self, category: Optional[str] = None) -> List[Tuple[str, float]]:
+        """``(period, total)`` pairs in period order, optionally for one category."""
+        if category is None:
+            rows = self.conn.execute("SELECT period, SUM(total) FROM category_period_totals "
+                                     "GROUP BY period ORDER BY period")
+        else:
+            rows = self.conn.execute("SELECT period, total FROM category_period_totals "
+                                     "WHERE category = ? ORDER BY period", (category,))
+        return [(p, round(t, 2)) for p, t in rows]
+
+    def item_history(self, name: str) -> List[Tuple[str, float, float]]:
+        """``(date, price, line_total)`` for every purchase of an item, by normalized name."""
+        return list(self.conn.execute(
+            "SELECT receipt_date, price, line_total FROM items WHERE name_norm = ? ORDER BY receipt_date",
+            (normalize_name(name),)))
@@ -0,0 +1,175 @@
+"""Strip-tiled OCR for very tall receipt scans.
+
+A tall image is decoded once at full resolution and cut into overlapping
+horizontal strips (array views, no copies). Each strip is preprocessed on a
+thread pool (OpenCV releases the GIL), so no single filter pass runs over
+the whole scan. With Tesseract reading first, the strips are recognized on
+the same pool (Tesseract and tesserocr release the GIL too). The EasyOCR
+reader serves one call at a time, so when EasyOCR reads first, all strips
+go to it in a single batched call instead. Only Tesseract gets parallel
+recognition per strip; EasyOCR parallelizes inside its model.
+
+Word boxes are mapped back to full-image coordinates. Each strip keeps only
+the words whose vertical centre falls between the midpoints of its
+overlaps, so a line seen by two strips is kept exactly once as long as it
+is shorter than the overlap. The kept words are re-joined into lines by
+bounding box, top to bottom. If an engine returns no boxes, strips are
+stitched by dropping the longest run of lines repeated at each boundary.
+"""
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from . import metrics, ocr
+from .ocr import OCRResult, OCRWord
+
+
+@dataclass(frozen=True)
+class TileConfig:
+    """When and how to tile (pixel sizes refer to the decoded image).
+
+    Images at least ``min_height`` tall and ``min_aspect`` times taller
+    than wide are cut into strips of about ``strip_height`` rows that
+    overlap by ``overlap`` rows; keep the overlap above the tallest text
+    line. ``workers`` defaults to min(4, CPU count).
+    """
+    strip_height: int = 1600
+    overlap: int = 128
+    min_height: int = 3000
+    min_aspect: float = 2.5
+    workers: Optional[int] = None
+
+
+def _resolve_tile(tile=None) -> Optional[TileConfig]:
+    """Accept a :class:`TileConfig`, True/False, or None (``RECEIPT_OCR_TILE``)."""
+    if tile is None:
+        tile = os.environ.get("RECEIPT_OCR_TILE", "") not in ("", "0")
+    if tile is True:
+        return TileConfig()
+    if tile is False:
+        return None
+    if not 0 <= tile.overlap < tile.strip_height:
+        raise ValueError(f"overlap must be smaller than strip_height: {tile!r}")
+    return tile
+
+
+def image_size(source) -> Tuple[int, int]:
+    """``(width, height)`` of any OCR source, reading only the header of encoded images."""
+    if isinstance(source, Image.Image):
+        return source.size
+    if ocr._is_array(source):
+        shape = source.__array_interface__["shape"]
+        return shape[1], shape[0]
+    if isinstance(source, (str, os.PathLike)):
+        with Image.open(source) as img:
+            return img.size
+    with ocr._BufferReader(source) as reader:
+        return Image.open(reader).size
+
+
+def should_tile(size: Tuple[int, int], config: TileConfig) -> bool:
+    w, h = size
+    return h >= config.min_height and h >= config.min_aspect * w
+
+
+def split_strips(height: int, strip_height: int, overlap: int) -> List[Tuple[int, int]]:
+    """Row ranges ``[(top, bottom), ...]`` of evenly sized strips covering ``height``."""
+    if height <= strip_height:
+        return [(0, height)]
+    n = math.ceil((height - overlap) / (strip_height - overlap))
+    step = math.ceil((height - overlap) / n)
+    return [(i * step, min(height, i * step + step + overlap)) for i in range(n)]
+
+
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _executor(workers: Optional[int]) -> ThreadPoolExecutor:
+    workers = workers or min(4, os.cpu_count() or 1)
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(workers, thread_name_prefix="ocr-tile")
+        return _executors[workers]
+
+
+def _preprocess_strip(strip, preset):
+    with metrics.timed("ocr.tile_preprocess"):
+        return ocr.preprocess_image(strip, preset)
+
+
+def _recognize_strip(processed, cascade) -> OCRResult:
+    with metrics.timed("ocr.tile"):
+        return ocr._recognize_batch([processed], [True], cascade)[0]
+
+
+def _easyocr_reads_first(cascade) -> bool:
+    return ocr._has_easyocr() and not (cascade is not None and cascade.primary == "tesseract")
+
+
+def _overlap_len(prev: List[str], nxt: List[str], max_lines: int = 10) -> int:
+    norm = lambda line: " ".join(line.split()).lower()  # noqa: E731
+    for k in range(min(len(prev), len(nxt), max_lines), 0, -1):
+        if [norm(x) for x in prev[-k:]] == [norm(x) for x in nxt[:k]]:
+            return k
+    return 0
+
+
+def stitch_texts(texts: List[str]) -> str:
+    """Join strip texts top to bottom, dropping lines repeated across each boundary."""
+    out: List[str] = []
+    for text in texts:
+        lines = [line for line in text.splitlines() if line.strip()]
+        out.extend(lines[_overlap_len(out, lines):])
+    return "\n".join(out)
+
+
+def ocr_tiled(source, config: Optional[TileConfig] = None, preset=None, cascade=None) -> OCRResult:
+    """OCR ``source`` strip by strip in parallel and stitch the result (see module docstring)."""
+    config = config or TileConfig()
+    preset = ocr._resolve_preset(preset)
+    cascade = ocr._resolve_cascade(cascade)
+    # decode at full resolution; max_side is applied per strip instead
+    gray = ocr._load_gray(source, replace(preset, max_side=None))
+    width, height = ocr._image_size(gray)
+    strips = split_strips(height, config.strip_height, config.overlap)
+    metrics.inc("ocr_tiles_total", len(strips))
+    pool = _executor(config.workers)
+    crops = [ocr._crop(gray, (0, top, width, bottom)) for top, bottom in strips]
+    processed = list(pool.map(lambda strip: _preprocess_strip(strip, preset), crops))
+    if _easyocr_reads_first(cascade):
+        with metrics.timed("ocr.tile"):
+            recognized = ocr._recognize_batch(processed, [True] * len(processed), cascade)
+    else:
+        recognized = list(pool.map(lambda p: _recognize_strip(p, cascade), processed))
+    # each result with the x/y scale from preprocessed back to strip pixels
+    results = []
+    for r, crop, p in zip(recognized, crops, processed):
+        (sw, sh), (pw, ph) = ocr._image_size(crop), ocr._image_size(p)
+        results.append((r, sw / max(1, pw), sh / max(1, ph)))
+
+    engines = []
+    for r, _, _ in results:
+        for e in r.engine.split("+") if r.engine else ():
+            if e not in engines:
+                engines.append(e)
+    if not engines:
+        return ocr._unavailable()
+    if any(r.text.strip() and not r.words for r, _, _ in results):
+        return OCRResult(stitch_texts([r.text for r, _, _ in results]), [], "+".join(engines))
+
+    words: List[OCRWord] = []
+    for i, ((top, bottom), (r, sx, sy)) in enumerate(zip(strips, results)):
+        lo = (strips[i - 1][1] + top) / 2 if i else 0
+        hi = (bottom + strips[i + 1][0]) / 2 if i + 1 < len(strips) else height
+        for w in r.words:
+            g = OCRWord(w.text, w.conf, round(w.left * sx), round(top + w.top * sy),
+                        round(w.width * sx), round(w.height * sy))
+            if lo <= g.top + g.height / 2 < hi:
+                words.append(g)
+    return OCRResult(ocr._words_to_text(words), words, "+".join(engines))
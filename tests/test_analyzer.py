@@ -0,0 +1,36 @@
+import random
+
+from receipt_analyzer.analyzer import analyze_batch, analyze_items, columns_from_receipts
+
+
+def _random_receipts(n, seed=0):
+    rnd = random.Random(seed)
+    cats = ["groceries", "snacks", "meat", "other"]
+    receipts = []
+    for _ in range(n):
+        items = []
+        for j in range(rnd.randint(0, 12)):
+            it = {"name": f"item{j}", "category": rnd.choice(cats),
+                  "price": round(rnd.uniform(0.1, 80), 2), "quantity": rnd.choice([1, 2, 3])}
+            if rnd.random() < 0.7:
+                it["line_total"] = round(it["price"] * it["quantity"], 2)
+            items.append(it)
+        receipts.append(items)
+    return receipts
+
+
+def test_expensive_items_use_line_total():
+    items = [{"name": "a", "price": 1.0, "quantity": 1, "line_total": 1.0, "category": "x"}] * 5
+    items = items + [{"name": "big", "price": 2.0, "quantity": 1, "line_total": 20.0, "category": "y"}]
+    expensive = analyze_items(items)["anomalies"]["expensive_items"]
+    assert expensive == [{"name": "big", "total": 20.0}]
+
+
+def test_analyze_batch_matches_analyze_items():
+    receipts = [r for r in _random_receipts(300) if r]
+    cols = columns_from_receipts(receipts)
+    batch = analyze_batch(cols["amounts"], cols["receipt_ids"], cols["category_codes"],
+                          cols["categories"], cols["names"])
+    assert batch.to_dicts() == [analyze_items(r) for r in receipts]
+    total = sum(analyze_items(r)["overall_total"] for r in receipts)
+    assert abs(sum(batch.totals_by_category().values()) - total) < 1e-6
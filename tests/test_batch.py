@@ -0,0 +1,106 @@
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from receipt_analyzer import batch, metrics, ocr
+from receipt_analyzer.batch import iter_input_files, run_batch
+from receipt_analyzer.dedup import HashIndex
+from test_dedup import _receipt
+
+
+def _fake_ocr(path, *args, **kwargs):
+    """OCR stand-in for the (forked) worker processes."""
+    if "bad" in str(path):
+        raise ValueError(f"unreadable {path}")
+    return f"03/05/2024\nMilk 1 2.00 2.00\nBread 1 {len(str(path))}.00 {len(str(path))}.00", {}
+
+
+def _run(paths, monkeypatch, **kwargs):
+    monkeypatch.setattr(ocr, "ocr_image_bytes", _fake_ocr)
+    monkeypatch.setenv("RECEIPT_OCR_SERVER", "unused")  # skip the EasyOCR warmup
+    out = io.StringIO()
+    kwargs = {"workers": 2, "advice": False, **kwargs}
+    summary = run_batch(paths, out, progress=None, **kwargs)
+    return summary, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_dedup_writes_references_and_retries_failed_originals(tmp_path, monkeypatch):
+    paths = []
+    for name, seed in [("a.png", 1), ("b.png", 2), ("bad.png", 3), ("a_copy.jpg", 1), ("bad_copy.jpg", 3)]:
+        paths.append(tmp_path / name)
+        _receipt(seed).save(paths[-1])
+    index = HashIndex()
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    try:
+        summary, records = _run(paths, monkeypatch, dedup=index)
+    finally:
+        metrics.enable(False)
+    text = metrics.to_prometheus()
+    assert 'receipt_dedup_total{result="hit"} 2' in text and 'receipt_dedup_total{result="retry"} 1' in text
+    assert [r["file"] for r in records] == [str(p) for p in paths]
+    assert records[3] == {"file": str(paths[3]), "duplicate_of": str(paths[0]), "distance": 0}
+    assert "duplicate_of" not in records[4] and records[4]["error"].endswith("bad_copy.jpg")
+    assert summary["duplicates"] == 1 and summary["errors"] == 2
+    assert index.values == [str(paths[0]), str(paths[1]), None]  # references, failed file not reusable
+
+    # a later run reuses the saved references; a different receipt is not a duplicate
+    Image.open(paths[1]).rotate(180).save(tmp_path / "b_flipped.png")
+    index.save(tmp_path / "seen.npz")
+    _, records = _run([paths[1], tmp_path / "b_flipped.png"], monkeypatch,
+                      dedup=HashIndex.load(tmp_path / "seen.npz"))
+    assert records[0]["duplicate_of"] == str(paths[1])
+    assert "duplicate_of" not in records[1]
+
+
+def test_iter_input_files_expands_dirs_globs_and_dedupes(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ["b.JPG", "a.png", "notes.txt", "sub/c.tif"]:
+        (tmp_path / name).write_bytes(b"")
+    files = iter_input_files([str(tmp_path), str(tmp_path / "a.png"), str(tmp_path / "**" / "*.tif"),
+                              str(tmp_path / "missing*.png")])
+    assert [f.name for f in files] == ["a.png", "b.JPG", "c.tif"]
+
+
+def test_run_batch_keeps_order_and_bounds_work_in_flight(tmp_path, monkeypatch):
+    submitted = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def submit(self, fn, *args, **kwargs):
+            submitted.append(args[0])
+            return super().submit(fn, *args, **kwargs)
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", CountingPool)
+    paths = [tmp_path / (f"bad{i}.png" if i % 7 == 3 else f"r{i}.png") for i in range(40)]
+    written = []
+
+    def on_record(record):
+        written.append(record["file"])
+        assert len(submitted) - len(written) <= 2 * 4 + 1  # one worker: a window of 4 files
+
+    summary, records = _run(paths, monkeypatch, on_record=on_record, workers=1)
+    assert [r["file"] for r in records] == written == [str(p) for p in paths]
+    assert [i for i, r in enumerate(records) if "error" in r] == [3, 10, 17, 24, 31, 38]
+    assert records[3]["error"] == f"ValueError: unreadable {paths[3]}"
+    assert records[0]["analysis"]["overall_total"] > 0 and "advice" not in records[0]
+    assert summary["files"] == 40 and summary["errors"] == 6 and "duplicates" not in summary
+
+
+def test_run_batch_with_heuristic_advice(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    paths = [tmp_path / "r.png", tmp_path / "bad.png"]
+    _, records = _run(paths, monkeypatch, advice=True)
+    assert records[0]["advice"].startswith("Budgeting advice:")
+    assert "advice" not in records[1] and "error" in records[1]
+
+
+def test_history_gets_receipt_date_and_user(tmp_path, monkeypatch):
+    from receipt_analyzer.stats import SpendStats, _days
+
+    history = SpendStats()
+    _, records = _run([tmp_path / "a.png", tmp_path / "b.png"], monkeypatch, history=history, user="ann")
+    assert [r["date"] for r in records] == ["2024-03-05", "2024-03-05"]
+    assert history.stats and {user for user, _ in history.stats} == {"ann"}
+    assert all(s.visit_rate.t == _days("2024-03-05") for s in history.stats.values())
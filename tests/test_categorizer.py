@@ -0,0 +1,21 @@
+import json
+
+from receipt_analyzer.categorizer import Categorizer, categorize_item, categorize_receipts
+
+
+def test_taxonomy_order_is_match_priority():
+    # "bread" is listed under groceries before bakery
+    assert categorize_item("Whole Wheat BREAD") == "groceries"
+    assert categorize_item("Croissant") == "bakery"
+    assert categorize_item("Paracetamol 500mg") == "pharmacy"
+    assert categorize_item("mystery item") == "other"
+
+
+def test_taxonomy_from_file_and_batch(tmp_path):
+    path = tmp_path / "taxonomy.json"
+    path.write_text(json.dumps({"dairy": ["milk", "cheese"], "drinks": ["milkshake", "cola"]}))
+    c = Categorizer.from_file(str(path), cache_size=2)
+    receipts = [[{"name": "Strawberry Milkshake"}, {"name": "Cola"}], [{"name": "Cheddar Cheese"}]]
+    out = categorize_receipts(receipts, c)
+    assert [[i["category"] for i in r] for r in out] == [["dairy", "drinks"], ["dairy"]]
+    assert len(c._cache) == 2
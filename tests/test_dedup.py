@@ -0,0 +1,93 @@
+import io
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from receipt_analyzer.dedup import HashIndex, fingerprint, hamming, image_hash, similarity
+
+
+def _receipt(seed: int) -> Image.Image:
+    rng = random.Random(seed)
+    img = Image.new("L", (400, 900), 255)
+    draw = ImageDraw.Draw(img)
+    y = 40
+    while y < 840:
+        draw.rectangle((30, y, 30 + rng.randint(60, 340), y + 12), fill=0)
+        y += rng.choice((24, 24, 48))
+    return img
+
+
+def _encode(img: Image.Image, fmt: str, **kw) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, fmt, **kw)
+    return buf.getvalue()
+
+
+def test_image_hash_tolerates_reencode_resize_and_margins(tmp_path):
+    img = _receipt(1)
+    h = image_hash(img)
+    path = tmp_path / "copy.png"
+    img.resize((300, 675)).save(path)
+    padded = Image.new("L", (440, 960), 255)
+    padded.paste(img, (20, 30))
+    assert hamming(h, image_hash(_encode(img, "JPEG", quality=40))) <= 6
+    assert hamming(h, image_hash(path)) <= 6
+    assert hamming(h, image_hash(padded)) <= 6
+    assert hamming(h, image_hash(_receipt(2))) > 6
+
+
+def test_thumbnail_verifies_hash_matches():
+    h, thumb = fingerprint(_receipt(1))
+    _, copy = fingerprint(_encode(_receipt(1).resize((300, 675)), "JPEG", quality=50))
+    _, other = fingerprint(_receipt(2))
+    assert similarity(thumb, copy) >= 0.97 > similarity(thumb, other)
+    index = HashIndex()
+    a = index.add(h, "a.png", thumb)
+    index.add(h ^ 0b11)  # no thumbnail: cannot be verified
+    assert index.search(h, thumb=copy) == [(a, 0)]
+    assert index.search(h, thumb=other) == []  # same hash, different receipt
+    assert len(index.search(h)) == 2
+
+
+def test_index_matches_brute_force():
+    rng = random.Random(0)
+    stored = [rng.getrandbits(64) for _ in range(3000)]
+    index = HashIndex(max_distance=8)
+    index.extend(stored[:2000])  # compacted tables
+    for h in stored[2000:]:  # recent inserts
+        index.add(h)
+    for _ in range(200):
+        q = stored[rng.randrange(len(stored))]
+        for b in rng.sample(range(64), rng.randint(0, 12)):
+            q ^= 1 << b
+        want = sorted(((i, hamming(h, q)) for i, h in enumerate(stored) if hamming(h, q) <= 8),
+                      key=lambda kv: (kv[1], kv[0]))
+        assert index.search(q) == want
+    assert index.nearest(stored[2500]) == (2500, 0)
+
+
+def test_popcount_without_bitwise_count(monkeypatch):
+    import numpy as np
+    from receipt_analyzer import dedup
+
+    x = np.array([0, 1, 2 ** 64 - 1, 0xF0F0], dtype=np.uint64)
+    monkeypatch.delattr(np, "bitwise_count", raising=False)
+    assert dedup._popcount(x).tolist() == [0, 1, 64, 8]
+
+
+def test_index_save_load_roundtrip(tmp_path):
+    index = HashIndex(max_distance=5)
+    thumb = bytes(range(256)) * 3
+    a = index.add(0x0123456789ABCDEF, "a.jpg", thumb)
+    index.add(0xFEDCBA9876543210)
+    path = tmp_path / "index"
+    index.save(path)
+    loaded = HashIndex.load(path)
+    assert len(loaded) == 2 and loaded.max_distance == 5
+    assert loaded.values == ["a.jpg", None] and loaded.thumbs == [thumb, None]
+    assert loaded.nearest(0x0123456789ABCDEF, thumb=thumb) == (a, 0)
+    assert loaded.nearest(0x0123456789ABCDEF ^ 0b111) == (a, 3)
+    assert loaded.add(0x0123456789ABCDEF) == 2
+    assert [i for i, _ in loaded.search(0x0123456789ABCDEF)] == [0, 2]
+    assert np.frombuffer(loaded.hashes, dtype=np.uint64).tolist()[:2] == [0x0123456789ABCDEF, 0xFEDCBA9876543210]
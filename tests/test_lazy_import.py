@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+HEAVY = ("numpy", "cv2", "PIL", "pytesseract", "easyocr", "torch")
+
+
+def test_parser_and_analyzer_do_not_load_ocr_backends():
+    code = (
+        "import sys, receipt_analyzer as ra\n"
+        "ra.analyze_items(ra.parse_items_from_text('Milk 3.50'))\n"
+        f"print(','.join(m for m in {HEAVY!r} + ('receipt_analyzer.ocr',) if m in sys.modules))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == ""
+
+
+def test_public_names_resolve():
+    import receipt_analyzer
+
+    for name in receipt_analyzer.__all__:
+        assert getattr(receipt_analyzer, name) is not None
+
+
+def test_cache_key_does_not_load_engines(tmp_path):
+    code = (
+        "import sys\n"
+        "from receipt_analyzer import ocr\n"
+        f"ocr.OCRCache({str(tmp_path)!r}).key(b'image')\n"
+        "print(','.join(m for m in ('easyocr', 'torch') if m in sys.modules), ocr._tess_engine)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "None"
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from receipt_analyzer import metrics
+from receipt_analyzer.llm import _build_prompt, estimate_tokens, generate_advice, stream_advice
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    """Mimics a streaming POST /v1/chat/completions: one SSE event per chunk."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        srv = self.server
+        srv.requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        time.sleep(srv.first_delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for i, chunk in enumerate(srv.chunks):
+                if i and srv.stall_after == i:
+                    time.sleep(5)
+                event = {"choices": [{"delta": {"content": chunk}}]}
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(srv.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except OSError:
+            pass  # client gave up
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stream_server(monkeypatch):
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StreamHandler)
+    srv.daemon_threads = True
+    srv.requests, srv.chunks = [], ["Spend ", "less ", "on snacks."]
+    srv.first_delay = srv.chunk_delay = 0.0
+    srv.stall_after = None
+    threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{srv.server_port}/v1")
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _receipt(n=2):
+    items = [{"name": f"item {i}", "quantity": 1, "price": 1.0 + i, "category": ("snacks", "groceries")[i % 2]}
+             for i in range(n)]
+    analysis = {"overall_total": sum(it["price"] for it in items), "category_totals": {"snacks": 1.0},
+                "anomalies": {"overspent_categories": [], "expensive_items": []}}
+    return items, analysis
+
+
+def test_stream_yields_chunks_and_records_latency(stream_server):
+    stream_server.chunk_delay = 0.05
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    try:
+        arrivals = []
+        start = time.perf_counter()
+        for chunk in stream_advice(*_receipt()):
+            arrivals.append((chunk, time.perf_counter() - start))
+    finally:
+        metrics.enable(False)
+    assert [c for c, _ in arrivals] == ["Spend ", "less ", "on snacks."]
+    assert arrivals[0][1] < arrivals[-1][1] - 0.05  # the first chunk did not wait for the last
+    assert stream_server.requests[0]["stream"] is True
+    text = metrics.to_prometheus()
+    assert "receipt_llm_first_token_seconds_count 1" in text
+    assert 'receipt_stage_seconds_count{stage="llm"} 1' in text
+    assert 'receipt_llm_requests_total{outcome="ok"} 1' in text
+
+
+def test_first_token_deadline_falls_back_to_heuristic(stream_server, monkeypatch):
+    stream_server.first_delay = 2.0
+    monkeypatch.setenv("RECEIPT_ADVICE_FIRST_TOKEN_S", "0.3")
+    start = time.perf_counter()
+    advice = generate_advice(*_receipt())
+    assert time.perf_counter() - start < 1.5
+    assert advice.startswith("Budgeting advice:")
+
+
+def test_stalled_stream_keeps_partial_text_and_appends_heuristic(stream_server):
+    stream_server.stall_after = 2
+    chunks = list(stream_advice(*_receipt(), first_token_timeout=1.0, deadline=0.5))
+    assert chunks[:2] == ["Spend ", "less "]
+    assert chunks[-1].lstrip().startswith("Budgeting advice:")
+    # giving up closes the connection, so the reader thread does not wait out the stall
+    deadline = time.perf_counter() + 1.0
+    while any(t.name == "advice-stream" for t in threading.enumerate()) and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert not any(t.name == "advice-stream" for t in threading.enumerate())
+
+
+def test_prompt_budget_aggregates_small_items():
+    items, analysis = _receipt(200)
+    analysis["anomalies"]["expensive_items"] = [{"name": "item 3", "total": 4.0}]
+    full = _build_prompt(items, analysis, max_tokens=100_000)
+    assert full.count("\n- item ") == 200
+    prompt = _build_prompt(items, analysis, max_tokens=400)
+    assert estimate_tokens(prompt) <= 400 + 5
+    assert "- item 3 |" in prompt and "- item 199 |" in prompt  # flagged, then the largest
+    assert "- item 0 |" not in prompt
+    assert "- other snacks:" in prompt and "- other groceries:" in prompt
+    kept = prompt.count("\n- item ")
+    other = sum(int(line.split(": ")[1].split()[0]) for line in prompt.splitlines() if line.startswith("- other"))
+    assert kept + other == 200
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from receipt_analyzer.batch import _advise_record
+from receipt_analyzer.llm_client import AdviceService, AsyncAdviceClient, build_batch_prompt, split_batch_answer
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Mimics POST /v1/chat/completions; echoes a summary of the user prompt."""
+
+    def do_POST(self):
+        srv = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with srv.lock:
+            srv.calls += 1
+            srv.active += 1
+            srv.max_active = max(srv.max_active, srv.active)
+            fail = srv.fail_next > 0
+            srv.fail_next -= 1 if fail else 0
+        try:
+            time.sleep(srv.delay)
+            if fail:
+                self.send_response(503)
+                self.end_headers()
+                return
+            prompt = body["messages"][-1]["content"]
+            if "=== RECEIPT" in prompt:
+                n = prompt.count("=== RECEIPT ") - 1  # header mentions the marker once
+                content = "\n".join(f"=== RECEIPT {i} ===\nadvice {i}" for i in range(1, n + 1))
+            else:
+                content = f"advice for {len(prompt)} chars"
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        finally:
+            with srv.lock:
+                srv.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    srv.lock = threading.Lock()
+    srv.calls = srv.active = srv.max_active = srv.fail_next = 0
+    srv.delay = 0.0
+    t = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    t.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _client(srv, **kw):
+    return AsyncAdviceClient(api_key="test", base_url=f"http://127.0.0.1:{srv.server_port}/v1", **kw)
+
+
+def _receipt(total):
+    items = [{"name": "Milk", "quantity": 1, "price": total}]
+    return items, {"overall_total": total, "category_totals": {"groceries": total}, "anomalies": {}}
+
+
+def test_concurrency_limit_and_cache(stub_server):
+    stub_server.delay = 0.05
+    client = _client(stub_server, max_concurrency=2)
+    receipts = [_receipt(float(i)) for i in range(6)] + [_receipt(0.0)]
+    advice = asyncio.run(client.advise_many(receipts))
+    assert all(a.startswith("advice for") for a in advice)
+    assert stub_server.calls == 6  # the repeated receipt is served from the cache / shared request
+    assert stub_server.max_active <= 2
+
+
+def test_cancelled_caller_does_not_cancel_shared_request(stub_server):
+    stub_server.delay = 0.2
+    client = _client(stub_server)
+
+    async def main():
+        first = asyncio.ensure_future(client.advise(*_receipt(1.0)))
+        second = asyncio.ensure_future(client.advise(*_receipt(1.0)))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await second, first.cancelled()
+
+    advice, cancelled = asyncio.run(main())
+    assert cancelled and advice.startswith("advice for")
+    assert stub_server.calls == 1
+
+
+def test_client_reused_across_event_loops(stub_server):
+    stub_server.delay = 0.02
+    client = _client(stub_server, max_concurrency=1)
+    for run in range(2):  # a semaphore bound to the first loop would fail the second run
+        receipts = [_receipt(float(10 * run + i)) for i in range(3)]
+        assert all(a.startswith("advice for") for a in asyncio.run(client.advise_many(receipts)))
+    assert stub_server.calls == 6 and stub_server.max_active == 1
+
+
+def test_advice_service_from_threads(stub_server):
+    stub_server.delay = 0.02
+    records = [{"items": _receipt(float(i))[0], "analysis": _receipt(float(i))[1]} for i in range(8)]
+    records.append({"file": "x.jpg", "error": "unreadable"})
+    with AdviceService(_client(stub_server, max_concurrency=3)) as service:
+        futures = [service.submit(_advise_record(service.client, r)) for r in records]
+        done = [f.result(timeout=5) for f in futures]
+    assert all(r["advice"].startswith("advice for") for r in done[:-1]) and "advice" not in done[-1]
+    assert stub_server.max_active <= 3
+
+
+def test_retries_then_succeeds(stub_server):
+    stub_server.fail_next = 2
+    client = _client(stub_server, backoff=0.01)
+    assert asyncio.run(client.advise(*_receipt(3.0))).startswith("advice for")
+    assert stub_server.calls == 3
+
+
+def test_falls_back_to_heuristic_after_retries(stub_server):
+    stub_server.fail_next = 10
+    client = _client(stub_server, backoff=0.01, max_retries=1)
+    assert asyncio.run(client.advise(*_receipt(3.0))).startswith("Budgeting advice:")
+    assert stub_server.calls == 2
+
+
+def test_batched_requests_are_split(stub_server):
+    client = _client(stub_server)
+    advice = asyncio.run(client.advise_many([_receipt(float(i + 1)) for i in range(5)], batch_size=2))
+    assert advice[:4] == ["advice 1", "advice 2", "advice 1", "advice 2"]
+    assert advice[4].startswith("advice for")  # a lone receipt goes through the single-prompt path
+    assert stub_server.calls == 3
+
+
+def test_split_batch_answer_missing_sections():
+    prompt = build_batch_prompt(["a", "b"])
+    assert "=== RECEIPT 2 ===" in prompt
+    assert split_batch_answer("=== RECEIPT 2 ===\nonly two", 3) == [None, "only two", None]
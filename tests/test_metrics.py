@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from receipt_analyzer import metrics
+from receipt_analyzer.categorizer import categorize_items
+from receipt_analyzer.parser import parse_items_from_text
+
+
+@pytest.fixture
+def enabled_metrics():
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    yield metrics.REGISTRY
+    metrics.enable(False)
+    metrics.REGISTRY.reset()
+
+
+def test_disabled_is_noop():
+    metrics.enable(False)
+    metrics.REGISTRY.reset()
+    with metrics.timed("parse"):
+        pass
+    metrics.inc("items_total", 3, stage="parse")
+    assert metrics.REGISTRY.snapshot() == {"counters": [], "histograms": []}
+
+
+def test_stages_record_timings_and_counts(enabled_metrics):
+    items = categorize_items(parse_items_from_text("Milk 2 3.50 7.00\nBread 1 2.00 2.00\n"))
+    snap = enabled_metrics.snapshot()
+    stages = {h["labels"]["stage"] for h in snap["histograms"] if h["name"] == "stage_seconds"}
+    assert {"parse", "categorize"} <= stages
+    counts = {c["labels"]["stage"]: c["value"] for c in snap["counters"] if c["name"] == "items_total"}
+    assert counts == {"parse": len(items), "categorize": len(items)}
+
+
+def test_prometheus_text(enabled_metrics):
+    metrics.inc("ocr_fallback_total", **{"from": "easyocr", "to": "tesseract"})
+    metrics.observe("stage_seconds", 0.003, stage="ocr.decode")
+    text = metrics.to_prometheus()
+    assert '# TYPE receipt_ocr_fallback_total counter' in text
+    assert 'receipt_ocr_fallback_total{from="easyocr",to="tesseract"} 1' in text
+    assert 'receipt_stage_seconds_bucket{stage="ocr.decode",le="0.0025"} 0' in text
+    assert 'receipt_stage_seconds_bucket{stage="ocr.decode",le="0.005"} 1' in text
+    assert 'receipt_stage_seconds_count{stage="ocr.decode"} 1' in text
+
+
+def test_snapshot_merge(enabled_metrics):
+    metrics.inc("ocr_engine_total", engine="easyocr")
+    metrics.observe("stage_seconds", 0.2, stage="ocr.easyocr")
+    snap = json.loads(metrics.to_json())
+    other = metrics.Registry()
+    other.merge(snap)
+    other.merge(snap)
+    merged = other.snapshot()
+    assert merged["counters"][0]["value"] == 2
+    assert merged["histograms"][0]["count"] == 2
+    assert merged["histograms"][0]["sum"] == pytest.approx(0.4)
+
+
+def test_analyze_file_keeps_global_counts(enabled_metrics, monkeypatch):
+    from receipt_analyzer import batch, ocr
+
+    monkeypatch.setattr(ocr, "ocr_image_bytes", lambda path: ("Milk 1 2.00 2.00", {}))
+    metrics.inc("ocr_engine_total", engine="easyocr")
+    with metrics.timed("file"):
+        pass
+    first = batch.analyze_file("a.png")
+    second = batch.analyze_file("b.png")
+    for record in (first, second):
+        snap = record["_metrics"]
+        assert not any(c["name"] == "ocr_engine_total" for c in snap["counters"])
+        (file_stage,) = [h for h in snap["histograms"] if h["labels"] == {"stage": "file"}]
+        assert file_stage["count"] == 1 and sum(file_stage["counts"]) <= 1
+    text = metrics.to_prometheus()  # the caller's counts survive in-process calls
+    assert 'receipt_ocr_engine_total{engine="easyocr"} 1' in text
+    assert 'receipt_stage_seconds_count{stage="file"} 3' in text
@@ -0,0 +1,44 @@
+from receipt_analyzer.analyzer import analyze_items
+from receipt_analyzer.categorizer import categorize_items
+from receipt_analyzer.models import Item, Receipt, ReceiptBatch
+from receipt_analyzer.parser import parse_items_from_text, parse_receipt
+
+TEXT = "Milk\n2 3.50 7.00\nBread\n1 2.00 2.00\nRibeye Steak\n1 25.00 25.00\nChips\n3 1.25 3.75\n"
+
+
+def test_items_work_with_dict_based_stages():
+    receipt = parse_receipt(TEXT, file="r.jpg")
+    dicts = parse_items_from_text(TEXT)
+    assert receipt.to_dicts() == dicts
+    assert Receipt.from_dicts(dicts).items == receipt.items
+    categorize_items(receipt.items)
+    categorize_items(dicts)
+    assert [it.category for it in receipt] == [d["category"] for d in dicts]
+    assert analyze_items(receipt.items) == analyze_items(dicts)
+    it = receipt.items[0]
+    assert it["rate"] == it.price and it.get("amount") == it.line_total == 7.0
+    assert not hasattr(it, "__dict__")
+
+
+def test_batch_columns_analysis_and_roundtrip(tmp_path):
+    receipts = [categorize_items(parse_items_from_text(TEXT)),
+                [Item("Milk", 1, 3.5, 3.5, "dairy"), Item("Cola", 2, 1.0, None)],
+                categorize_items(parse_items_from_text("Eggs\n1 4.10 4.10\nMilk\n1 3.50 3.50"))]
+    batch = ReceiptBatch.from_receipts(receipts)
+    assert len(batch) == 3 and batch.n_items == 8
+    assert batch.names.count("Milk") == 1 and batch.name_codes[0] == batch.name_codes[4]
+
+    expected = [analyze_items([it if isinstance(it, dict) else it.to_dict() for it in r]) for r in receipts]
+    assert batch.analyze().to_dicts() == expected
+
+    df = batch.to_pandas()
+    assert list(df["line_total"]) == [7.0, 2.0, 25.0, 3.75, 3.5, 2.0, 4.1, 3.5]
+    assert df["category"].isna().sum() == 1  # the uncategorized cola
+
+    path = str(tmp_path / "batch.npz")
+    batch.save(path)
+    loaded = ReceiptBatch.load(path)
+    assert [list(r) for r in loaded] == [list(r) for r in batch]
+    loaded.append([Item("Tea", 1, 1.0, 1.0, "beverages")])
+    assert len(loaded) == 4 and loaded.categories == batch.categories + (
+        [] if "beverages" in batch.categories else ["beverages"])
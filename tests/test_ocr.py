@@ -0,0 +1,322 @@
+import pytest
+
+from receipt_analyzer.ocr import OCRResult, _words_from_easyocr, _words_from_tesseract_data
+
+
+def test_easyocr_words_and_lazy_data():
+    results = [([[10, 5], [60, 5], [60, 20], [10, 20]], "Milk", 0.9),
+               ([[70, 5], [100, 5], [100, 20], [70, 20]], "3.50", 0.5)]
+    r = OCRResult("Milk\n3.50", _words_from_easyocr(results), "easyocr")
+    assert r.words[0].left == 10 and r.words[0].width == 50 and r.words[0].height == 15
+    assert r.data["text"] == ["Milk", "3.50"]
+    assert r.data["conf"] == [90.0, 50.0]
+
+
+def test_tesseract_data_single_pass_text():
+    d = {
+        "text": ["", "Milk", "3.50", "Bread", ""],
+        "conf": [-1, 91, 88, 95, -1],
+        "left": [0, 1, 40, 1, 0], "top": [0, 2, 2, 20, 0],
+        "width": [0, 30, 20, 30, 0], "height": [0, 10, 10, 10, 0],
+        "block_num": [1, 1, 1, 1, 1], "par_num": [1, 1, 1, 1, 1],
+        "line_num": [0, 1, 1, 2, 2],
+    }
+    text, words = _words_from_tesseract_data(d)
+    assert text == "Milk 3.50\nBread"
+    assert [w.text for w in words] == ["Milk", "3.50", "Bread"]
+    assert OCRResult("").data == {}
+
+
+def test_cache_hit_skips_decoding(tmp_path, monkeypatch):
+    from receipt_analyzer import ocr
+
+    cache = ocr.OCRCache(str(tmp_path))
+    calls = []
+
+    def fake_run(image_bytes, detail, preset, cascade=None, tile=None):
+        calls.append(image_bytes)
+        return OCRResult("Milk 3.50", [ocr.OCRWord("Milk", 90.0, 1, 2, 3, 4)], "easyocr")
+
+    monkeypatch.setattr(ocr, "_run_ocr", fake_run)
+    first = ocr.ocr_image(b"not an image", cache=cache)
+    second = ocr.ocr_image(b"not an image", detail=True, cache=cache)
+    assert calls == [b"not an image"]
+    assert second.text == first.text and second.words == first.words
+
+
+def test_easyocr_batches_pad_to_a_common_shape(monkeypatch):
+    import numpy as np
+    from receipt_analyzer import ocr
+
+    class Reader:
+        def __init__(self):
+            self.batches = []
+
+        def readtext_batched(self, arrays):
+            assert len({a.shape for a in arrays}) == 1
+            self.batches.append(len(arrays))
+            return [self._read(a) for a in arrays]
+
+        def readtext(self, arr):
+            self.batches.append(1)
+            return self._read(arr)
+
+        def _read(self, arr):  # "text" is the count of dark pixels, unchanged by white padding
+            return [([[0, 0], [5, 0], [5, 5], [0, 5]], f"{(arr < 128).sum()}", 0.9)]
+
+    reader = Reader()
+    monkeypatch.setattr(ocr, "_has_easyocr", lambda: True)
+    monkeypatch.setattr(ocr, "_get_easyocr_reader", lambda: reader)
+    images = []
+    for h, w in [(100, 400), (98, 402), (104, 396), (2000, 400)]:
+        img = np.full((h, w), 255, dtype=np.uint8)
+        img[10:20, 10:10 + h // 10] = 0
+        images.append(img)
+    results = ocr._easyocr_batch(images)
+    assert sorted(reader.batches) == [1, 3]  # the tall image would triple the padded area
+    assert [r.text for r in results] == [str(10 * (h // 10)) for h in (100, 98, 104, 2000)]
+
+
+def test_easyocr_readers_pool_lets_calls_run_at_once(monkeypatch):
+    import threading
+    import types
+
+    import numpy as np
+    from receipt_analyzer import ocr
+
+    both_inside = threading.Barrier(2, timeout=5)
+
+    class Reader:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def readtext(self, arr):
+            both_inside.wait()  # only returns once the other call is reading too
+            return [([[0, 0], [5, 0], [5, 5], [0, 5]], "Milk", 0.9)]
+
+    shared = Reader()
+    monkeypatch.setenv("RECEIPT_EASYOCR_READERS", "2")
+    monkeypatch.setattr(ocr, "_has_easyocr", lambda: True)
+    monkeypatch.setattr(ocr, "_get_easyocr_reader", lambda: shared)
+    monkeypatch.setattr(ocr, "easyocr", types.SimpleNamespace(Reader=Reader))
+    monkeypatch.setattr(ocr, "_extra_readers", [])
+    monkeypatch.setattr(ocr, "_extra_reader_count", 0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.extend(ocr._easyocr_batch([np.zeros((8, 8))])))
+               for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r.text for r in results] == ["Milk", "Milk"]
+    assert ocr._extra_reader_count == 1 and len(ocr._extra_readers) == 1 and not ocr._shared_reader_busy
+
+
+def test_unreachable_ocr_server_falls_back_to_local(monkeypatch):
+    from receipt_analyzer import ocr
+    from receipt_analyzer.ocr_server import OCRClient
+
+    def timeout(self, *args):
+        raise TimeoutError("timed out")
+
+    monkeypatch.setenv("RECEIPT_OCR_SERVER", "http://127.0.0.1:9")
+    monkeypatch.setattr(OCRClient, "ocr", timeout)
+    monkeypatch.setattr(ocr, "_run_ocr", lambda *args: OCRResult("Milk 3.50", engine="tesseract"))
+    monkeypatch.setattr(ocr, "get_default_cache", lambda: None)
+    assert ocr.ocr_image(b"not an image").text == "Milk 3.50"
+
+
+def test_failing_ocr_server_falls_back_to_local(monkeypatch, caplog):
+    from receipt_analyzer import metrics, ocr
+    from receipt_analyzer.ocr_server import OCRClient
+
+    def server_error(self, *args):
+        raise RuntimeError("OCR server error 500: TimeoutError")
+
+    monkeypatch.setenv("RECEIPT_OCR_SERVER", "http://127.0.0.1:9")
+    monkeypatch.setattr(OCRClient, "ocr", server_error)
+    monkeypatch.setattr(ocr, "_run_ocr", lambda *args: OCRResult("Milk 3.50", engine="tesseract"))
+    monkeypatch.setattr(ocr, "get_default_cache", lambda: None)
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    try:
+        with caplog.at_level("WARNING", logger="receipt_analyzer.ocr"):
+            assert ocr.ocr_image(b"not an image", tile=True).text == "Milk 3.50"
+    finally:
+        metrics.enable(False)
+    assert "ignores tile" in caplog.text and "running OCR locally" in caplog.text
+    assert 'receipt_ocr_fallback_total{from="server",to="local"} 1' in metrics.to_prometheus()
+
+
+def test_cache_lru_eviction(tmp_path):
+    import os
+    from receipt_analyzer import ocr
+
+    cache = ocr.OCRCache(str(tmp_path))
+    keys = [cache.key(bytes([i])) for i in range(5)]
+    for i, k in enumerate(keys):
+        cache.put(k, OCRResult("x" * 60, engine="tesseract"))
+        os.utime(cache._path(k), (i, i))
+    cache.get(keys[0])  # refresh the oldest entry
+    cache.max_bytes = 3 * os.path.getsize(cache._path(keys[0]))
+    cache.evict()
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[4]) is not None
+
+
+def test_preprocess_presets_downscale_and_binarize(monkeypatch):
+    import io
+    import pytest
+    from PIL import Image, ImageDraw
+    from receipt_analyzer import ocr
+
+    img = Image.new("RGB", (1200, 3000), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(20, 2980, 40):
+        draw.text((20, y), "BREAD 2.00 4.00", fill="black")
+    buf = io.BytesIO()
+    img.save(buf, "JPEG")
+    fast = ocr.preprocess_image_bytes(buf.getvalue(), "fast")
+    quality = ocr.preprocess_image_bytes(buf.getvalue(), "quality")
+    size = lambda im: im.shape[:2] if hasattr(im, "shape") else im.size[::-1]
+    assert max(size(fast)) <= 1600
+    assert size(quality) == (3000, 1200)
+    with pytest.raises(ValueError):
+        ocr.preprocess_image_bytes(buf.getvalue(), "nope")
+    monkeypatch.delenv("RECEIPT_PREPROCESS_PRESET", raising=False)
+    assert ocr._resolve_preset() is ocr.PRESETS["quality"]  # fast/balanced are opt-in
+
+
+def test_words_to_text_groups_boxes_into_lines():
+    from receipt_analyzer.ocr import OCRWord, _words_to_text
+
+    words = [OCRWord("3.50", 90, 200, 12, 40, 16), OCRWord("Milk", 90, 10, 10, 50, 18),
+             OCRWord("Bread", 90, 10, 40, 60, 18), OCRWord("2.00", 90, 200, 43, 40, 16)]
+    assert _words_to_text(words) == "Milk 3.50\nBread 2.00"
+
+
+def test_cascade_rereads_only_low_confidence_regions(monkeypatch):
+    from PIL import Image
+    from receipt_analyzer import ocr
+
+    primary = OCRResult("Milk\n3.5O\nBread\n2.00", [
+        ocr.OCRWord("Milk", 95.0, 10, 10, 50, 18), ocr.OCRWord("3.5O", 30.0, 200, 12, 40, 16),
+        ocr.OCRWord("Bread", 92.0, 10, 40, 60, 18), ocr.OCRWord("2.00", 45.0, 200, 43, 40, 16)], "easyocr")
+    monkeypatch.setattr(ocr, "_easyocr_batch", lambda pils: [primary] * len(pils))
+    crops = []
+
+    def fake_region(crop, engine, timeout):
+        crops.append(crop.size)
+        return ("3.50", 88.0) if len(crops) == 1 else ("2.0O", 20.0)
+
+    monkeypatch.setattr(ocr, "_recognize_region", fake_region)
+    cfg = ocr.CascadeConfig(min_conf=50.0, pad=2)
+    res = ocr._recognize_batch([Image.new("L", (300, 80), 255)], [False], cfg)[0]
+    assert crops == [(44, 20), (44, 20)]  # the two weak words, least confident first
+    assert res.text == "Milk 3.50\nBread 2.00"
+    assert res.engine == "easyocr+tesseract"
+
+
+def test_tesserocr_engine_reuses_pooled_handles(monkeypatch):
+    import sys
+    import threading
+    import types
+    from PIL import Image
+    from receipt_analyzer import ocr
+
+    created = []
+
+    class FakeAPI:
+        def __init__(self, lang, path=None):
+            created.append(self)
+
+        def SetPageSegMode(self, psm):
+            pass
+
+        def SetImageBytes(self, data, width, height, bpp, stride):
+            assert len(data) == height * stride
+            self.size = (width, height)
+
+        def Recognize(self, timeout=0):
+            return True
+
+        def GetUTF8Text(self):
+            return f"{self.size[0]}x{self.size[1]}"
+
+        def Clear(self):
+            pass
+
+        def End(self):
+            pass
+
+    fake = types.SimpleNamespace(PyTessBaseAPI=FakeAPI, PSM=types.SimpleNamespace(AUTO=3))
+    monkeypatch.setitem(sys.modules, "tesserocr", fake)
+    engine = ocr.make_tesseract_engine("tesserocr", pool_size=2)
+    assert isinstance(engine, ocr.TesserocrEngine)
+    texts = []
+    threads = [threading.Thread(target=lambda: texts.append(engine.read(Image.new("L", (8, 4)), False)[0]))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert texts == ["8x4"] * 8
+    assert 1 <= len(created) <= 2
+
+    monkeypatch.setitem(sys.modules, "tesserocr", None)  # import fails -> pytesseract fallback
+    assert isinstance(ocr.make_tesseract_engine("auto"), ocr.PytesseractEngine)
+
+    class Incomplete(ocr.TesseractEngine):
+        def read(self, image, detail, psm=None, timeout=None):
+            return "", []
+
+    with pytest.raises(TypeError):  # backends must implement version() too
+        Incomplete()
+
+
+def test_preprocess_accepts_paths_buffers_and_arrays(tmp_path):
+    import io
+    import mmap
+    import numpy as np
+    from PIL import Image, ImageDraw
+    from receipt_analyzer import ocr
+
+    img = Image.new("RGB", (900, 400), "white")
+    ImageDraw.Draw(img).text((20, 20), "MILK 3.50", fill="black")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    data = buf.getvalue()
+    path = tmp_path / "r.png"
+    path.write_bytes(data)
+
+    expected = ocr.preprocess_image(data, "quality")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        from_mmap = ocr.preprocess_image(mm, "quality")
+    for out in (from_mmap, ocr.preprocess_image(str(path), "quality"), ocr.preprocess_image(path, "quality"),
+                ocr.preprocess_image(memoryview(data), "quality"), ocr.preprocess_image(img, "quality"),
+                ocr.preprocess_image(np.asarray(img), "quality")):
+        assert np.array_equal(np.asarray(out), np.asarray(expected))
+
+    cache = ocr.OCRCache(str(tmp_path / "cache"))
+    assert cache.key(path) == cache.key(data) == cache.key(memoryview(data))
+    assert cache.key(np.asarray(img)) != cache.key(np.asarray(img)[:10])
+
+
+def test_pytesseract_uses_the_discovered_binary(tmp_path, monkeypatch):
+    import types
+    from receipt_analyzer import ocr
+
+    exe = tmp_path / "tesseract"
+    exe.write_text("")
+    calls = []
+    tess = types.SimpleNamespace(pytesseract=types.SimpleNamespace(tesseract_cmd="tesseract"),
+                                 image_to_string=lambda image, config, timeout: calls.append(
+                                     tess.pytesseract.tesseract_cmd) or "Milk 3.50")
+    monkeypatch.setattr(ocr, "pytesseract", tess)
+    monkeypatch.setattr(ocr, "_tesseract_configured", False)
+    monkeypatch.setattr(ocr.shutil, "which", lambda name: None)
+    monkeypatch.setenv("TESSERACT_CMD", str(exe))
+    monkeypatch.delenv("TESSDATA_PREFIX", raising=False)
+    assert ocr.PytesseractEngine().read(None, False) == ("Milk 3.50", [])
+    assert calls == [str(exe)]
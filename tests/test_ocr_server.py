@@ -0,0 +1,67 @@
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from receipt_analyzer.ocr import OCRResult
+from receipt_analyzer.ocr_server import MicroBatcher, OCRClient, OCRServer
+
+
+def _png(width):
+    buf = io.BytesIO()
+    Image.new("RGB", (width, 40), "white").save(buf, "PNG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def server():
+    batches = []
+
+    def recognize_batch(processed, details):
+        batches.append(len(processed))
+        return [OCRResult(f"width {p.shape[1] if hasattr(p, 'shape') else p.size[0]}", engine="stub")
+                for p in processed]
+
+    batcher = MicroBatcher(recognize_batch, max_batch=4, max_wait=0.2)
+    srv = OCRServer(("127.0.0.1", 0), batcher, preset="quality")
+    t = threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    t.start()
+    srv.batches_seen = batches
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+    batcher.close()
+
+
+def test_client_roundtrip_and_micro_batching(server):
+    client = OCRClient(f"http://127.0.0.1:{server.server_port}")
+    results = [None] * 4
+
+    def call(i):
+        results[i] = client.ocr(_png(100 + i))
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [r.text for r in results] == [f"width {100 + i}" for i in range(4)]
+    assert sum(server.batches_seen) == 4 and len(server.batches_seen) < 4
+    assert client.health()["images"] == 4
+
+
+def test_bad_image_is_a_client_error(server):
+    client = OCRClient(f"http://127.0.0.1:{server.server_port}")
+    with pytest.raises(ValueError):
+        client.ocr(b"not an image")
+
+
+def test_custom_preset_is_sent_field_by_field(server):
+    from receipt_analyzer.ocr import PreprocessPreset
+
+    client = OCRClient(f"http://127.0.0.1:{server.server_port}")
+    assert client.ocr(_png(400), preset=PreprocessPreset("quality", max_side=200)).text == "width 200"
+    assert client.ocr(_png(400), preset="quality").text == "width 400"
+    with pytest.raises(ValueError):
+        client.ocr(_png(400), preset="sharpest")
@@ -13,3 +13,39 @@ def test_basic_parse():
     assert any(i['name'].lower().startswith('bread') for i in items)
     total = sum(i['price'] * i.get('quantity', 1) for i in items)
     assert abs(total - 7.0) < 0.01
+
+
+def test_iter_items_streams_lines():
+    import io
+    from receipt_analyzer.parser import iter_items
+
+    text = "Invoice 12345678\nChicken Breast\nMeat\n2 5.00 10.00\nMilk 3.50\n12.00\n"
+    lines = iter(io.StringIO(text))
+    items = iter_items(lines)
+    first = next(items)
+    assert first['name'].startswith('Chicken Breast')
+    assert first['line_total'] == 10.0
+    assert [i['name'] for i in items] == ['Milk']
+    assert parse_items_from_text(text)[0] == first
+
+
+def test_parse_date_formats():
+    from receipt_analyzer.parser import parse_date, parse_receipt
+
+    assert parse_date("SHOP\nDate: 2026-02-11 11:37 AM\nMilk 3.50") == "2026-02-11"
+    assert parse_date("02/11/2026") == "2026-02-11"
+    assert parse_date("25.12.25") == "2025-12-25"
+    assert parse_date("Wed 11 Feb 2026") == parse_date("February 11, 2026") == "2026-02-11"
+    assert parse_date("13/13/2025\nMilk 3.50\nTel 555-1234") is None
+    assert parse_receipt("03/05/2024\nMilk 3.50").date == "2024-03-05"
+
+
+def test_glued_numbers():
+    from receipt_analyzer.parser import parse_receipt
+
+    [milk] = parse_receipt("MILK3.50").items
+    assert (milk.name, milk.price) == ("MILK", 3.5)
+    [apples] = parse_receipt("Apples x2 1.50 3.00").items
+    assert (apples.name, apples.quantity, apples.price) == ("Apples", 2.0, 1.5)
+    [chicken] = parse_receipt("CH1CKEN BREAS7 1 5.00 5.00").items
+    assert (chicken.name, chicken.price) == ("CH1CKEN BREAS", 5.0)
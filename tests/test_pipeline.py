@@ -0,0 +1,93 @@
+import io
+import itertools
+import json
+import threading
+import time
+
+from PIL import Image, ImageDraw
+
+from receipt_analyzer import pipeline
+from receipt_analyzer.ocr import OCRResult
+from receipt_analyzer.pipeline import Checkpoint, Pipeline, PipelineConfig
+
+
+def _fake_recognize(processed, cascade):
+    return OCRResult("Milk\n1 3.50 3.50\nBread\n2 1.25 2.50", [], "easyocr")
+
+
+def _image(path, shade=0):
+    img = Image.new("L", (200, 120), 255)
+    ImageDraw.Draw(img).rectangle((20, 40, 180, 60), fill=shade)
+    img.save(path)
+    return path
+
+
+def _config(**kw):
+    return PipelineConfig(ocr_processes=False, ocr_workers=2, advice=False, **kw)
+
+
+def _setup(monkeypatch):
+    monkeypatch.delenv("RECEIPT_OCR_CACHE_DIR", raising=False)
+    monkeypatch.setattr(pipeline, "_recognize", _fake_recognize)
+
+
+def test_pipeline_writes_records_and_resumes_from_checkpoint(tmp_path, monkeypatch):
+    _setup(monkeypatch)
+    paths = [_image(tmp_path / f"r{i}.png") for i in range(4)]
+    ckpt = tmp_path / "done.txt"
+
+    out = io.StringIO()
+    cp = Checkpoint(str(ckpt))
+    summary = Pipeline(_config(), cp, progress=None).run(paths, out, handle_signals=False)
+    cp.close()
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert summary["files"] == 4 and summary["errors"] == 0
+    assert sorted(r["file"] for r in records) == sorted(map(str, paths))
+    assert all(r["analysis"]["overall_total"] == 6.0 for r in records)
+
+    _image(paths[2], shade=80)  # changed file: redone
+    out = io.StringIO()
+    cp = Checkpoint(str(ckpt))
+    summary = Pipeline(_config(), cp, progress=None).run(paths, out, handle_signals=False)
+    cp.close()
+    assert summary["skipped"] == 3
+    assert [json.loads(line)["file"] for line in out.getvalue().splitlines()] == [str(paths[2])]
+
+
+def test_bounded_queues_hold_back_the_source(tmp_path, monkeypatch):
+    _setup(monkeypatch)
+    path = _image(tmp_path / "r.png")
+    pulled = 0
+
+    def source():
+        nonlocal pulled
+        for _ in range(100):
+            pulled += 1
+            yield path
+
+    release = threading.Event()
+    cfg = _config(queue_size=2)
+    p = Pipeline(cfg, progress=None, on_record=lambda r: release.wait())
+    result = {}
+    t = threading.Thread(target=lambda: result.update(p.run(source(), io.StringIO(), handle_signals=False)),
+                         daemon=True)
+    t.start()
+    try:
+        time.sleep(0.5)
+        # 6 queues, one job per worker, one held by the feeder
+        workers = cfg.read_workers + cfg.preprocess_workers + cfg.ocr_workers + 3
+        assert pulled <= 6 * cfg.queue_size + workers + 1
+    finally:
+        release.set()
+    t.join(10)
+    assert result["files"] == 100
+
+
+def test_stop_drains_jobs_in_flight(tmp_path, monkeypatch):
+    _setup(monkeypatch)
+    path = _image(tmp_path / "r.png")
+    p = Pipeline(_config(), progress=None)
+    p.on_record = lambda r: p.stop() if p.counts["written"] >= 2 else None
+    summary = p.run(itertools.repeat(path), io.StringIO(), handle_signals=False)
+    assert summary["interrupted"]
+    assert summary["files"] == p.counts["read"] >= 3
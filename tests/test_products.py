@@ -0,0 +1,116 @@
+import random
+import string
+
+from receipt_analyzer import categorizer
+from receipt_analyzer.categorizer import CATEGORY_KEYWORDS, Categorizer, categorize_receipts
+from receipt_analyzer.models import Item
+from receipt_analyzer.parser import parse_receipt
+from receipt_analyzer.products import ProductDictionary, fold, levenshtein
+from receipt_analyzer.storage import ReceiptStore
+
+PRODUCTS = [
+    ("Chicken Breast", "meat", ()),
+    ("Chicken Thighs", "meat", ()),
+    ("Whole Milk 1L", "groceries", ("Milk Whole",)),
+    ("Semi Skimmed Milk 1L", "groceries", ()),
+    ("Orange Juice", "beverages", ("OJ Fresh",)),
+    ("Cheddar Cheese Mature", "groceries", ()),
+    ("Ibuprofen 200mg Tablets", "pharmacy", ()),
+]
+
+
+def _reference_levenshtein(a, b):
+    row = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        prev, row[0] = row[0], i
+        for j, cb in enumerate(b, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (ca != cb))
+    return row[-1]
+
+
+def test_fold_maps_ocr_lookalikes():
+    assert fold("CH1CKEN BREAS7") == fold("Chicken Breast") == "chicken breast"
+    assert fold("  0RANGE-JUlCE.. ") == "orange juice"
+    assert fold("Sernolina") == fold("Semolina")
+
+
+def test_levenshtein_matches_reference_with_cutoff():
+    rng = random.Random(0)
+    for _ in range(2000):
+        a = "".join(rng.choices("abc ", k=rng.randint(0, 20)))
+        b = "".join(rng.choices("abc ", k=rng.randint(0, 20)))
+        want = _reference_levenshtein(a, b)
+        assert levenshtein(a, b) == want
+        cutoff = rng.randint(0, 5)
+        assert levenshtein(a, b, cutoff) == min(want, cutoff + 1)
+
+
+def test_lookup_exact_fuzzy_and_aliases():
+    pd = ProductDictionary(PRODUCTS)
+    m = pd.best("CH1CKEN BREAS7")
+    assert (m.name, m.category, m.distance) == ("Chicken Breast", "meat", 0)
+    m = pd.best("Chickn Brest")
+    assert (m.name, m.distance) == ("Chicken Breast", 2)
+    assert pd.best("0J FRESH").name == "Orange Juice"
+    assert pd.best("Ibuprofen 200 mg tabs").category == "pharmacy"
+    assert pd.best("garden hose") is None
+    wide = ProductDictionary(PRODUCTS, max_edits=8)
+    hits = wide.lookup("Chicken Thighs", k=2, max_error=0.5)
+    assert [m.name for m in hits] == ["Chicken Thighs", "Chicken Breast"]
+
+
+def test_lookup_matches_brute_force():
+    rng = random.Random(1)
+    words = ["".join(rng.choices(string.ascii_lowercase[:8], k=rng.randint(3, 7))) for _ in range(40)]
+    names = sorted({" ".join(rng.sample(words, rng.randint(1, 3))) for _ in range(300)})
+    pd = ProductDictionary((n, "x", ()) for n in names)
+    for _ in range(100):
+        q = list(rng.choice(names))
+        for _ in range(rng.randint(0, 3)):
+            q[rng.randrange(len(q))] = rng.choice(string.ascii_lowercase[:8])
+        q = fold("".join(q))
+        d = pd._max_distance(q, None)
+        dists = sorted((_reference_levenshtein(q, fold(n)), i) for i, n in enumerate(names))
+        got = pd.lookup(q, k=3)
+        # ties at the k-th distance may resolve to any of the tied names
+        assert [m.distance for m in got] == [dist for dist, _ in dists[:3] if dist <= d]
+        assert all(_reference_levenshtein(q, fold(m.name)) == m.distance for m in got)
+
+
+def test_from_file_and_categorizer_integration(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("name,category,aliases\n# comment\nChicken Breast,meat,Chkn Brst|Breast Fillet\n"
+                    "Oat Milk,beverages\n")
+    pd = ProductDictionary.from_file(str(path))
+    assert len(pd) == 2 and pd.best("CHKN BRST").name == "Chicken Breast"
+
+    c = Categorizer(CATEGORY_KEYWORDS, products=str(path))
+    assert c.categorize("0at M1lk") == "beverages"  # keywords alone would say groceries
+    receipts = categorize_receipts([[{"name": "CH1CKEN BREAS7", "price": 5.0}, {"name": "Croissant"}],
+                                    [{"name": "Chicken Breas", "price": 4.0}]], c)
+    assert [[i["category"] for i in r] for r in receipts] == [["meat", "bakery"], ["meat"]]
+    assert receipts[0][0]["canonical_name"] == "Chicken Breast" and "canonical_name" not in receipts[0][1]
+
+    with ReceiptStore() as store:
+        store.add_receipts({"items": r, "analysis": {}} for r in receipts)
+        assert [p for _, p, _ in store.item_history("chicken breast")] == [5.0, 4.0]
+
+
+def test_dictionary_over_parsed_receipt():
+    c = Categorizer(CATEGORY_KEYWORDS, products=ProductDictionary([("Chicken Breast", "meat", [])]))
+    receipt = parse_receipt("CH1CKEN BREAS7\n1 5.00 5.00\nCroissant 1 2.00 2.00")
+    assert receipt.items[0].name == "CH1CKEN BREAS"  # digits inside a word stay in the name for fold()
+    items = categorize_receipts([receipt.items], c)[0]
+    assert (items[0]["category"], items[0]["canonical_name"]) == ("meat", "Chicken Breast")
+    assert "canonical_name" not in items[1]
+    assert Item.from_dict(items[0].to_dict()) == items[0]
+
+
+def test_set_products_on_default_categorizer(tmp_path):
+    previous = categorizer._default._products
+    try:
+        categorizer.set_products(ProductDictionary(PRODUCTS))
+        assert categorizer.categorize_item("Orange Juce") == "beverages"
+        assert categorizer.categorize_items([{"name": "whole mllk 1l"}])[0]["canonical_name"] == "Whole Milk 1L"
+    finally:
+        categorizer.set_products(previous)
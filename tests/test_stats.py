@@ -0,0 +1,100 @@
+import math
+import random
+import statistics
+
+from receipt_analyzer.analyzer import analyze_items
+from receipt_analyzer.stats import DecayedRate, QuantileSketch, SpendStats, Welford, build
+
+
+def _receipt(rng, groceries=None):
+    items = [{"name": f"g{i}", "category": "groceries", "price": round(rng.uniform(2, 8), 2), "quantity": 1}
+             for i in range(rng.randint(4, 8))]
+    if groceries is not None:
+        items = [{"name": "groceries", "category": "groceries", "price": groceries, "quantity": 1}]
+    items.append({"name": "crisps", "category": "snacks", "price": round(rng.uniform(1, 3), 2), "quantity": 1})
+    return items
+
+
+def test_welford_sketch_and_rate_merge_like_one_stream():
+    rng = random.Random(0)
+    xs = [rng.lognormvariate(3, 1) for _ in range(5000)]
+    whole, a, b = Welford(), Welford(), Welford()
+    sketch, sa, sb = QuantileSketch(0.01), QuantileSketch(0.01), QuantileSketch(0.01)
+    for i, x in enumerate(xs):
+        whole.add(x)
+        sketch.add(x)
+        (a if i % 3 else b).add(x)
+        (sa if i % 3 else sb).add(x)
+    a.merge(b)
+    sa.merge(sb)
+    assert a.n == whole.n and math.isclose(a.mean, statistics.fmean(xs))
+    assert math.isclose(a.variance, statistics.variance(xs)) and math.isclose(whole.variance, a.variance)
+    assert sa.to_dict() == sketch.to_dict()
+    ordered = sorted(xs)
+    for q in (0.1, 0.5, 0.95, 0.99):
+        exact = ordered[int(q * (len(xs) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.011 * exact
+
+    r1, r2, r = DecayedRate(30), DecayedRate(30), DecayedRate(30)
+    for day in range(100):
+        r.add(10.0, day)
+        (r1 if day % 2 else r2).add(10.0, day)
+    r2.merge(r1)
+    assert math.isclose(r2.value, r.value) and math.isclose(r.rate(), r2.rate())
+    assert 5 < r.rate() < 10  # ~10/day in steady state, less while warming up
+
+
+def test_history_decides_anomalies():
+    rng = random.Random(1)
+    history = SpendStats(min_history=5)
+    for day in range(30):
+        analyze_items(_receipt(rng), history=history, when=f"2024-01-{day + 1:02d}")
+    assert history.get("default", "groceries").receipts.n == 30
+
+    # groceries are always > 40% of the receipt: normal for this user
+    usual = analyze_items(_receipt(rng), history=history, when="2024-02-01")
+    assert usual["anomalies"]["overspent_categories"] == []
+
+    big = analyze_items(_receipt(rng, groceries=400.0), history=history, when="2024-02-02")
+    (flag,) = big["anomalies"]["overspent_categories"]
+    assert flag["category"] == "groceries" and flag["basis"] == "history" and flag["typical"] < 60
+    assert [e["name"] for e in big["anomalies"]["expensive_items"]] == ["groceries"]
+
+    # another user has no history yet: the single-receipt rules apply
+    other = analyze_items(_receipt(rng), history=history, user="bob")
+    assert [f["basis"] for f in other["anomalies"]["overspent_categories"]] == ["receipt"]
+    assert set(history.summary("default")) == {"groceries", "snacks"}
+
+
+def test_parallel_build_merge_and_roundtrip(tmp_path):
+    rng = random.Random(2)
+    receipts = [(rng.choice(["ann", "bob"]), 1.7e9 + i * 86400, _receipt(rng)) for i in range(300)]
+    serial = SpendStats()
+    for user, when, items in receipts:
+        serial.update(items, user, when)
+    chunked = build(receipts, workers=0, chunk_size=70)
+    pooled = build(receipts, workers=2, chunk_size=100)
+    path = tmp_path / "stats.json"
+    pooled.save(str(path))
+    loaded = SpendStats.load(str(path))
+    for stats in (chunked, pooled, loaded):
+        assert set(stats.stats) == set(serial.stats)
+        for key, s in serial.stats.items():
+            other = stats.stats[key]
+            assert other.receipts.n == s.receipts.n and math.isclose(other.receipts.mean, s.receipts.mean)
+            assert math.isclose(other.items.variance, s.items.variance)
+            assert other.item_sketch.to_dict() == s.item_sketch.to_dict()
+            assert math.isclose(other.spend_rate.value, s.spend_rate.value)
+            assert other.visit_rate.t == s.visit_rate.t
+
+
+def test_fixed_rule_uses_unrounded_percentages():
+    # 40.04% rounds to 40.0 but is still over the 40% rule
+    items = [{"name": "steak", "category": "meat", "price": 40.04, "quantity": 1},
+             {"name": "bread", "category": "bakery", "price": 30.0, "quantity": 1},
+             {"name": "cola", "category": "beverages", "price": 29.96, "quantity": 1}]
+    plain = analyze_items(items)
+    assert plain["category_percent"]["meat"] == 40.0
+    judged = analyze_items(items, history=SpendStats())
+    assert [f["category"] for f in plain["anomalies"]["overspent_categories"]] == ["meat"]
+    assert [f["category"] for f in judged["anomalies"]["overspent_categories"]] == ["meat"]
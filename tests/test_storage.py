@@ -0,0 +1,26 @@
+from receipt_analyzer.analyzer import analyze_items
+from receipt_analyzer.storage import ReceiptStore
+
+
+def _record(date, items):
+    return {"items": items, "analysis": analyze_items(items), "date": date, "file": "r.jpg"}
+
+
+def test_aggregates_maintained_on_insert():
+    milk = {"name": "Milk  2L", "quantity": 1, "price": 3.5, "line_total": 3.5, "category": "groceries"}
+    chips = {"name": "Chips", "quantity": 2, "price": 1.25, "line_total": 2.5, "category": "snacks"}
+    with ReceiptStore() as store:
+        ids = store.add_receipts([
+            _record("2025-09-03", [milk, chips]),
+            _record("2026-02-10", [milk, milk]),
+            {"file": "bad.jpg", "error": "boom"},
+        ])
+        store.add_receipt([chips], analyze_items([chips]), receipt_date="2026-03-01")
+        assert len(ids) == 2
+        assert store.spend_by_category() == {"groceries": 10.5, "snacks": 5.0}
+        assert store.spend_by_category_last_months(6, today="2026-03-15") == {"groceries": 7.0, "snacks": 2.5}
+        assert store.monthly_totals("groceries") == [("2025-09", 3.5), ("2026-02", 7.0)]
+        assert [r[0] for r in store.item_history("milk 2l")] == ["2025-09-03", "2026-02-10", "2026-02-10"]
+        row = store.conn.execute("SELECT item_count, receipt_count FROM category_period_totals "
+                                 "WHERE period = '2026-02' AND category = 'groceries'").fetchone()
+        assert row == (2, 1)
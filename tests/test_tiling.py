@@ -0,0 +1,67 @@
+import numpy as np
+
+from receipt_analyzer import ocr, tiling
+from receipt_analyzer.ocr import OCRResult, OCRWord
+
+
+def test_split_strips_cover_the_image_with_overlap():
+    strips = tiling.split_strips(8000, 1600, 128)
+    assert strips[0][0] == 0 and strips[-1][1] == 8000
+    assert all(b - a <= 1600 for a, b in strips)
+    assert all(prev[1] - nxt[0] >= 128 for prev, nxt in zip(strips, strips[1:]))
+    assert tiling.split_strips(900, 1600, 128) == [(0, 900)]
+
+
+def _bars_recognizer(images, details, cascade=None):
+    """Fake engine: every dark horizontal bar is a word; its width encodes the line number."""
+    out = []
+    for img in images:
+        dark = np.asarray(img) < 128
+        rows = np.flatnonzero(dark.any(axis=1))
+        words = []
+        if rows.size:
+            runs = np.split(rows, np.flatnonzero(np.diff(rows) > 1) + 1)
+            for run in runs:
+                cols = np.flatnonzero(dark[run[0]:run[-1] + 1].any(axis=0))
+                words.append(OCRWord(f"L{(cols.size - 20) // 10:02d}", 90.0, int(cols[0]), int(run[0]),
+                                     int(cols.size), int(run.size)))
+        out.append(OCRResult("\n".join(w.text for w in words), words, "easyocr"))
+    return out
+
+
+def test_tiled_ocr_keeps_each_line_once_in_order(monkeypatch):
+    img = np.full((6000, 900), 255, dtype=np.uint8)
+    for k in range(60):
+        top = 40 + k * 98
+        img[top:top + 30, 50:50 + 20 + 10 * k] = 0
+    monkeypatch.setattr(ocr, "preprocess_image", lambda image, preset=None: image)
+    monkeypatch.setattr(ocr, "_recognize_batch", _bars_recognizer)
+
+    cfg = tiling.TileConfig(strip_height=1000, overlap=100, workers=3)
+    assert tiling.should_tile(tiling.image_size(img), cfg)
+    res = tiling.ocr_tiled(img, cfg)
+    assert res.text.splitlines() == [f"L{k:02d}" for k in range(60)]
+    assert [w.top for w in res.words] == [40 + k * 98 for k in range(60)]
+
+
+def test_easyocr_reads_all_strips_in_one_batch(monkeypatch):
+    img = np.full((6000, 900), 255, dtype=np.uint8)
+    for k in range(60):
+        img[40 + k * 98:70 + k * 98, 50:70 + 10 * k] = 0
+    calls = []
+
+    def recognizer(images, details, cascade=None):
+        calls.append(len(images))
+        return _bars_recognizer(images, details, cascade)
+
+    monkeypatch.setattr(ocr, "preprocess_image", lambda image, preset=None: image)
+    monkeypatch.setattr(ocr, "_recognize_batch", recognizer)
+    monkeypatch.setattr(ocr, "_has_easyocr", lambda: True)
+    res = tiling.ocr_tiled(img, tiling.TileConfig(strip_height=1000, overlap=100, workers=3))
+    assert calls == [len(tiling.split_strips(6000, 1000, 100))]
+    assert res.text.splitlines() == [f"L{k:02d}" for k in range(60)]
+
+
+def test_stitch_texts_without_boxes_drops_repeated_lines():
+    assert tiling.stitch_texts(["Milk 3.50\nBread 2.00", "bread  2.00\nEggs 4.10", "Tea 1.00"]) == \
+        "Milk 3.50\nBread 2.00\nEggs 4.10\nTea 1.00"